@@ -1,8 +1,8 @@
 # -*- coding: mbcs -*-
+import array
 import logging
 import struct
 from NTFStools.Commons import *
-from NTFStools.DiskFile import DiskFile
 
 """
 Nota sulle prestazioni
@@ -34,8 +34,9 @@ Egualmente, assegnare un DiskFile a ogni oggetto Chain.
 class FAT(object):
 	"Decodifica una FAT (12, 16, 32 o EX) dal disco"
 	def __init__ (self, stream, offset, clusters, bitsize=32, exfat=0):
-		# Crea uno stream autonomo, con propria cache
-		self.stream = DiskFile(stream._file.name, stream._file.mode)
+		# Crea uno stream autonomo, con propria cache (ma lo stesso handle del disco)
+		self.stream = stream.dup(cache='lru')
+		self.stream.tag = 'fat' # per la strumentazione dell'I/O
 		self.offset = offset # offset iniziale della FAT in esso
 		self.size = clusters # numero di cluster (=slot della FAT)
 		self.bits = bitsize # bit dello slot (12, 16 o 32)
@@ -56,12 +57,11 @@ class FAT(object):
 				self.last |= 0xF0000000
 				
 	def __getitem__ (self, index):
-		self.stream.seek(self.offset+(index*self.bits)/8)
 		if self.bits == 32:
 			n, fmt = 4, '<I'
 		else:
 			n, fmt = 2, '<H'
-		slot = struct.unpack(fmt, self.stream.read(n))[0]
+		slot = struct.unpack(fmt, self.stream.read_at(self.offset+(index*self.bits)/8, n))[0]
 		if self.bits == 12:
 			# Ricava i 12 bit di interesse
 			if index % 2: # indice dispari
@@ -96,6 +96,7 @@ class Chain(object):
 		self.size = size # dimensione della catena, se disponibile
 		self.nofat = nofat # privo di catena FAT (=contiguo)
 		self.pos = 0 # virtual stream linear pos
+		self.offset = 0 # posizione assoluta sul disco corrispondente a pos
 		# Virtual Cluster Number (indice del cluster nella catena)
 		self.vcn = -1
 		# Virtual Cluster Offset (posizione nel VCN)
@@ -167,7 +168,7 @@ class Chain(object):
 			if self.fat.islast(cluster):
 				self.vcn = -1
 		#~ logging.debug("prossimo cluster: VCN=%d, LCN=%Xh [%Xh:] @%Xh", self.vcn, cluster, self.vco, self.boot.cl2offset(cluster))
-		self.stream.seek(self.boot.cl2offset(cluster)+self.vco)
+		self.offset = self.boot.cl2offset(cluster)+self.vco
 
 	def read(self, size=-1):
 		#~ logging.debug("chiesti %d byte dalla posizione %Xh", size, self.pos)
@@ -183,17 +184,23 @@ class Chain(object):
 		if self.nofat: # i cluster sono tutti contigui
 			if not size or self.vcn == -1:
 				return buf
-			buf += self.stream.read(size)
+			buf += self.stream.read_at(self.offset, size)
 			self.pos += size
 			#~ logging.debug("letti %d byte contigui, VCN=%Xh[%Xh:]", len(buf), self.vcn, self.vco)
 			return buf
+		extents = [] # segmenti contigui da leggere
 		while 1:
 			if not size or self.vcn == -1:
 				break
 			n = min(size, self.maxrun4len(size))
-			buf += self.stream.read(n)
+			extents += [(self.offset, n)]
 			size -= n
 			self.pos += n
 			self.seek(self.pos)
+		if len(extents) == 1:
+			buf += self.stream.read_at(*extents[0])
+		else: # una lettura per gruppo di segmenti vicini
+			for view in self.stream.read_extents(extents):
+				buf.fromstring(view)
 		#~ logging.debug("letti %d byte, VCN=%Xh[%Xh:]", len(buf), self.vcn, self.vco)
 		return buf
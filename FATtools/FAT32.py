@@ -6,6 +6,7 @@ import time
 from FAT import *
 from NTFStools.Commons import *
 from NTFStools.DiskFile import DiskFile
+from NTFStools.IOStats import iotag
 
 
 class Boot(object):
@@ -41,18 +42,16 @@ class Boot(object):
 	0x52: ('sFSType', '8s'),
 	0x72: ('chBootstrapCode', '390s'),
 	0x1FE: ('wBootSignature', '<H') } # Size = 0x100 (512 byte)
+	_layout = compile_layout(layout)
 	
 	def __init__ (self, diskstream, offset=0):
 		self._i = 0
 		self._pos = diskstream.tell() # posizione iniziale
+		iotag(diskstream, 'boot')
 		self._buf = diskstream.read(512) # dimensione standard del settore di avvio
 		self.stream = diskstream
 		if len(self._buf) != 512:
 			raise EndOfStream
-		self._kv = self.layout.copy()
-		self._vk = {} # { nome: offset}
-		for k, v in self._kv.items():
-			self._vk[v[0]] = k
 		# Dimensione del cluster in byte
 		self.cluster = self.wBytesPerSector * self.uchSectorsPerCluster
 		# Offset della prima FAT
@@ -93,6 +92,7 @@ class DirEntry(object):
 	0x18: ('wMDate', '<H'),
 	0x1A: ('wClusterLo', '<H'),
 	0x1C: ('dwFileSize', '<I') }
+	_layout = compile_layout(layout)
 
 	layout_lfn = { # { offset: (nome, stringa di unpack) }
 	0x00: ('chSeqNumber', 'B'), # n di slot LFN
@@ -103,10 +103,12 @@ class DirEntry(object):
 	0x0E: ('sName6', '12s'),
 	0x1A: ('wClusterLo', '<H'), # sempre 0
 	0x1C: ('sName2', '4s') }
+	_layout_lfn = compile_layout(layout_lfn)
 
 	def __init__ (self, stream):
 		self._i = 0
 		self._pos = stream.tell() # posizione iniziale
+		iotag(stream, 'dirslot')
 		self._buf = stream.read(32) # dimensione standard dello slot
 		self.stream = stream
 		self.LFN = '' # eventuale Long File Name (255 car. max)
@@ -114,13 +116,9 @@ class DirEntry(object):
 			raise EndOfStream
 		if self._islfn():
 			self.islfn = 1
-			self._kv = self.layout_lfn.copy()
+			self._layout = self._layout_lfn
 		else:
 			self.islfn = 0
-			self._kv = self.layout.copy()
-		self._vk = {} # { nome: offset}
-		for k, v in self._kv.items():
-			self._vk[v[0]] = k
 		if self._buf[0] == '\xE5':
 			self.deleted = 1
 		else:
@@ -202,6 +200,7 @@ def fat_recover_slot(boot, fat, slot, destdir=''):
 	# Apre la catena sorgente come file
 	chain = Chain(boot, fat, slot.Start, size=slot.Size)
 	out = open(dest, 'wb')
+	iotag(chain, 'data')
 	buf = 1
 	while buf:
 		buf = chain.read(boot.cluster)
@@ -300,6 +299,7 @@ if __name__ == '__main__':
 		name = slot.LongName or slot.ShortName
 		md = md5.new()
 		chain = Chain(boot, fat, slot.Start, size=slot.Size)
+		iotag(chain, 'data')
 		buf = 1
 		while buf:
 			buf = chain.read(32*(1<<20))
@@ -324,11 +324,13 @@ if __name__ == '__main__':
 	start = datetime.now()
 	
 	disk = DiskFile('\\\\.\\z:', 'rb')
+	stats = disk.enable_stats()
 	boot = Boot(disk)
 	fat = FAT(disk, boot.fatoffs, boot.fatsize)
 	fat_traverse_tree(boot, fat, boot.dwRootCluster, '.', test=lambda x: 1, action=action)
 
 	disk.cache.print_stats()
+	stats.dump('FAT32.json', disk)
 
 	print "Durata dell'esecuzione:", datetime.now() - start
 
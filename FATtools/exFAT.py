@@ -7,6 +7,7 @@ import time
 from FAT import *
 from NTFStools.Commons import *
 from NTFStools.DiskFile import DiskFile
+from NTFStools.IOStats import iotag
 
 class Boot(object):
 	"Settore di avvio exFAT"
@@ -33,18 +34,16 @@ class Boot(object):
 	0x71: ('chReserved', '7s'),
 	0x72: ('chBootstrapCode', '390s'),
 	0x1FE: ('wBootSignature', '<H') } # Size = 0x100 (512 byte)
+	_layout = compile_layout(layout)
 	
 	def __init__ (self, diskstream, offset=0):
 		self._i = 0
 		self._pos = diskstream.tell() # posizione iniziale
+		iotag(diskstream, 'boot')
 		self._buf = diskstream.read(512) # dimensione standard del settore di avvio
 		self.stream = diskstream
 		if len(self._buf) != 512:
 			raise EndOfStream
-		self._kv = self.layout.copy()
-		self._vk = {} # { nome: offset}
-		for k, v in self._kv.items():
-			self._vk[v[0]] = k
 		# Dimensione del cluster in byte
 		self.cluster = (1 << self.uchBytesPerSector) * (1 << self.uchSectorsPerCluster)
 		# Offset della prima FAT
@@ -150,6 +149,7 @@ class DirEntry(object):
 	def __init__ (self, stream):
 		self._i = 0
 		self._pos = stream.tell() # posizione iniziale
+		iotag(stream, 'dirslot')
 		self._buf = stream.read(32) # dimensione standard dello slot
 		self.stream = stream
 		self.unused = 0
@@ -164,11 +164,8 @@ class DirEntry(object):
 			self.unused = 1
 			typ = 0
 			logging.warning("Tipo di slot sconosciuto: %x", typ)
-		self._kv = self.slot_types[typ][0].copy() # seleziona il tipo di slot appropriato
+		self._layout = compile_layout(self.slot_types[typ][0]) # seleziona il tipo di slot appropriato
 		self._name = self.slot_types[typ][1]
-		self._vk = {} # { nome: offset}
-		for k, v in self._kv.items():
-			self._vk[v[0]] = k
 		logging.debug("Decodificata %s", self)
 
 	__getattr__ = common_getattr
@@ -221,6 +218,7 @@ def fat_recover_slot(boot, fat, slot, destdir=''):
 	chain = Chain(boot, fat, slot.Start, size=slot.Size, nofat=slot.NoFAT)
 	dest = os.path.join(destdir, slot.Parent, slot.Name)
 	out = open(dest, 'wb')
+	iotag(chain, 'data')
 	buf = 1
 	while buf:
 		buf = chain.read(boot.cluster)
@@ -291,6 +289,7 @@ if __name__ == '__main__':
 			return
 		md = md5.new()
 		chain = Chain(boot, fat, slot.Start, size=slot.Size, nofat=slot.NoFAT)
+		iotag(chain, 'data')
 		buf = 1
 		while buf:
 			buf = chain.read(32*(1<<20))
@@ -315,10 +314,12 @@ if __name__ == '__main__':
 	start = datetime.now()
 	
 	disk = DiskFile('\\\\.\\G:', 'rb')
+	stats = disk.enable_stats()
 	#~ disk = DiskFile(r'C:\Users\Public\exfat32m.img', 'rb')
 	boot = Boot(disk)
 	fat = FAT(disk, boot.fatoffs, boot.fatsize, exfat=1)
 	fat_traverse_tree(boot, fat, boot.dwRootCluster, '.', test=lambda x: 1, action=action)
 	disk.cache.print_stats()
+	stats.dump('exFAT.json', disk)
 
 	print "Durata dell'esecuzione:", datetime.now() - start
\ No newline at end of file
@@ -5,6 +5,7 @@ import StringIO
 import struct
 from Commons import *
 from DatarunStream import *
+from LZNT1 import *
 
 __all__ = ['Attribute', 'Standard_Information', 'Attribute_List', 'File_Name', 'Data',
 'Index_Root', 'Index_Allocation', 'Bitmap', 'attributes_by_id', 'attributes_by_name']
@@ -23,6 +24,26 @@ attributes_by_id ={
 attributes_by_name = {}
 for id, name in attributes_by_id.items(): attributes_by_name[name] = id
 
+
+def content_getattr(c, name):
+	"""Come common_getattr, ma decodifica i datarun (dataruns) e crea lo stream del
+	contenuto (file) soltanto al primo accesso"""
+	if name == 'dataruns' and c.uchNonResFlag:
+		c.decode()
+		return c.dataruns
+	if name == 'file':
+		if c.uchNonResFlag and c.wFlags & 0x0001 and c.wCompressionSize: # compresso
+			unitsize = c.dataruns.clustersize << c.wCompressionSize
+			c.file = CompressedStream(c.dataruns, c.u64RealSize, c._parent._disk, unitsize)
+		elif c.uchNonResFlag:
+			c.file = DatarunStream(c.dataruns, c.u64RealSize, c._parent._disk)
+		else:
+			i = c._i + c.wAttrOffset
+			c.file = StringIO.StringIO(c._buf[i: i+c.dwLength].tostring())
+			logging.debug("resident %s @%x", attributes_by_id.get(c.dwType), i)
+		return c.file
+	return common_getattr(c, name)
+
 class Attribute(object):
 	layout = {
 	0x00: ('dwType', '<I'),
@@ -48,22 +69,19 @@ class Attribute(object):
 	0x28: ('u64AllocSize', '<Q'),
 	0x30: ('u64RealSize', '<Q'),
 	0x38: ('u64StreamSize', '<Q') } # Size = 0x40 (64) byte totali
+
+	_layout_resident = compile_layout(layout, layout_resident)
+	_layout_nonresident = compile_layout(layout, layout_nonresident)
 	
 	def __init__(self, parent, offset):
 		self._parent = parent # classe Record contenente
 		self._buf = parent._buf
 		self._i = offset # posizione iniziale
-		self._kv = Attribute.layout.copy()
-		self._vk = {}
-		for k, v in self._kv.items():
-			self._vk[v[0]] = k
-		if self.uchNonResFlag:
-			upd = Attribute.layout_nonresident
+		# Il flag di contenuto non residente (a 0x08) determina il layout completo
+		if ord(self._buf[offset+8]):
+			self._layout = Attribute._layout_nonresident
 		else:
-			upd = Attribute.layout_resident
-		self._kv.update(upd)
-		for k, v in upd.items():
-			self._vk[v[0]] = k
+			self._layout = Attribute._layout_resident
 
 	__getattr__ = common_getattr
 
@@ -98,7 +116,7 @@ class Standard_Information(Attribute):
 		L1 = class2str(self, "$STANDARD_INFORMATION @%x\n" % self._i).split('\n')
 		L2 = []
 		for key in (0x18, 0x20, 0x28, 0x30):
-			o = self._kv[key][0]
+			o = self._layout.kv[key][0]
 			v = getattr(self, o)
 			v = nt2uxtime(v)
 			L2 += ['%x: %s = %s' % (key, o, v)]
@@ -149,7 +167,7 @@ class File_Name(Attribute):
 		L1 = class2str(self, "$FILE_NAME @%x\n" % self._i).split('\n')
 		L2 = []
 		for key in (0x20, 0x28, 0x30, 0x38):
-			o = self._kv[key][0]
+			o = self._layout.kv[key][0]
 			v = getattr(self, o)
 			v = nt2uxtime(v)
 			L2 += ['%x: %s = %s' % (key, o, v)]
@@ -163,16 +181,8 @@ class Data(Attribute):
 	def __init__(self, parent, offset):
 		Attribute.__init__(self, parent, offset)
 		common_update_and_swap(self)
-		if self.uchNonResFlag:
-			self.decode() # differire all'uso effettivo dello stream?
-			self.file = DatarunStream(self.dataruns, self.u64RealSize, self._parent._disk)
-		else:
-			i = self._i + self.wAttrOffset
-			self.file = StringIO.StringIO(self._buf[i: i+self.dwLength].tostring())
-			logging.debug("resident $DATA @%x", i)
-		
 
-	__getattr__ = common_getattr
+	__getattr__ = content_getattr
 
 	def __str__ (self):
 		return class2str(self, "$DATA @%x\n" % self._i)
@@ -191,16 +201,8 @@ class Index_Root(Attribute):
 	def __init__(self, parent, offset):
 		Attribute.__init__(self, parent, offset)
 		common_update_and_swap(self)
-		if self.uchNonResFlag:
-			self.decode()
-			self.file = DatarunStream(self.dataruns, self.u64RealSize, self._parent._disk)
-		else:
-			#~ i = self._i + 40 + self.uchNameLength*2
-			i = self._i + self.wAttrOffset
-			self.file = StringIO.StringIO(self._buf[i: i+self.dwLength].tostring())
-			logging.debug("resident $INDEX_ROOT @%x", i)
 
-	__getattr__ = common_getattr
+	__getattr__ = content_getattr
 
 	def __str__ (self):
 		return class2str(self, "$INDEX_ROOT @%x\n" % self._i)
@@ -214,16 +216,8 @@ class Index_Allocation(Attribute):
 	def __init__(self, parent, offset):
 		Attribute.__init__(self, parent, offset)
 		common_update_and_swap(self)
-		if self.uchNonResFlag:
-			self.decode()
-			self.file = DatarunStream(self.dataruns, self.u64RealSize, self._parent._disk)
-		else:
-			#~ i = self._i + 24 + self.uchNameLength*2
-			i = self._i + self.wAttrOffset
-			self.file = StringIO.StringIO(self._buf[i: i+self.dwLength].tostring())
-			logging.debug("resident $INDEX_ALLOCATION @%x", i)
 
-	__getattr__ = common_getattr
+	__getattr__ = content_getattr
 
 	def __str__ (self):
 		return class2str(self, "$INDEX_ALLOCATION @%x\n" % self._i)
@@ -242,16 +236,8 @@ class Bitmap(Attribute):
 	def __init__(self, parent, offset):
 		Attribute.__init__(self, parent, offset)
 		common_update_and_swap(self)
-		if self.uchNonResFlag:
-			self.decode()
-			self.file = DatarunStream(self.dataruns, self.u64RealSize, self._parent._disk)
-		else:
-			#~ i = self._i + 24 + self.uchNameLength*2
-			i = self._i + self.wAttrOffset
-			self.file = StringIO.StringIO(self._buf[i: i+self.dwLength].tostring())
-			logging.debug("resident $BITMAP @%x", i)
 
-	__getattr__ = common_getattr
+	__getattr__ = content_getattr
 
 	def __str__ (self):
 		return class2str(self, "$BITMAP @%x\n" % self._i)
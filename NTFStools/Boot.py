@@ -1,5 +1,6 @@
 # -*- coding: mbcs -*-
 from NTFStools.Commons import *
+from NTFStools.IOStats import iotag
 
 class Bootsector(object):
 	layout = { # { offset: (nome, stringa di unpack) }
@@ -27,17 +28,15 @@ class Bootsector(object):
 	0x50: ('dwChecksum', '<I'),
 	0x54: ('chBootstrapCode', '426s'),
 	0x1FE: ('wSecMark', '<H') } # Size = 0x100 (512 byte)
+	_layout = compile_layout(layout)
 	
 	def __init__ (self, diskstream):
 		self._i = 0
 		self._pos = diskstream.tell() # posizione iniziale
+		iotag(diskstream, 'boot')
 		self._buf = diskstream.read(512) # dimensione standard del settore di avvio
 		if len(self._buf) != 512:
 			raise EndOfStream
-		self._kv = Bootsector.layout.copy()
-		self._vk = {} # { nome: offset}
-		for k, v in self._kv.items():
-			self._vk[v[0]] = k
 
 	__getattr__ = common_getattr
 		
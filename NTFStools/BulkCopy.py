@@ -0,0 +1,218 @@
+# -*- coding: mbcs -*-
+import collections
+import fnmatch
+import logging
+import os
+import sys
+from NTFStools.Commons import nt2epoch
+from NTFStools.DatarunStream import DatarunStream
+from NTFStools.Index import IndexTree
+from NTFStools.IOStats import iotag
+from NTFStools.Utilities import ntfs_open_file, ntfs_open_upcase
+
+"""
+Estrazione in blocco, in ordine fisico
+======================================
+
+Copiare migliaia di file (registri, log degli eventi, prefetch, database dei browser...) uno
+dopo l'altro con ntfs_copy_file costringe il disco a saltare di continuo da un file all'altro,
+e dentro ogni file da un frammento all'altro. ntfs_bulk_copy procede invece in due tempi:
+
+1. tutti i file richiesti sono prima risolti (v. ntfs_glob), raccogliendone i record MFT;
+2. le estensioni fisiche di tutti i file sono poi ordinate per posizione sul disco (LCN) e
+copiate in quest'ordine con DiskFile.copy_extent, ciascuna alla sua posizione nel file di
+destinazione: il disco  percorso una sola volta, dall'inizio alla fine.
+
+Un file di destinazione resta aperto finch non  completo, ma non pi di maxopen alla volta:
+uno chiuso prima  riaperto quando serve. I file residenti (il cui contenuto sta nel record
+MFT) e quelli compressi sono copiati a parte, prima degli altri. Ogni file  infine troncato
+alla sua dimensione e riceve le date di accesso e modifica di $STANDARD_INFORMATION.
+
+Un percorso  assoluto, e ogni suo elemento pu contenere caratteri jolly (*, ?, [), confrontati
+senza distinzione tra maiuscole e minuscole secondo la tabella $UpCase; una directory  copiata
+con tutto il suo contenuto, ed  creata anche se vuota. Nella destinazione, i percorsi relativi
+iniziano dal primo elemento con caratteri jolly, o dall'ultimo elemento: \\Windows\\Prefetch\\*.pf
+d X.pf, \\Users\\*\\NTUSER.DAT d Utente\\NTUSER.DAT, \\Windows\\System32\\config d config\\SYSTEM...
+"""
+
+__all__ = ['ntfs_glob', 'ntfs_bulk_copy']
+
+
+def _wild(s):
+	return '*' in s or '?' in s or '[' in s
+
+
+def _entries(record, upcase, pattern=None):
+	"""Voci di una directory, in ordine, tralasciando i nomi DOS 8.3 (se ne ha uno, un file ha
+	anche il nome lungo) e la voce '.' della radice; solo quelle che concordano con pattern,
+	se indicato, visitando nell'indice il solo tratto che precede il primo carattere jolly"""
+	if not record.find_attribute("$INDEX_ROOT"):
+		return
+	tree = IndexTree(record, upcase)
+	if pattern is None:
+		entries = tree.iterate()
+	else:
+		entries = tree.prefix(pattern[:min([pattern.find(c) for c in '*?[' if c in pattern])])
+		key = upcase.upper(pattern)
+	for e in entries:
+		if e.chfilenameNamespace == 2 or e.FileName == '.':
+			continue
+		if pattern is None or fnmatch.fnmatchcase(upcase.upper(e.FileName), key):
+			yield e
+
+
+def _child(record, e):
+	"Il record cui punta la voce e, o None se il riferimento non  pi valido"
+	child = record.next(e.u64mftReference & 0x0000FFFFFFFFFFFF)
+	if child.wSequence != e.u64mftReference >> 48 or not child.wFlags & 0x1:
+		logging.warning(u"voce <%s> non pi valida: ignorata", e.FileName)
+		return None
+	return child
+
+
+def _walk(rel, record, upcase, seen):
+	"""Genera (elementi del percorso relativo, record) di un file o di una directory e,
+	ricorsivamente, del suo contenuto"""
+	if not record.wFlags & 0x2:
+		yield rel, record
+		return
+	if record.dwMFTRecNumber in seen: # gi visitata (o un ciclo)
+		return
+	seen.add(record.dwMFTRecNumber)
+	if rel: # anche se vuota, la directory va ricreata
+		yield rel, record
+	for e in _entries(record, upcase):
+		child = _child(record, e)
+		if child:
+			for item in _walk(rel + [e.FileName], child, upcase, seen):
+				yield item
+
+
+def ntfs_glob(pattern, mft, disk, catalog=None):
+	"""Genera (percorso relativo, record) dei file che concordano con il percorso assoluto
+	pattern, dato il record $MFT (v. ntfs_open_mft); le directory sono generate anch'esse, prima
+	del loro contenuto, che  visitato ricorsivamente.
+	Se indicato, il Catalog della MFT risolve il tratto iniziale privo di caratteri jolly"""
+	if type(pattern) != type(u''):
+		pattern = pattern.decode(sys.getfilesystemencoding() or 'mbcs')
+	path = pattern.replace('\\', '/').split('/')
+	if path and len(path[0]) == 2 and path[0][1] == ':': # lettera di unit
+		del path[0]
+	path = [obj for obj in path if obj and obj != '.']
+	# Il tratto iniziale privo di caratteri jolly si risolve con il catalogo o con
+	# ntfs_open_file (e la sua cache)
+	i = 0
+	while i < len(path) and not _wild(path[i]):
+		i += 1
+	if catalog:
+		record = catalog.open(u'/' + u'/'.join(path[:i]), mft)
+	else:
+		record = ntfs_open_file(u'/'.join(path[:i]), mft._stream, disk)
+	if not record:
+		return
+	upcase = getattr(disk, 'upcase', None) or ntfs_open_upcase(record)
+	found = [(i == len(path) and path[-1:] or [], record)]
+	for obj in path[i:]:
+		matches = []
+		for rel, parent in found:
+			if _wild(obj):
+				entries = _entries(parent, upcase, obj)
+			elif parent.find_attribute("$INDEX_ROOT"):
+				entries = filter(None, [IndexTree(parent, upcase).find(obj)])
+			else:
+				entries = ()
+			for e in entries:
+				child = _child(parent, e)
+				if child:
+					matches += [(rel + [e.FileName], child)]
+		found = matches
+	seen = set()
+	for rel, record in found:
+		for rel, record in _walk(rel, record, upcase, seen):
+			yield os.path.join(*rel), record
+
+
+def ntfs_bulk_copy(files, destdir, times=1, maxopen=64):
+	"""Copia nella directory destdir i file indicati da coppie (percorso relativo, record MFT),
+	come quelle di ntfs_glob, leggendone le estensioni in ordine fisico, e vi crea le directory
+	indicate; se times, assegna le date di $STANDARD_INFORMATION. Restituisce il numero di file
+	e di byte copiati"""
+	jobs = [] # (destinazione, record, stream, dimensione)
+	known = set() # destinazioni, come le confronta il sistema (es. senza maiuscole in Windows)
+	for relpath, record in files:
+		dst = os.path.join(destdir, relpath)
+		if record.wFlags & 0x2:
+			if not os.path.isdir(dst):
+				os.makedirs(dst)
+			continue
+		if os.path.normcase(dst) in known:
+			logging.warning(u"%s: destinazione gi in uso (collegamento, percorso ripetuto o maiuscole diverse), ignorato", relpath)
+			continue
+		data = [a for a in record.find_attribute("$DATA") or () if not a.uchNameLength]
+		if not data:
+			logging.warning("%s: $DATA mancante, ignorato", relpath)
+			continue
+		known.add(os.path.normcase(dst))
+		if data[0].uchNonResFlag:
+			size = data[0].u64RealSize
+		else:
+			size = data[0].dwLength
+		jobs += [(dst, record, data[0].file, size)]
+		parent = os.path.dirname(dst)
+		if parent and not os.path.isdir(parent):
+			os.makedirs(parent)
+
+	def finish(k, outstream):
+		dst, record, stream, size = jobs[k]
+		outstream.truncate(size) # se il file termina con un tratto sparso
+		outstream.close()
+		si = record.find_attribute("$STANDARD_INFORMATION")
+		if times and si:
+			os.utime(dst, (nt2epoch(si[0].u64ATime), nt2epoch(si[0].u64MTime)))
+
+	# I file residenti e compressi sono copiati subito; degli altri si annotano le estensioni
+	extents = [] # (offset sul disco, lunghezza, file, posizione nel file)
+	todo = {} # { file: byte ancora da copiare }
+	copied = 0
+	for k, (dst, record, stream, size) in enumerate(jobs):
+		if isinstance(stream, DatarunStream):
+			pos = 0
+			for offset, length in stream.extents(0, stream.size):
+				if offset is not None:
+					extents += [(offset, length, k, pos)]
+					todo[k] = todo.get(k, 0) + length
+				pos += length
+			if k in todo:
+				continue
+		outstream = open(dst, 'wb')
+		if hasattr(stream, 'copy_to'):
+			iotag(stream, 'data')
+			stream.copy_to(outstream)
+		else:
+			stream.seek(0)
+			outstream.write(stream.read())
+		copied += size
+		finish(k, outstream)
+
+	# Un solo passaggio sul disco, in ordine di posizione
+	extents.sort()
+	handles = collections.OrderedDict() # file aperti, dal meno recente
+	created = set()
+	for offset, length, k, pos in extents:
+		outstream = handles.pop(k, None)
+		if not outstream:
+			if len(handles) >= maxopen:
+				handles.popitem(last=False)[1].close()
+			outstream = open(jobs[k][0], k in created and 'r+b' or 'wb')
+			created.add(k)
+		handles[k] = outstream
+		stream = jobs[k][2]
+		iotag(stream, 'data')
+		outstream.seek(pos)
+		if stream._disk.copy_extent(offset, length, outstream) < length:
+			raise EOFError("estensione @%x oltre la fine del disco" % offset)
+		todo[k] -= length
+		if not todo[k]: # file completo
+			copied += jobs[k][3]
+			finish(k, handles.pop(k))
+	return len(jobs), copied
@@ -0,0 +1,188 @@
+# -*- coding: mbcs -*-
+from NTFStools.Record import Record
+try:
+	import numpy
+except ImportError: # modulo esterno, facoltativo
+	numpy = None
+
+"""
+Decodifica vettoriale della MFT
+===============================
+
+Per un'analisi preliminare bastano pochi campi di ogni record MFT: l'intestazione, le date
+di $STANDARD_INFORMATION, genitore, nome e dimensione dal $FILE_NAME, e se il $DATA 
+residente. Anzich decodificare un Record alla volta, mft_decode tratta un intero blocco di
+record (qualche MiB della $MFT) con poche operazioni di NumPy:
+
+- il fixup  verificato e applicato a tutti i record insieme;
+- i campi dell'intestazione sono letti con un dtype strutturato ricavato da Record.layout;
+- gli attributi sono percorsi in parallelo in tutti i record: a ogni passo si legge tipo e
+lunghezza dell'attributo corrente di ciascuno, finch tutti non incontrano la fine (0xFFFFFFFF).
+
+Il risultato  un dizionario di colonne (array NumPy), una riga per record:
+
+	recno		numero del record
+	valid		record FILE con fixup corretto
+	flags		wFlags (1=in uso, 2=directory)
+	sequence	numero di sequenza
+	base		record base (per i record di estensione; 0 altrimenti)
+	si_ctime, si_atime, si_mtime, si_rtime	date NT di $STANDARD_INFORMATION
+	si_perm		permessi DOS
+	parent		record della directory genitrice
+	parent_sequence	sequenza del record genitore annotata nel riferimento
+	namespace	spazio dei nomi del $FILE_NAME scelto
+	name		nome (Unicode), preferendo i nomi Win32 a POSIX e DOS
+	size		dimensione reale, dal $DATA senza nome (o dal $FILE_NAME se manca)
+	resident	il $DATA senza nome  residente
+
+Le colonne mancanti in un record (ad esempio in un record di estensione, o un record libero)
+restano a zero. I record di pi di 1 KiB, o con nomi in coppie surrogate UTF-16, sono
+comunque decodificati: le coppie restano per divise in due caratteri.
+"""
+
+__all__ = ['mft_decode', 'mft_decode_stream', 'layout_dtype']
+
+# Formati di struct e corrispondenti tipi di NumPy
+_dtypes = {'B': 'u1', '<H': '<u2', '<I': '<u4', '<Q': '<u8'}
+
+# Preferenza tra gli spazi dei nomi del $FILE_NAME: POSIX=0, Win32=1, DOS=2, Win32&DOS=3
+_nsrank = (2, 3, 1, 3)
+
+
+def layout_dtype(layout, itemsize):
+	"dtype strutturato di NumPy equivalente a una tabella di layout { offset: (nome, formato) }"
+	names, formats, offsets = [], [], []
+	for k in sorted(layout):
+		name, fmt = layout[k]
+		names += [name]
+		formats += [_dtypes.get(fmt) or 'S' + (fmt[:-1] or '1')]
+		offsets += [k]
+	return numpy.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': itemsize})
+
+
+def _gather(a, rows, offsets, n):
+	"Legge in ogni riga di a un intero little-endian di n byte, all'offset indicato per quella riga"
+	idx = numpy.clip(offsets[:, None] + numpy.arange(n), 0, a.shape[1] - 1)
+	b = a[rows[:, None], idx].astype(numpy.uint64)
+	return (b << (numpy.arange(n, dtype=numpy.uint64) * numpy.uint64(8))).sum(axis=1, dtype=numpy.uint64)
+
+
+def _fixup(a, header, recsize):
+	"Verifica e applica il fixup a tutti i record; restituisce la maschera dei record validi"
+	rows = numpy.arange(len(a))
+	valid = header['fileSignature'] == 'FILE'
+	usa = numpy.clip(header['wUSAOffset'].astype(numpy.intp), 0, recsize - 2)
+	sectors = recsize / 512
+	valid &= header['wUSASize'] == sectors + 1
+	pattern = a[rows, usa], a[rows, usa + 1]
+	for k in range(1, sectors + 1):
+		end = k*512 - 2 # ultima WORD del settore
+		valid &= (a[:, end] == pattern[0]) & (a[:, end+1] == pattern[1])
+	ok = rows[valid]
+	for k in range(1, sectors + 1):
+		end = k*512 - 2
+		src = numpy.clip(usa[ok] + 2*k, 0, recsize - 2)
+		a[ok, end] = a[ok, src]
+		a[ok, end+1] = a[ok, src + 1]
+	return valid
+
+
+def mft_decode(buf, first=0, recsize=1024):
+	"""Decodifica un blocco di record MFT consecutivi (stringa o buffer), il primo dei quali
+	 il numero first; restituisce il dizionario di colonne descritto sopra"""
+	if not numpy:
+		raise ImportError("modulo numpy non disponibile")
+	n = len(buf) / recsize
+	a = numpy.frombuffer(buf, numpy.uint8, n*recsize).reshape(n, recsize).copy()
+	header = a.reshape(-1).view(layout_dtype(Record.layout, recsize))
+	valid = _fixup(a, header, recsize)
+	used = valid & (header['wFlags'] & 1 != 0)
+
+	u64 = lambda: numpy.zeros(n, numpy.uint64)
+	cols = {'recno': numpy.arange(first, first + n, dtype=numpy.uint64), 'valid': valid,
+	'flags': header['wFlags'].copy(), 'sequence': header['wSequence'].copy(),
+	'base': header['u64BaseMftRec'] & numpy.uint64(0x0000FFFFFFFFFFFF),
+	'si_ctime': u64(), 'si_atime': u64(), 'si_mtime': u64(), 'si_rtime': u64(),
+	'si_perm': numpy.zeros(n, numpy.uint32), 'parent': u64(), 'parent_sequence': numpy.zeros(n, numpy.uint16),
+	'namespace': numpy.zeros(n, numpy.uint8),
+	'size': u64(), 'resident': numpy.zeros(n, bool)}
+	fnrank = numpy.zeros(n, numpy.int8) # preferenza del $FILE_NAME scelto (0=nessuno)
+	fnoff = numpy.zeros(n, numpy.intp) # posizione del suo contenuto
+	fnsize = u64()
+	hasdata = numpy.zeros(n, bool)
+
+	# Percorre gli attributi di tutti i record in uso, un attributo per passo
+	rows = numpy.arange(n)[used]
+	pos = header['wAttribOffset'][used].astype(numpy.intp)
+	while len(rows):
+		typ = _gather(a, rows, pos, 4)
+		length = _gather(a, rows, pos + 4, 4).astype(numpy.intp)
+		alive = (typ != 0xFFFFFFFF) & (length >= 24) & (pos + length <= recsize - 8)
+		rows, pos, typ, length = rows[alive], pos[alive], typ[alive], length[alive]
+		nonres = a[rows, numpy.clip(pos + 8, 0, recsize - 1)] != 0
+		content = pos + _gather(a, rows, pos + 0x14, 2).astype(numpy.intp) # contenuto residente
+
+		sel = (typ == 0x10) & ~nonres # $STANDARD_INFORMATION
+		r, c = rows[sel], content[sel]
+		for i, col in enumerate(('si_ctime', 'si_atime', 'si_mtime', 'si_rtime')):
+			cols[col][r] = _gather(a, r, c + 8*i, 8)
+		cols['si_perm'][r] = _gather(a, r, c + 0x20, 4)
+
+		sel = (typ == 0x30) & ~nonres # $FILE_NAME: il pi appropriato tra quelli presenti
+		r, c = rows[sel], content[sel]
+		ns = a[r, numpy.clip(c + 0x41, 0, recsize - 1)]
+		rank = numpy.take(_nsrank, ns & 3).astype(numpy.int8)
+		better = rank > fnrank[r]
+		r, c, ns, rank = r[better], c[better], ns[better], rank[better]
+		fnrank[r] = rank
+		fnoff[r] = c
+		cols['namespace'][r] = ns
+		cols['parent'][r] = _gather(a, r, c, 8) & numpy.uint64(0x0000FFFFFFFFFFFF)
+		cols['parent_sequence'][r] = _gather(a, r, c + 6, 2)
+		fnsize[r] = _gather(a, r, c + 0x30, 8)
+
+		# $DATA senza nome, primo (o unico) segmento
+		sel = (typ == 0x80) & (a[rows, numpy.clip(pos + 9, 0, recsize - 1)] == 0)
+		sel &= ~nonres | (_gather(a, rows, pos + 0x10, 8) == 0)
+		sel &= ~hasdata[rows]
+		r, p, res = rows[sel], pos[sel], ~nonres[sel]
+		hasdata[r] = True
+		cols['resident'][r] = res
+		cols['size'][r] = numpy.where(res, _gather(a, r, p + 0x10, 4), _gather(a, r, p + 0x30, 8))
+
+		pos = pos + length
+
+	# Senza $DATA (es. directory) vale la dimensione annotata nel $FILE_NAME
+	cols['size'] = numpy.where(hasdata, cols['size'], fnsize)
+
+	# Nomi: i caratteri UTF-16 (u2) di tutti i record, estesi a u4, sono una stringa Unicode U
+	r = numpy.arange(n)[fnrank > 0]
+	namelen = a[r, numpy.clip(fnoff[r] + 0x40, 0, recsize - 1)]
+	chars = numpy.zeros((n, 255), numpy.uint32)
+	if len(r):
+		idx = numpy.clip(fnoff[r, None] + 0x42 + 2*numpy.arange(255), 0, recsize - 2)
+		u2 = a[r[:, None], idx].astype(numpy.uint32) | (a[r[:, None], idx + 1].astype(numpy.uint32) << 8)
+		u2[numpy.arange(255) >= namelen[:, None]] = 0
+		chars[r] = u2
+	cols['name'] = chars.view('U255').reshape(n)
+	return cols
+
+
+def mft_decode_stream(mftstream, chunksize=4<<20, recsize=1024):
+	"""Decodifica l'intera $MFT (lo stream del suo $DATA) a blocchi di chunksize byte,
+	restituendo le colonne di tutti i record"""
+	if not numpy:
+		raise ImportError("modulo numpy non disponibile")
+	chunksize -= chunksize % recsize
+	parts = []
+	first = 0
+	mftstream.seek(0)
+	while 1:
+		buf = mftstream.read(chunksize)
+		if len(buf) < recsize:
+			break
+		parts += [mft_decode(buffer(buf), first, recsize)]
+		first += len(buf) / recsize
+	if not parts:
+		return mft_decode('', 0, recsize)
+	return dict([(k, numpy.concatenate([p[k] for p in parts])) for k in parts[0]])
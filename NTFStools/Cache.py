@@ -0,0 +1,455 @@
+# -*- coding: mbcs -*-
+from collections import OrderedDict, deque
+import logging
+import threading
+
+"""
+Cache di blocchi per DiskFile
+=============================
+
+Come dovrebbe operare purge():
+- determinare la frequenza minima di servizio di un blocco; quindi
+- rimuovere il blocco pi anticamente inserito, con quella frequenza.
+
+In tal modo, gli elementi meno richiesti e pi vecchi sono eliminati per primi,
+dando modo a quelli pi recenti di avere pi chance di richiamo.
+
+Una cache non purgata pu consumare memoria all'infinito, e ci non  auspicabile.
+
+Dai primi test su un filesystem tipico di una chiavetta, appariva che le prestazioni migliori
+(in termini di minor tempo per la manutenzione) si ottenessero azzerando completamente la cache al
+superamento della soglia.
+
+Il metodo pi lento (di 1 minuto!) era invece quello che rimuoveva il pi antico blocco meno usato, anche
+perch l'elaborazione (un Counter ricostruito da capo) doveva essere ripetuta a ogni inserimento di
+blocco successivo al superamento della soglia.
+
+FAT32 3,12GB in 12110 file e 491 cartelle
+no purge		6:37
+purge all		6:45
+purge half		6:49
+simple cache	6:50
+purge least used	7:45
+
+Le politiche seguenti mantengono invece le proprie liste *gi* ordinate (OrderedDict e deque), sicch
+ricerca, inserimento ed eliminazione costano un tempo costante:
+
+- LRUCache elimina il blocco usato meno di recente;
+- TwoQCache (2Q) e ARCCache (Adaptive Replacement Cache) distinguono i blocchi letti una sola volta
+(ad esempio, dalla copia sequenziale di un file) da quelli richiesti ripetutamente (FAT, MFT, indici),
+sicch una scansione non svuota la cache dei metadati;
+- ClockCache approssima LRU con un bit di riferimento e una lancetta circolare.
+
+Il limite  espresso in byte (maxsize), non in numero di blocchi.
+
+Le politiche non sono protette da accessi concorrenti: StripedCache suddivide le chiavi fra
+pi cache della stessa politica, ciascuna col proprio lock, sicch thread che leggono blocchi
+diversi raramente si attendono a vicenda.
+
+DentryCache non conserva blocchi ma l'esito della ricerca di un nome in una directory: la chiave
+ il riferimento MFT della directory (numero e sequenza del record) con il nome in maiuscolo,
+il valore il riferimento MFT trovato, o 0 se il nome non esiste (voce negativa). Una voce
+negativa annota anche l'LSN del record della directory: vale finch questo non cambia. Il
+limite  in numero di voci.
+"""
+
+__all__ = ['BlockCache', 'LRUCache', 'TwoQCache', 'ARCCache', 'ClockCache', 'StripedCache',
+'DentryCache', 'cache_policies', 'makecache']
+
+
+class BlockCache(object):
+	"""Base comune delle cache di blocchi: contabilit dei byte e statistiche. Ogni politica
+	definisce get(key) (il blocco, o None), put(key, data), clear() e __len__"""
+	def __init__ (self, maxsize=16<<20):
+		self.maxsize = maxsize # limite massimo, in byte
+		self.used = 0 # byte attualmente in cache
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def stats(self):
+		"Contatori della cache, in un dizionario"
+		total = self.hits + self.misses
+		return {'policy': self.__class__.__name__, 'maxsize': self.maxsize, 'used': self.used,
+		'items': len(self), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+		'hit_ratio': total and float(self.hits)/total or 0.0}
+
+	def print_stats(self):
+		s = self.stats()
+		logging.info("Cache %(policy)s: %(items)d blocchi, %(used)d byte, %(hits)d riscontri, %(misses)d mancati, %(evictions)d eliminati", s)
+		print "Cache %(policy)s: %(items)d blocchi in memoria (%(used)d byte)" % s
+		print "Riscontri dalla cache: %(hits)d (%(hit_ratio).2f%%), mancati: %(misses)d, eliminati: %(evictions)d" % \
+		dict(s, hit_ratio=s['hit_ratio']*100)
+
+
+class LRUCache(BlockCache):
+	"Elimina il blocco usato meno di recente"
+	def __init__ (self, maxsize=16<<20):
+		BlockCache.__init__(self, maxsize)
+		self._items = OrderedDict() # dal meno al pi recente
+
+	def __len__ (self): return len(self._items)
+
+	def __contains__ (self, key): return key in self._items
+
+	def get(self, key):
+		data = self._items.pop(key, None)
+		if data is None:
+			self.misses += 1
+			return None
+		self._items[key] = data # reinserito in coda, come il pi recente
+		self.hits += 1
+		return data
+
+	def put(self, key, data):
+		old = self._items.pop(key, None)
+		if old is not None:
+			self.used -= len(old)
+		self._items[key] = data
+		self.used += len(data)
+		while self.used > self.maxsize and self._items:
+			k, v = self._items.popitem(last=False)
+			self.used -= len(v)
+			self.evictions += 1
+
+	def clear(self):
+		self._items.clear()
+		self.used = 0
+
+
+class TwoQCache(BlockCache):
+	"""Politica 2Q: un blocco nuovo entra in una coda FIFO (A1in); se richiesto di nuovo
+	dopo esserne uscito (la sua chiave sopravvive in A1out) viene promosso nella coda
+	LRU principale (Am). I blocchi letti una sola volta non scalzano quindi quelli caldi."""
+	def __init__ (self, maxsize=16<<20, kin=0.25, kout=0.5):
+		BlockCache.__init__(self, maxsize)
+		self.kin = int(maxsize*kin) # byte massimi in A1in
+		self.kout = int(maxsize*kout) # byte "fantasma" ricordati in A1out
+		self._a1in = OrderedDict()
+		self._a1out = OrderedDict() # chiave: dimensione del blocco eliminato
+		self._am = OrderedDict()
+		self._inused = 0
+		self._outused = 0
+
+	def __len__ (self): return len(self._a1in) + len(self._am)
+
+	def __contains__ (self, key): return key in self._am or key in self._a1in
+
+	def get(self, key):
+		data = self._am.pop(key, None)
+		if data is not None:
+			self._am[key] = data
+			self.hits += 1
+			return data
+		data = self._a1in.get(key)
+		if data is not None:
+			self.hits += 1 # in A1in l'ordine resta quello d'inserimento
+			return data
+		self.misses += 1
+		return None
+
+	def put(self, key, data):
+		if key in self._am:
+			self.used -= len(self._am.pop(key))
+			self._am[key] = data
+		elif key in self._a1in:
+			old = self._a1in[key]
+			self.used -= len(old)
+			self._inused += len(data) - len(old)
+			self._a1in[key] = data
+		elif key in self._a1out:
+			self._outused -= self._a1out.pop(key)
+			self._am[key] = data
+		else:
+			self._a1in[key] = data
+			self._inused += len(data)
+		self.used += len(data)
+		self._reclaim()
+
+	def _reclaim(self):
+		while self.used > self.maxsize:
+			if self._a1in and (self._inused > self.kin or not self._am):
+				k, v = self._a1in.popitem(last=False)
+				self._inused -= len(v)
+				self._a1out[k] = len(v)
+				self._outused += len(v)
+				while self._outused > self.kout:
+					self._outused -= self._a1out.popitem(last=False)[1]
+			elif self._am:
+				k, v = self._am.popitem(last=False)
+			else:
+				break
+			self.used -= len(v)
+			self.evictions += 1
+
+	def clear(self):
+		self._a1in.clear()
+		self._a1out.clear()
+		self._am.clear()
+		self.used = self._inused = self._outused = 0
+
+
+class ARCCache(BlockCache):
+	"""Adaptive Replacement Cache: T1 contiene i blocchi visti una volta, T2 quelli
+	visti almeno due volte; B1 e B2 ricordano le chiavi eliminate dall'una e dall'altra.
+	Un riscontro in B1 o B2 sposta il bersaglio p (byte riservati a T1) a favore della
+	lista che si sarebbe dovuta preservare."""
+	def __init__ (self, maxsize=16<<20):
+		BlockCache.__init__(self, maxsize)
+		self.p = 0
+		self._t1 = OrderedDict()
+		self._t2 = OrderedDict()
+		self._b1 = OrderedDict() # chiave: dimensione del blocco eliminato
+		self._b2 = OrderedDict()
+		self._t1used = self._t2used = self._b1used = self._b2used = 0
+
+	def __len__ (self): return len(self._t1) + len(self._t2)
+
+	def __contains__ (self, key): return key in self._t1 or key in self._t2
+
+	def get(self, key):
+		data = self._t1.pop(key, None)
+		if data is not None:
+			self._t1used -= len(data)
+			self._t2[key] = data
+			self._t2used += len(data)
+			self.hits += 1
+			return data
+		data = self._t2.pop(key, None)
+		if data is not None:
+			self._t2[key] = data
+			self.hits += 1
+			return data
+		self.misses += 1
+		return None
+
+	def put(self, key, data):
+		n = len(data)
+		if key in self._t1 or key in self._t2: # aggiornamento: il blocco resta (o passa) in T2
+			old = self._t1.pop(key, None)
+			if old is not None:
+				self._t1used -= len(old)
+			else:
+				self._t2used -= len(self._t2.pop(key))
+			self._t2[key] = data
+			self._t2used += n
+		elif key in self._b1:
+			self._b1used -= self._b1.pop(key)
+			self.p = min(self.maxsize, self.p + max(self._b2used/max(self._b1used, 1), 1)*n)
+			self._replace(0)
+			self._t2[key] = data
+			self._t2used += n
+		elif key in self._b2:
+			self._b2used -= self._b2.pop(key)
+			self.p = max(0, self.p - max(self._b1used/max(self._b2used, 1), 1)*n)
+			self._replace(1)
+			self._t2[key] = data
+			self._t2used += n
+		else:
+			self._t1[key] = data
+			self._t1used += n
+		self.used = self._t1used + self._t2used
+		self._replace(0)
+		# Limita la memoria delle liste fantasma
+		while self._b1 and self._t1used + self._b1used > self.maxsize:
+			self._b1used -= self._b1.popitem(last=False)[1]
+		while self._b2 and self.used + self._b1used + self._b2used > 2*self.maxsize:
+			self._b2used -= self._b2.popitem(last=False)[1]
+
+	def _replace(self, inb2):
+		while self._t1used + self._t2used > self.maxsize:
+			if self._t1 and (self._t1used > self.p or (inb2 and self._t1used == self.p) or not self._t2):
+				k, v = self._t1.popitem(last=False)
+				self._t1used -= len(v)
+				self._b1[k] = len(v)
+				self._b1used += len(v)
+			elif self._t2:
+				k, v = self._t2.popitem(last=False)
+				self._t2used -= len(v)
+				self._b2[k] = len(v)
+				self._b2used += len(v)
+			else:
+				break
+			self.evictions += 1
+		self.used = self._t1used + self._t2used
+
+	def clear(self):
+		for d in (self._t1, self._t2, self._b1, self._b2):
+			d.clear()
+		self.p = self.used = 0
+		self._t1used = self._t2used = self._b1used = self._b2used = 0
+
+
+class ClockCache(BlockCache):
+	"""Algoritmo CLOCK: ogni blocco ha un bit di riferimento, impostato a ogni riscontro;
+	la lancetta (la testa della coda circolare) concede una seconda possibilit ai blocchi
+	referenziati ed elimina il primo che non lo ."""
+	def __init__ (self, maxsize=16<<20):
+		BlockCache.__init__(self, maxsize)
+		self._items = {} # chiave: [dati, bit di riferimento]
+		self._ring = deque() # ordine circolare delle chiavi; la testa  la lancetta
+
+	def __len__ (self): return len(self._items)
+
+	def __contains__ (self, key): return key in self._items
+
+	def get(self, key):
+		slot = self._items.get(key)
+		if slot is None:
+			self.misses += 1
+			return None
+		slot[1] = 1
+		self.hits += 1
+		return slot[0]
+
+	def put(self, key, data):
+		slot = self._items.get(key)
+		if slot is not None:
+			self.used += len(data) - len(slot[0])
+			slot[0] = data
+		else:
+			self._items[key] = [data, 0]
+			self._ring.append(key) # subito dietro la lancetta
+			self.used += len(data)
+		while self.used > self.maxsize and self._ring:
+			k = self._ring.popleft()
+			slot = self._items[k]
+			if slot[1]:
+				slot[1] = 0
+				self._ring.append(k)
+				continue
+			del self._items[k]
+			self.used -= len(slot[0])
+			self.evictions += 1
+
+	def clear(self):
+		self._items.clear()
+		self._ring.clear()
+		self.used = 0
+
+
+class StripedCache(BlockCache):
+	"Cache sicura tra thread: le chiavi sono ripartite fra stripes cache, ognuna col suo lock"
+	def __init__ (self, policy=LRUCache, maxsize=16<<20, stripes=8):
+		BlockCache.__init__(self, maxsize)
+		self.policy = policy
+		self._stripes = [policy(maxsize/stripes) for i in range(stripes)]
+		self._locks = [threading.Lock() for i in range(stripes)]
+
+	def __len__ (self): return sum(map(len, self._stripes))
+
+	def __contains__ (self, key):
+		i = hash(key) % len(self._stripes)
+		with self._locks[i]:
+			return key in self._stripes[i]
+
+	def get(self, key):
+		i = hash(key) % len(self._stripes)
+		with self._locks[i]:
+			return self._stripes[i].get(key)
+
+	def put(self, key, data):
+		i = hash(key) % len(self._stripes)
+		with self._locks[i]:
+			self._stripes[i].put(key, data)
+
+	def clear(self):
+		for i in range(len(self._stripes)):
+			with self._locks[i]:
+				self._stripes[i].clear()
+
+	def stats(self):
+		s = BlockCache.stats(self)
+		for k in ('used', 'hits', 'misses', 'evictions'):
+			s[k] = sum([getattr(c, k) for c in self._stripes])
+		total = s['hits'] + s['misses']
+		s['hit_ratio'] = total and float(s['hits'])/total or 0.0
+		s['policy'] = self.policy.__name__
+		return s
+
+
+class DentryCache(object):
+	"""Cache LRU delle voci di directory: (riferimento della directory, nome in maiuscolo) ->
+	riferimento MFT del file, o 0 se il nome non c'. Chi la usa verifica che il record trovato
+	abbia ancora la sequenza del riferimento (v. stale); le voci negative valgono finch il
+	record della directory conserva l'LSN (u64LogSeqNumber) annotato con esse"""
+	def __init__ (self, maxitems=65536):
+		self.maxitems = maxitems
+		self.hits = 0
+		self.negative = 0 # riscontri di voci negative (compresi in hits)
+		self.misses = 0
+		self.stales = 0 # voci scartate perch il record  stato riutilizzato
+		self.evictions = 0
+		self._items = OrderedDict() # dalla meno alla pi recente
+		self._lock = threading.Lock()
+
+	def __len__ (self): return len(self._items)
+
+	def get(self, parent, name, lsn=None):
+		"""Il riferimento MFT di name nella directory parent, 0 se non esiste, None se ignoto;
+		una voce negativa annotata con un LSN diverso da lsn (quello attuale della directory)
+		 scaduta, e vale come ignota"""
+		with self._lock:
+			item = self._items.pop((parent, name), None)
+			if item is None:
+				self.misses += 1
+				return None
+			ref, stamp = item
+			if not ref and lsn is not None and stamp != lsn: # la directory  cambiata
+				self.stales += 1
+				self.misses += 1
+				return None
+			self._items[(parent, name)] = item
+			self.hits += 1
+			if not ref:
+				self.negative += 1
+			return ref
+
+	def put(self, parent, name, ref, lsn=None):
+		"Annota l'esito di una ricerca (ref=0 se name non esiste, con l'LSN della directory)"
+		with self._lock:
+			self._items.pop((parent, name), None)
+			self._items[(parent, name)] = (ref, lsn)
+			while len(self._items) > self.maxitems:
+				self._items.popitem(last=False)
+				self.evictions += 1
+
+	def stale(self, parent, name):
+		"Scarta una voce il cui record non ha pi la sequenza annotata"
+		with self._lock:
+			if self._items.pop((parent, name), None) is not None:
+				self.stales += 1
+				# il riscontro non era valido
+				self.hits -= 1
+				self.misses += 1
+
+	def clear(self):
+		with self._lock:
+			self._items.clear()
+
+	def stats(self):
+		"Contatori della cache, in un dizionario"
+		total = self.hits + self.misses
+		return {'policy': self.__class__.__name__, 'maxitems': self.maxitems, 'items': len(self),
+		'hits': self.hits, 'negative_hits': self.negative, 'misses': self.misses, 'stales': self.stales,
+		'evictions': self.evictions, 'hit_ratio': total and float(self.hits)/total or 0.0}
+
+	def print_stats(self):
+		s = self.stats()
+		logging.info("Cache %(policy)s: %(items)d voci, %(hits)d riscontri (%(negative_hits)d negativi), %(misses)d mancati, %(stales)d scadute", s)
+		print "Cache delle voci di directory: %(items)d voci in memoria" % s
+		print "Riscontri: %(hits)d (%(hit_ratio).2f%%, %(negative_hits)d negativi), mancati: %(misses)d, scadute: %(stales)d, eliminate: %(evictions)d" % \
+		dict(s, hit_ratio=s['hit_ratio']*100)
+
+
+# Politiche selezionabili per nome
+cache_policies = {'lru': LRUCache, '2q': TwoQCache, 'arc': ARCCache, 'clock': ClockCache}
+
+def makecache(cache=None, maxsize=16<<20):
+	"""Restituisce la cache indicata: un oggetto BlockCache  usato cos com'; il nome
+	di una politica (o None, per LRU) produce una StripedCache di quella politica"""
+	if cache is None:
+		cache = 'lru'
+	if type(cache) == type(''):
+		cache = StripedCache(cache_policies[cache], maxsize)
+	return cache
@@ -0,0 +1,209 @@
+# -*- coding: mbcs -*-
+import sqlite3
+import struct
+import sys
+from NTFStools.Boot import Bootsector
+from NTFStools.Index import UpCase
+from NTFStools.Utilities import ntfs_open_mft, ntfs_open_upcase, ntfs_iter_records
+
+"""
+Catalogo persistente della MFT
+==============================
+
+Ogni esecuzione di ntfscpi.py rilegge settore di avvio, record $MFT e indici delle directory.
+Un Catalog conserva invece in un file SQLite locale (per default accanto all'immagine, con
+estensione .catalog) quanto serve a risolvere percorsi ed elencare directory, raccolto con una
+sola scansione della MFT (ntfs_iter_records):
+
+	records		numero di record, sequenza, LSN, flag, record base, dimensione, $DATA residente,
+			date di $STANDARD_INFORMATION, primo run di dati (offset e lunghezza in byte)
+	names		nomi ($FILE_NAME) di ogni record: genitore, nome, nome in maiuscolo, spazio dei
+			nomi e record che contiene l'attributo (diverso dal base per le estensioni)
+	meta		numero di serie del volume, dimensione del cluster e tabella $UpCase
+
+refresh ripercorre la MFT leggendo soltanto le intestazioni dei record, e decodifica di nuovo
+i soli record il cui u64LogSeqNumber o wSequence  cambiato (e il record base di quelli di
+estensione cambiati, i cui attributi vi appartengono); elimina quelli non pi in uso.
+Il confronto tra i nomi  insensibile a maiuscole e minuscole, come in NTFS: secondo la
+tabella $UpCase del volume, conservata nel catalogo.
+"""
+
+__all__ = ['Catalog', 'catalog_path']
+
+_schema = """
+CREATE TABLE IF NOT EXISTS records (recno INTEGER PRIMARY KEY, sequence INTEGER, lsn INTEGER,
+flags INTEGER, base INTEGER, size INTEGER, resident INTEGER, ctime INTEGER, mtime INTEGER,
+atime INTEGER, rtime INTEGER, runoffset INTEGER, runlength INTEGER);
+CREATE TABLE IF NOT EXISTS names (recno INTEGER, parent INTEGER, name TEXT, upname TEXT,
+namespace INTEGER, source INTEGER);
+CREATE INDEX IF NOT EXISTS names_parent ON names (parent, upname);
+CREATE INDEX IF NOT EXISTS names_recno ON names (recno);
+CREATE INDEX IF NOT EXISTS names_source ON names (source);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+"""
+
+
+def catalog_path(name):
+	"Percorso predefinito del catalogo di un'immagine (o disco)"
+	return name + '.catalog'
+
+
+def _s64(n):
+	"SQLite conserva interi a 64 bit con segno"
+	if n >= 1<<63:
+		return n - (1<<64)
+	return n
+
+
+class Catalog(object):
+	"Catalogo persistente (SQLite) dei record e dei nomi della MFT di un volume"
+	def __init__ (self, path):
+		self.path = path
+		self.db = sqlite3.connect(path)
+		self.db.executescript(_schema)
+		self.upcase = None # la tabella $UpCase del volume, letta al primo uso
+
+	def close(self):
+		self.db.close()
+
+	def __len__ (self):
+		return self.db.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+	def _upcase(self):
+		"La tabella $UpCase conservata nel catalogo (le regole di Python, se manca)"
+		if not self.upcase:
+			row = self.db.execute("SELECT value FROM meta WHERE key='upcase'").fetchone()
+			self.upcase = UpCase(row and str(row[0]) or None)
+		return self.upcase
+
+	def _store(self, record):
+		"Inserisce o aggiorna un record e i suoi nomi"
+		n = record._pos / 1024
+		base = record.u64BaseMftRec & 0x0000FFFFFFFFFFFF
+		size, resident, runoffset, runlength = 0, 0, 0, 0
+		times = (0, 0, 0, 0)
+		si = record.find_attribute("$STANDARD_INFORMATION")
+		if si:
+			times = si[0].u64CTime, si[0].u64MTime, si[0].u64ATime, si[0].u64RTime
+		names = record.find_attribute("$FILE_NAME") or ()
+		for fn in names:
+			size = fn.u64RealSize
+		for data in record.find_attribute("$DATA") or ():
+			if not data.uchNameLength: # lo stream principale
+				if data.uchNonResFlag:
+					size = data.u64RealSize
+					if len(data.dataruns):
+						runlength, runoffset = data.dataruns.lengths[0], data.dataruns.offsets[0]
+				else:
+					size, resident = data.dwLength, 1
+				break
+		self.db.execute('INSERT OR REPLACE INTO records VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)',
+		(n, record.wSequence, _s64(record.u64LogSeqNumber), record.wFlags, base, size, resident) +
+		tuple(times) + (runoffset, runlength))
+		self.db.execute('DELETE FROM names WHERE source=?', (n,))
+		self.db.executemany('INSERT INTO names VALUES (?,?,?,?,?,?)',
+		[(base or n, fn.u64FileReference & 0x0000FFFFFFFFFFFF, fn.FileName, self.upcase.upper(fn.FileName),
+		fn.uFileNameNamespace, n) for fn in names])
+
+	def build(self, disk):
+		"Ricostruisce il catalogo da capo, con una scansione completa della MFT"
+		self.db.execute('DELETE FROM records')
+		self.db.execute('DELETE FROM names')
+		return self.refresh(disk)
+
+	def refresh(self, disk):
+		"""Aggiorna il catalogo decodificando i soli record cambiati (LSN o sequenza) e
+		rimuovendo quelli liberati; restituisce il numero di record aggiornati e rimossi"""
+		mft = ntfs_open_mft(disk)
+		disk.seek(0)
+		serial = _s64(Bootsector(disk).u64VolumeSerialNum)
+		row = self.db.execute("SELECT value FROM meta WHERE key='serial'").fetchone()
+		stored = self.db.execute("SELECT value FROM meta WHERE key='upcase'").fetchone()
+		# un altro volume, o un catalogo senza $UpCase (nomi in maiuscolo secondo Python)
+		if row and row[0] != serial or row and not stored:
+			self.db.execute('DELETE FROM records')
+			self.db.execute('DELETE FROM names')
+		self.upcase = getattr(disk, 'upcase', None) or ntfs_open_upcase(mft)
+		known = {}
+		for n, lsn, sequence in self.db.execute('SELECT recno, lsn, sequence FROM records'):
+			known[n] = (lsn, sequence)
+		seen = set()
+		bases = set() # record base di record di estensione cambiati
+		def select(n, buf, offset):
+			# 0x08: u64LogSeqNumber, 0x10: wSequence, 0x16: wFlags, 0x20: u64BaseMftRec
+			lsn, sequence, links, attroffset, flags = struct.unpack_from('<QHHHH', buf, offset+8)
+			if not flags & 0x1:
+				return 0
+			seen.add(n)
+			if known.get(n) == (_s64(lsn), sequence):
+				return 0
+			base = struct.unpack_from('<Q', buf, offset+0x20)[0] & 0x0000FFFFFFFFFFFF
+			if base:
+				bases.add(base)
+			return 1
+		stored = set()
+		for record in ntfs_iter_records(mft, select=select):
+			self._store(record)
+			stored.add(record._pos / 1024)
+		# Dimensione, date e run del record base possono venire dai suoi record di estensione
+		for n in bases - stored:
+			if n in seen:
+				self._store(mft.next(n))
+				stored.add(n)
+		gone = [(n,) for n in known if n not in seen]
+		self.db.executemany('DELETE FROM records WHERE recno=?', gone)
+		self.db.executemany('DELETE FROM names WHERE source=?', gone)
+		self.db.executemany('INSERT OR REPLACE INTO meta VALUES (?,?)',
+		(('serial', serial), ('clustersize', disk.clustersize), ('upcase', sqlite3.Binary(self.upcase.tostring()))))
+		self.db.commit()
+		return len(stored), len(gone)
+
+	def lookup(self, path):
+		"Numero del record MFT di un percorso assoluto (es. \\Windows\\System32), o None"
+		if type(path) != type(u''):
+			path = path.decode(sys.getfilesystemencoding() or 'mbcs')
+		upcase = self._upcase()
+		parts = path.replace('\\', '/').split('/')
+		if parts and len(parts[0]) == 2 and parts[0][1] == ':': # lettera di unit
+			del parts[0]
+		n = 5 # ROOT
+		for part in parts:
+			if not part or part == '.':
+				continue
+			row = self.db.execute('SELECT recno FROM names WHERE parent=? AND upname=?',
+			(n, upcase.upper(part))).fetchone()
+			if not row:
+				return None
+			n = row[0]
+		return n
+
+	def record(self, n):
+		"Il record n-esimo del catalogo, come dizionario (o None)"
+		cursor = self.db.execute('SELECT * FROM records WHERE recno=?', (n,))
+		row = cursor.fetchone()
+		if row:
+			return dict(zip([d[0] for d in cursor.description], row))
+		return None
+
+	def listdir(self, path):
+		"""Elenca una directory (percorso o numero di record): tuple (nome, record, dimensione,
+		directory), in ordine di nome; i nomi DOS 8.3 sono omessi se c' quello lungo"""
+		n = path
+		if type(path) not in (type(0), type(0L)):
+			n = self.lookup(path)
+		return self.db.execute('SELECT n.name, r.recno, r.size, r.flags & 2 FROM names n JOIN records r '
+		'ON r.recno = n.recno WHERE n.parent=? AND n.namespace != 2 AND r.recno != n.parent ORDER BY n.upname', (n,)).fetchall()
+
+	def open(self, path, mft):
+		"""Apre il Record MFT di un percorso, tramite il catalogo: se il record non ha pi la
+		sequenza annotata (il catalogo non  aggiornato), lo aggiorna e riprova"""
+		for attempt in (0, 1):
+			n = self.lookup(path)
+			row = n is not None and self.record(n)
+			if row: # il record pu essere stato eliminato da un refresh
+				record = mft.next(n)
+				if record.wSequence == row['sequence']:
+					return record
+			if attempt == 0:
+				self.refresh(mft._disk)
+		return None
@@ -1,8 +1,8 @@
 # -*- coding: mbcs -*-
-import array
 import datetime
 import logging
 import struct
+from NTFStools.DatarunStream import RunList
 
 class EndOfStream(Exception):
 	pass
@@ -15,10 +15,11 @@ class BadIndex(Exception):
 
 def class2str(c, s):
 	"Enumera in tabella nomi e valori dal layout di una classe"
-	keys = c._kv.keys()
+	kv = c._layout.kv
+	keys = kv.keys()
 	keys.sort()
 	for key in keys:
-		o = c._kv[key][0]
+		o = kv[key][0]
 		v = getattr(c, o)
 		if type(v) in (type(0), type(0L)):
 			v = hex(v)
@@ -26,35 +27,155 @@ def class2str(c, s):
 	return s
 
 
+class LayoutFields(object):
+	"Base delle classi di campi generate da Layout: un record compatto, a __slots__"
+	__slots__ = ()
+
+	def __str__ (self):
+		return class2str(self, "%s\n" % self.__class__.__name__)
+
+
+class Layout(object):
+	"""Tabella di layout { offset: (nome, formato) } compilata una volta per tutte:
+
+	- kv e vk sono i dizionari offset->campo e nome->offset, condivisi da tutte le istanze
+	(da non modificare!);
+	- struct  un unico struct.Struct che decodifica tutti i campi con una sola chiamata,
+	saltando con byte di riempimento i tratti non descritti; vale None se i campi si
+	sovrappongono (nel qual caso si decodifica campo per campo);
+	- Fields  una classe generata, a __slots__, i cui esemplari (restituiti da decode)
+	contengono tutti i campi gi decodificati; pu fare da base a una classe (v. fields_class),
+	i cui campi fill decodifica subito, tutti insieme, negli slot anzich in un __dict__.
+
+	Un nome ripetuto (es. sReserved2 nel layout della voce file exFAT) designa, come
+	sempre, il campo cui punta vk: gli altri sono saltati."""
+	def __init__ (self, kv, name='Fields'):
+		self.kv = kv
+		self.vk = {} # { nome: offset}
+		for k, v in kv.items():
+			self.vk[v[0]] = k
+		self.names = [] # nomi dei campi, nell'ordine di decodifica
+		fmt = '<'
+		pos = 0
+		for k in sorted(kv):
+			f = kv[k][1].lstrip('<')
+			if k < pos: # campi sovrapposti
+				fmt = None
+				break
+			if k > pos:
+				fmt += '%dx' % (k - pos)
+			pos = k + struct.calcsize('<' + f)
+			if self.vk[kv[k][0]] != k: # nome ripetuto: campo saltato
+				fmt += '%dx' % struct.calcsize('<' + f)
+				continue
+			fmt += f
+			self.names += [kv[k][0]]
+		if fmt:
+			self.struct = struct.Struct(fmt)
+			self.size = self.struct.size
+		else:
+			self.struct = None
+			self.names = self.vk.keys()
+			self.size = max([o + struct.calcsize('<' + v[1].lstrip('<')) for o, v in kv.items()])
+		# Genera la classe dei campi, con un costruttore che li assegna tutti in una volta
+		src = 'def __init__(self, values):\n\t%s, = values\n' % ', '.join(['self.'+n for n in self.names])
+		if not self.names:
+			src = 'def __init__(self, values):\n\tpass\n'
+		ns = {}
+		exec src in ns
+		self.Fields = type(name, (LayoutFields,), {'__slots__': tuple(self.names),
+		'__init__': ns['__init__'], '_layout': self})
+
+	def unpack(self, buf, i=0):
+		"Decodifica tutti i campi, nell'ordine di names"
+		if self.struct:
+			return self.struct.unpack_from(buf, i)
+		return tuple([self.field(buf, i, n) for n in self.names])
+
+	def field(self, buf, i, name):
+		"Decodifica un solo campo"
+		k = self.vk[name]
+		return struct.unpack_from(self.kv[k][1], buf, i+k)[0]
+
+	def decode(self, buf, i=0):
+		"Decodifica subito tutti i campi, in un esemplare della classe generata Fields"
+		return self.Fields(self.unpack(buf, i))
+
+	def fill(self, obj, buf, i=0):
+		"Decodifica subito tutti i campi negli slot di obj, esemplare di una classe derivata da Fields"
+		self.Fields.__init__(obj, self.unpack(buf, i))
+
+
+_layouts = {} # layout compilati, per identit delle tabelle componenti
+
+def compile_layout(*tables):
+	"""Compila (una volta sola) un layout, eventualmente composto da pi tabelle: ognuna
+	 un dizionario { offset: (nome, formato) } o una coppia (dizionario, spiazzamento)"""
+	key = tuple([type(t) == type(()) and (id(t[0]), t[1]) or (id(t), 0) for t in tables])
+	layout = _layouts.get(key)
+	if layout is None:
+		kv = {}
+		for t in tables:
+			if type(t) == type(()):
+				t, shift = t
+			else:
+				shift = 0
+			for k, v in t.items():
+				kv[k + shift] = v
+		layout = _layouts[key] = Layout(kv)
+		# Conserva i riferimenti: gli id delle tabelle non possono cos essere riutilizzati
+		layout._tables = tables
+	return layout
+
+
+def fields_class(*tables):
+	"""Classe base, a __slots__, di una classe i cui campi (del layout compilato dalle tabelle)
+	sono decodificati subito, con Layout.fill"""
+	return compile_layout(*tables).Fields
+
+
 def common_getattr(c, name):
-	"Decodifica e salva un attributo in base al layout di classe"
-	i = c._vk[name]
-	fmt = c._kv[i][1]
-	cnt = struct.unpack_from(fmt, c._buf, i+c._i) [0]
-	setattr(c, name,  cnt)
-	return cnt
+	"""Decodifica gli attributi in base al layout di classe (c._layout): al primo accesso,
+	tutti insieme con una sola chiamata a struct (negli slot, se c deriva dalla classe Fields
+	del layout); se il buffer  troppo corto per contenerli, solo quello richiesto"""
+	if name[0] == '_':
+		raise AttributeError(name)
+	layout = c._layout
+	if name not in layout.vk:
+		raise AttributeError(name)
+	try:
+		values = layout.unpack(c._buf, c._i)
+	except struct.error:
+		cnt = layout.field(c._buf, c._i, name)
+		setattr(c, name, cnt)
+		return cnt
+	if isinstance(c, layout.Fields):
+		layout.Fields.__init__(c, values)
+		return getattr(c, name)
+	c.__dict__.update(zip(layout.names, values))
+	return c.__dict__[name]
 
 
 def common_update_and_swap(c):
-	"Aggiorna i dizionari di classe con le informazioni specifiche dell'attributo"
-	if c.uchNonResFlag:
-		ko = 64
+	"Estende il layout dell'attributo con quello specifico, alle posizioni effettive"
+	if c._layout is c._layout_nonresident:
+		c._layout = compile_layout(c.layout, c.layout_nonresident, (c.specific_layout, 64))
 	else:
-		ko = 24
-	for k in c.specific_layout.keys(): # aggiorna la tabella con le posizioni effettive
-		c._kv[k+ko] = c.specific_layout[k]
-	for k, v in c.specific_layout.items():
-		c._vk[v[0]] = k+ko
+		c._layout = compile_layout(c.layout, c.layout_resident, (c.specific_layout, 24))
 	
 	
 def common_dataruns_decode(self):
-	self.dataruns = (0,0) # tuple di datarun decodificati
-	firstrun = 1
-	# Di seguito, decodifichiamo una volta per tutte i datarun
+	"""Decodifica una volta per tutte i datarun dell'attributo in una RunList (self.dataruns),
+	con la dimensione effettiva del cluster annotata nel disco (v. ntfs_open_mft; se manca,
+	4096 byte)"""
+	clustersize = getattr(self._parent._disk, 'clustersize', 0) or 4096
+	self.dataruns = RunList(clustersize)
+	lcn = 0
 	i = self._i + self.wDatarunOffset
-	while 1:
+	end = self._i + self.dwFullLength
+	while i < end:
 		# Legge il primo byte: 2 nibble di indice
-		c = struct.unpack("B", self._buf[i])[0]
+		c = ord(self._buf[i])
 		if not c: break
 		# I 4 bit meno significativi indicano quanti byte compongono 
 		# la lunghezza (in cluster) del segmento
@@ -62,36 +183,28 @@ def common_dataruns_decode(self):
 		# I 4 bit pi significativi indicano quanti byte compongono 
 		# l'offset del cluster iniziale
 		n_offset = c >> 4
-		logging.debug("n_length=%d, n_offset=%d", n_length, n_offset)
-		# Legge e determina il n di cluster del segmento dati
 		i += 1
-		length = self._buf[i:i+n_length] + array.array('c', (8-n_length)*'\x00')
-		length = struct.unpack_from("<Q", length)[0] # ricaviamo sempre una QWORD 128-bit positiva
-		# Legge e determina l'offset del cluster iniziale
-		# Gli offset successivi al primo partono dall'offset precedente e possono essere negativi!
+		length = _little_endian(self._buf, i, n_length)
 		i += n_length
-		offset = self._buf[i:i+n_offset] + array.array('c', (8-n_offset)*'\x00')
-		if not firstrun: # dal secondo datarun in poi, captiamo eventuali offset negativi
-			if offset[n_offset-1] >= chr(0x80): # il segno  dato dall'ultimo byte
-				offset = self._buf[i:i+n_offset] + array.array('c', (8-n_offset)*'\xFF')
-			if n_offset == 1: # era un BYTE originario
-				offset = struct.unpack_from("<b", offset[0])[0]
-			elif n_offset == 2: # WORD
-				offset = struct.unpack_from("<h", offset[:2])[0]
-			elif n_offset in (3,4):  # DWORD
-				offset = struct.unpack_from("<i", offset[:4])[0]
-			else: # QWORD
-				offset = struct.unpack_from("<q", offset)[0]
-		else:
-			offset = struct.unpack_from("<Q", offset)[0]
-			firstrun = 0
-		if not offset:
-			logging.debug("File sparse non supportati!")
-		# calcola e salva lunghezza e offset del run in base al cluster effettivo
-		logging.debug("length=%d offset=%d prevoffset=%d", length, offset, self.dataruns[-1])
-		self.dataruns += (length*4096, (offset*4096+self.dataruns[-1])) # ATTENZIONE! Correggere con la dimensione EFFETTIVA del cluster!
+		if n_offset:
+			# Gli offset successivi al primo partono dall'offset precedente e possono essere negativi!
+			lcn += _little_endian(self._buf, i, n_offset, len(self.dataruns) > 0)
+			self.dataruns.append(length*clustersize, lcn*clustersize)
+		else: # run sparso: nessun cluster allocato (e l'offset precedente resta valido)
+			self.dataruns.append(length*clustersize, None)
 		i += n_offset
-	logging.debug("decoded dataruns @%d:\n%s", self._i, self.dataruns)
+	if logging.root.isEnabledFor(logging.DEBUG):
+		logging.debug("decoded dataruns @%d:\n%s", self._i, self.dataruns)
+
+
+def _little_endian(buf, i, n, signed=0):
+	"Intero little-endian di n byte (con segno, se richiesto) alla posizione i"
+	v = 0
+	for k in range(i+n-1, i-1, -1):
+		v = (v << 8) | ord(buf[k])
+	if signed and n and v >= 1 << (8*n-1):
+		v -= 1 << (8*n)
+	return v
 
 def nt2uxtime(t):
 	"Converte data e ora dal formato NT a Python (Unix)"
@@ -100,6 +213,11 @@ def nt2uxtime(t):
 	# La differenza  di 134774 giorni o 11.644.473.600 secondi
 	return datetime.datetime.utcfromtimestamp(t/10000000 - 11644473600)
 
+def nt2epoch(t):
+	"Converte data e ora dal formato NT in secondi (float) dall' 1/1/1970, come vuole os.utime"
+	return (t - 116444736000000000) / 1e7
+
+
 def common_fixup(self):
 	"Verifica e applica il fixup a record MFT, indici, log record"
 	# la WORD di fixup  all'inizio dell'Update Sequence Array (di WORD)
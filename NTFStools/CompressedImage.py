@@ -0,0 +1,438 @@
+# -*- coding: mbcs -*-
+import bisect
+import ctypes, ctypes.util
+import logging
+import os
+import struct
+import sys
+import zlib
+from NTFStools.Cache import *
+from NTFStools.DiskFile import DiskFile
+try:
+	import lzma
+except ImportError: # Python 2: modulo esterno, se installato
+	try:
+		from backports import lzma
+	except ImportError:
+		lzma = None
+
+"""
+Immagini disco compresse, in sola lettura
+=========================================
+
+Due classi espongono un'immagine compressa con l'interfaccia di DiskFile (seek, tell, read,
+read_at, read_extents), sicch Bootsector, Boot, Record e ntfscpi.py vi operano senza
+decomprimerla prima su disco:
+
+- GzipDiskFile apre un'immagine .gz ordinaria. La prima volta la decomprime per intero,
+annotando circa ogni span byte (per default 4 MiB) un punto di ripresa all'inizio di un blocco
+deflate: la posizione nel file compresso, al bit, e gli ultimi 32 KiB decompressi (la finestra
+del dizionario), conservati compressi. Leggere un tratto dell'immagine richiede poi di
+decomprimere solo a partire dal punto precedente. Riprendere a met di un byte richiede
+inflatePrime, che il modulo zlib di Python non offre: si usa quindi lo zlib della libreria C
+con ctypes (come in zran.c, negli esempi dello zlib). L'indice  salvato accanto all'immagine
+(v. gzindex_path), insieme alla dimensione e alla data di modifica del file compresso, e
+riletto alle aperture successive finch queste non cambiano; nel processo,  condiviso tra le
+aperture della stessa immagine (e, con fork, dai processi di MFTScan). Se lo zlib della
+libreria C manca, l'indice  tenuto solo in memoria con le copie dello stato del decompressore
+di Python (circa 100 KiB per punto).
+
+- ChunkedDiskFile apre il formato a blocchi seguente, prodotto da make_chunked_image, in cui
+ogni blocco  compresso indipendentemente (zlib o lzma) e l'indice  gi nel file:
+
+	0x00	8s	firma 'PDTCHUNK'
+	0x08	<H	versione (1)
+	0x0A	<H	compressore (1=zlib, 2=lzma)
+	0x0C	<I	dimensione del blocco decompresso
+	0x10	<Q	dimensione dell'immagine decompressa
+	0x18	<I	numero n dei blocchi
+	0x1C	<Q	n+1 offset dei blocchi compressi nel file (l'ultimo indica la fine)
+
+Un blocco che la compressione non riduce  salvato tal quale: lo si riconosce perch la sua
+lunghezza eguaglia quella del blocco decompresso.
+
+Entrambe conservano gli ultimi blocchi decompressi in una piccola cache (chunkcache byte),
+sicch una scansione della MFT o la ricerca di un file con ntfs_open_file decomprimono solo i
+blocchi che toccano.
+"""
+
+__all__ = ['GzipDiskFile', 'ChunkedDiskFile', 'make_chunked_image', 'CHUNKED_MAGIC', 'gzindex_path']
+
+CHUNKED_MAGIC = 'PDTCHUNK'
+CHUNKED_HEADER = struct.Struct('<8sHHIQI')
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+
+GZINDEX_MAGIC = 'PDTGZIDX'
+GZINDEX_HEADER = struct.Struct('<8sHQQQI') # firma, versione, dimensione e data del .gz, immagine, punti
+GZINDEX_POINT = struct.Struct('<QQBI') # posizione decompressa e compressa, bit, finestra compressa
+
+# Indici delle immagini gzip gi aperte: { (percorso, dimensione, data): (immagine, punti) }
+_gzindexes = {}
+
+# zlib della libreria C, per i punti di ripresa al bit
+Z_OK, Z_STREAM_END, Z_NEED_DICT, Z_BUF_ERROR = 0, 1, 2, -5
+Z_NO_FLUSH, Z_BLOCK = 0, 5
+
+class _ZStream(ctypes.Structure):
+	"z_stream di zlib.h"
+	_fields_ = [('next_in', ctypes.c_void_p), ('avail_in', ctypes.c_uint), ('total_in', ctypes.c_ulong),
+	('next_out', ctypes.c_void_p), ('avail_out', ctypes.c_uint), ('total_out', ctypes.c_ulong),
+	('msg', ctypes.c_char_p), ('state', ctypes.c_void_p), ('zalloc', ctypes.c_void_p),
+	('zfree', ctypes.c_void_p), ('opaque', ctypes.c_void_p), ('data_type', ctypes.c_int),
+	('adler', ctypes.c_ulong), ('reserved', ctypes.c_ulong)]
+
+_libz = None
+for _name in ('z', 'zlib1', 'zlib'):
+	_name = ctypes.util.find_library(_name)
+	if not _name:
+		continue
+	try:
+		_libz = ctypes.CDLL(_name)
+		_libz.zlibVersion.restype = ctypes.c_char_p
+		_libz.inflateInit2_.argtypes = [ctypes.POINTER(_ZStream), ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+		_libz.inflateReset2.argtypes = [ctypes.POINTER(_ZStream), ctypes.c_int]
+		_libz.inflatePrime.argtypes = [ctypes.POINTER(_ZStream), ctypes.c_int, ctypes.c_int]
+		_libz.inflateSetDictionary.argtypes = [ctypes.POINTER(_ZStream), ctypes.c_char_p, ctypes.c_uint]
+		_libz.inflate.argtypes = [ctypes.POINTER(_ZStream), ctypes.c_int]
+		_libz.inflateEnd.argtypes = [ctypes.POINTER(_ZStream)]
+		break
+	except (OSError, AttributeError):
+		_libz = None
+
+
+class _Inflater(object):
+	"Decompressore dello zlib della libreria C (wbits come per inflateInit2)"
+	def __init__ (self, wbits):
+		self._strm = _ZStream()
+		self._input = None
+		self._check(_libz.inflateInit2_(ctypes.byref(self._strm), wbits, _libz.zlibVersion(), ctypes.sizeof(_ZStream)))
+
+	def __del__ (self):
+		_libz.inflateEnd(ctypes.byref(self._strm))
+
+	def _check(self, ret):
+		if ret < 0 and ret != Z_BUF_ERROR:
+			raise IOError("zlib: errore %d (%s)" % (ret, self._strm.msg))
+		return ret
+
+	def reset(self, wbits):
+		"Ricomincia (es. al membro gzip successivo), scartando l'input sospeso"
+		self._check(_libz.inflateReset2(ctypes.byref(self._strm), wbits))
+		self.feed('')
+
+	def prime(self, bits, value):
+		self._check(_libz.inflatePrime(ctypes.byref(self._strm), bits, value))
+
+	def setdict(self, window):
+		self._check(_libz.inflateSetDictionary(ctypes.byref(self._strm), window, len(window)))
+
+	def feed(self, data):
+		"Nuovo input (quello precedente deve essere stato consumato)"
+		self._input = ctypes.create_string_buffer(data, len(data))
+		self._strm.next_in = ctypes.addressof(self._input)
+		self._strm.avail_in = len(data)
+
+	def pending(self):
+		"Byte di input non ancora consumati"
+		return self._strm.avail_in
+
+	def data_type(self):
+		return self._strm.data_type
+
+	def inflate(self, size, flush=Z_NO_FLUSH):
+		"Decomprime fino a size byte; restituisce (esito, dati, byte di input consumati)"
+		out = ctypes.create_string_buffer(size)
+		self._strm.next_out = ctypes.addressof(out)
+		self._strm.avail_out = size
+		avail = self._strm.avail_in
+		ret = self._check(_libz.inflate(ctypes.byref(self._strm), flush))
+		if ret == Z_NEED_DICT:
+			raise IOError("zlib: dizionario richiesto")
+		return ret, out.raw[:size - self._strm.avail_out], avail - self._strm.avail_in
+
+
+def gzindex_path(name):
+	"Percorso predefinito dell'indice dei punti di ripresa di un'immagine gzip"
+	return name + '.gzindex'
+
+
+class _ChunkedBase(DiskFile):
+	"Parte comune: un'immagine decompressa un blocco (chunk) alla volta"
+	rawfile = 0 # il file contiene dati compressi
+	def __init__(self, name, mode='rb', buffering=0, size=0, cache=None, chunkcache=8<<20):
+		DiskFile.__init__(self, name, 'rb', buffering, 0, cache, readahead=0)
+		self.chunks = makecache('lru', chunkcache) # blocchi decompressi
+		self._index() # determina self.chunksize e self.imagesize
+		self.size = size or self.imagesize
+
+	def _rawread(self, offset, size):
+		"Legge byte compressi dal file"
+		return DiskFile._pread(self, offset, size)
+
+	def _chunk(self, n):
+		"Restituisce il blocco decompresso n-esimo"
+		data = self.chunks.get(n)
+		if data is None:
+			data = self._inflate(n)
+			self.chunks.put(n, data)
+		return data
+
+	def _pread(self, offset, size):
+		"Legge size byte dall'immagine decompressa"
+		parts = []
+		end = min(offset + size, self.imagesize)
+		while offset < end:
+			n, o = divmod(offset, self.chunksize)
+			data = self._chunk(n)
+			part = data[o : o + end - offset]
+			if not part: break
+			parts += [part]
+			offset += len(part)
+		return ''.join(parts)
+
+
+class GzipDiskFile(_ChunkedBase):
+	"""Immagine compressa con gzip, con indice dei punti di ripresa costruito alla prima apertura
+	e salvato nel file index (per default, v. gzindex_path; None o '' per non salvarlo)"""
+	def __init__(self, name, mode='rb', buffering=0, size=0, cache=None, chunkcache=8<<20, span=4<<20, index=0):
+		self.chunksize = span
+		if index == 0:
+			index = gzindex_path(name)
+		self.indexfile = index
+		_ChunkedBase.__init__(self, name, mode, buffering, size, cache, chunkcache)
+
+	def _index(self):
+		st = os.fstat(self._file.fileno())
+		key = (os.path.abspath(self._file.name), st.st_size, int(st.st_mtime))
+		if key not in _gzindexes:
+			index = _libz and self._load(key)
+			if not index:
+				if _libz:
+					index = self._build()
+					self._save(key, index)
+				else:
+					index = self._build_states()
+			_gzindexes[key] = index
+		self.imagesize, self._points = _gzindexes[key]
+		self._outs = [point[0] for point in self._points]
+		logging.debug("indice gzip di %s: %d punti, %d byte decompressi", self._file.name, len(self._points), self.imagesize)
+
+	def _load(self, key):
+		"Rilegge l'indice salvato, se corrisponde al file compresso"
+		if not self.indexfile or not os.path.exists(self.indexfile):
+			return None
+		try:
+			f = open(self.indexfile, 'rb')
+			try:
+				magic, version, filesize, mtime, imagesize, n = GZINDEX_HEADER.unpack(f.read(GZINDEX_HEADER.size))
+				if magic != GZINDEX_MAGIC or version != 1 or (filesize, mtime) != key[1:]:
+					return None
+				points = []
+				for i in range(n):
+					out, inpos, bits, length = GZINDEX_POINT.unpack(f.read(GZINDEX_POINT.size))
+					window = f.read(length)
+					if len(window) != length:
+						return None
+					points += [(out, inpos, bits, window)]
+				return imagesize, points
+			finally:
+				f.close()
+		except (IOError, struct.error), e:
+			logging.debug("indice %s illeggibile: %s", self.indexfile, e)
+			return None
+
+	def _save(self, key, index):
+		if not self.indexfile:
+			return
+		imagesize, points = index
+		try:
+			f = open(self.indexfile, 'wb')
+			f.write(GZINDEX_HEADER.pack(GZINDEX_MAGIC, 1, key[1], key[2], imagesize, len(points)))
+			for out, inpos, bits, window in points:
+				f.write(GZINDEX_POINT.pack(out, inpos, bits, len(window)) + window)
+			f.close()
+		except IOError, e:
+			logging.warning("impossibile salvare l'indice %s: %s", self.indexfile, e)
+
+	def _build(self):
+		"""Decomprime l'intera immagine con lo zlib della libreria C, fermandosi a ogni blocco
+		deflate (Z_BLOCK): restituisce dimensione e punti (posizione decompressa e compressa,
+		bit da riprendere nel byte precedente, finestra compressa)"""
+		z = _Inflater(47) # gzip o zlib, secondo l'intestazione
+		points = []
+		inpos = 0 # byte compressi consumati
+		total = last = 0 # byte decompressi prodotti, all'ultimo punto
+		window = ''
+		while 1:
+			if not z.pending():
+				data = self._rawread(inpos, 1<<16)
+				if not data:
+					break
+				z.feed(data)
+			ret, out, used = z.inflate(1<<16, Z_BLOCK)
+			inpos += used
+			total += len(out)
+			if out:
+				window = (window + out)[-32768:]
+			if ret == Z_STREAM_END:
+				if self._rawread(inpos, 2) != '\x1f\x8b': # fine, o byte di riempimento
+					break
+				z.reset(47) # un nuovo membro gzip (es. prodotto da pigz)
+				continue
+			# Inizio di un blocco che non  l'ultimo del membro
+			dt = z.data_type()
+			if dt & 128 and not dt & 64 and (not points or total - last > self.chunksize):
+				points += [(total, inpos, dt & 7, zlib.compress(window))]
+				last = total
+		return total, points
+
+	def _build_states(self):
+		"""Come _build, con il modulo zlib di Python: un punto  una copia dello stato del
+		decompressore, con la posizione nel file compresso e l'input non ancora consumato"""
+		points = []
+		d = zlib.decompressobj(16+zlib.MAX_WBITS)
+		inpos = 0 # byte compressi consumati
+		total = 0 # byte decompressi prodotti
+		tail = ''
+		while 1:
+			if total % self.chunksize == 0 and len(points) == total / self.chunksize:
+				points += [(total, inpos, d.copy(), tail)]
+			if not tail:
+				tail = self._rawread(inpos, 1<<16)
+				inpos += len(tail)
+				if not tail:
+					break
+			out = d.decompress(tail, self.chunksize - total % self.chunksize)
+			total += len(out)
+			tail = d.unconsumed_tail
+			if d.unused_data: # inizia un nuovo membro gzip (es. prodotto da pigz)
+				if d.unused_data[:2] != '\x1f\x8b': # ...o solo byte di riempimento
+					break
+				tail = d.unused_data
+				d = zlib.decompressobj(16+zlib.MAX_WBITS)
+		total += len(d.flush())
+		return total, points
+
+	def _inflate(self, n):
+		start = n * self.chunksize
+		point = self._points[bisect.bisect_right(self._outs, start) - 1]
+		if not _libz:
+			return self._inflate_state(*point)
+		out, inpos, bits, window = point
+		z = _Inflater(-15) # deflate puro, dal blocco del punto di ripresa
+		raw = 1
+		if bits:
+			z.prime(bits, ord(self._rawread(inpos - 1, 1)) >> (8 - bits))
+		window = zlib.decompress(window)
+		if window:
+			z.setdict(window)
+		skip = start - out # byte da scartare fino all'inizio del chunk
+		parts = []
+		want = self.chunksize
+		while want > 0:
+			if not z.pending():
+				data = self._rawread(inpos, 1<<16)
+				if not data:
+					break
+				z.feed(data)
+			ret, data, used = z.inflate(min(skip + want, 1<<20))
+			inpos += used
+			if skip:
+				k = min(skip, len(data))
+				data, skip = data[k:], skip - k
+			parts += [data[:want]]
+			want -= len(parts[-1])
+			if ret == Z_STREAM_END:
+				if raw: # il deflate puro non legge CRC e dimensione in coda al membro
+					inpos += 8
+				if self._rawread(inpos, 2) != '\x1f\x8b':
+					break
+				z.reset(31) # membro gzip successivo, con la sua intestazione
+				raw = 0
+		return ''.join(parts)
+
+	def _inflate_state(self, out, inpos, d, tail):
+		"_inflate con un punto di ripresa di _build_states"
+		d = d.copy() # il punto di ripresa deve restare intatto
+		parts = []
+		want = self.chunksize
+		while want > 0:
+			if not tail:
+				tail = self._rawread(inpos, 1<<16)
+				inpos += len(tail)
+				if not tail:
+					break
+			out = d.decompress(tail, want)
+			parts += [out]
+			want -= len(out)
+			tail = d.unconsumed_tail
+			if d.unused_data:
+				if d.unused_data[:2] != '\x1f\x8b':
+					break
+				tail = d.unused_data
+				d = zlib.decompressobj(16+zlib.MAX_WBITS)
+		return ''.join(parts)
+
+
+class ChunkedDiskFile(_ChunkedBase):
+	"Immagine nel formato a blocchi compressi indipendenti (vedi make_chunked_image)"
+	def _index(self):
+		magic, version, self.codec, self.chunksize, self.imagesize, n = \
+		CHUNKED_HEADER.unpack(self._rawread(0, CHUNKED_HEADER.size))
+		if magic != CHUNKED_MAGIC or version != 1:
+			raise IOError("%s non  un'immagine a blocchi compressi" % self._file.name)
+		if self.codec == CODEC_LZMA and not lzma:
+			raise IOError("modulo lzma non disponibile per %s" % self._file.name)
+		self._offsets = struct.unpack('<%dQ' % (n+1), self._rawread(CHUNKED_HEADER.size, 8*(n+1)))
+
+	def _inflate(self, n):
+		start, end = self._offsets[n], self._offsets[n+1]
+		data = self._rawread(start, end - start)
+		expected = min(self.chunksize, self.imagesize - n*self.chunksize)
+		if len(data) == expected: # blocco non compresso
+			return data
+		if self.codec == CODEC_LZMA:
+			return lzma.decompress(data)
+		return zlib.decompress(data)
+
+
+def make_chunked_image(src, dst, codec='zlib', chunksize=1<<20, level=6):
+	"Comprime un'immagine disco nel formato a blocchi letto da ChunkedDiskFile"
+	if codec == 'lzma':
+		if not lzma:
+			raise IOError("modulo lzma non disponibile")
+		codecid, compress = CODEC_LZMA, lambda s: lzma.compress(s, preset=level)
+	else:
+		codecid, compress = CODEC_ZLIB, lambda s: zlib.compress(s, level)
+	fin = open(src, 'rb')
+	fin.seek(0, 2)
+	imagesize = fin.tell()
+	fin.seek(0)
+	n = (imagesize + chunksize - 1) / chunksize
+	fout = open(dst, 'wb')
+	fout.write(CHUNKED_HEADER.pack(CHUNKED_MAGIC, 1, codecid, chunksize, imagesize, n))
+	offsets = [CHUNKED_HEADER.size + 8*(n+1)]
+	fout.seek(offsets[0])
+	for i in range(n):
+		chunk = fin.read(chunksize)
+		packed = compress(chunk)
+		if len(packed) >= len(chunk):
+			packed = chunk
+		fout.write(packed)
+		offsets += [offsets[-1] + len(packed)]
+	fout.seek(CHUNKED_HEADER.size)
+	fout.write(struct.pack('<%dQ' % (n+1), *offsets))
+	fout.close()
+	fin.close()
+
+
+if __name__ == '__main__':
+	if len(sys.argv) < 3:
+		print "Uso: CompressedImage.py <immagine> <immagine compressa> [zlib|lzma [dimensione blocco]]"
+		sys.exit(1)
+	codec = 'zlib'
+	chunksize = 1<<20
+	if len(sys.argv) > 3: codec = sys.argv[3]
+	if len(sys.argv) > 4: chunksize = int(sys.argv[4])
+	make_chunked_image(sys.argv[1], sys.argv[2], codec, chunksize)
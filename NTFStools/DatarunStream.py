@@ -1,48 +1,144 @@
 # -*- coding: mbcs -*-
 import array
+import bisect
 import logging
 
+class RunList(object):
+	"""Datarun decodificati di un attributo non residente, in byte, secondo la dimensione
+	effettiva del cluster: per ogni run la posizione iniziale nello stream (somma delle
+	lunghezze precedenti), la lunghezza e l'offset sul disco, o None se il run  sparso
+	(privo di cluster allocati). Un run si trova con una ricerca binaria (bisect)."""
+	def __init__ (self, clustersize=4096):
+		self.clustersize = clustersize
+		self.starts = [] # posizione di ogni run nello stream
+		self.lengths = []
+		self.offsets = [] # offset sul disco, o None se sparso
+		self.size = 0 # somma delle lunghezze
+
+	def __len__ (self):
+		return len(self.starts)
+
+	def __iter__ (self):
+		"Genera (posizione nello stream, lunghezza, offset sul disco o None) di ogni run"
+		for i in range(len(self.starts)):
+			yield self.starts[i], self.lengths[i], self.offsets[i]
+
+	def __str__ (self):
+		return '\n'.join(['%x: %x bytes @%s' % (start, length, offset is None and 'sparse' or '%x' % offset) \
+		for start, length, offset in self])
+
+	def append(self, length, offset):
+		"Aggiunge un run (offset None se sparso)"
+		self.starts += [self.size]
+		self.lengths += [length]
+		self.offsets += [offset]
+		self.size += length
+
+	def extend(self, runs):
+		"Accoda i run di un'altra RunList (es. il segmento successivo di un attributo)"
+		for start, length, offset in runs:
+			self.append(length, offset)
+
+	def locate(self, pos):
+		"Indice del run che contiene la posizione pos (-1 se nessuno)"
+		if pos >= self.size:
+			return -1
+		return bisect.bisect_right(self.starts, pos) - 1
+
+	def extents(self, offset, size):
+		"""Estensioni (offset sul disco o None se sparse, lunghezza) che compongono un tratto
+		dello stream; i run fisicamente contigui sono riuniti"""
+		extents = []
+		i = self.locate(offset)
+		while size > 0 and 0 <= i < len(self.starts):
+			todo = offset - self.starts[i]
+			n = min(size, self.lengths[i] - todo)
+			where = self.offsets[i]
+			if where is not None:
+				where += todo
+			last = extents and extents[-1]
+			if last and last[0] is None and where is None:
+				extents[-1] = (None, last[1] + n)
+			elif last and last[0] is not None and where == last[0] + last[1]:
+				extents[-1] = (last[0], last[1] + n)
+			else:
+				extents += [(where, n)]
+			offset += n
+			size -= n
+			i += 1
+		return extents
+
+
 class DatarunStream(object):
+	"""Stream virtuale sui datarun (RunList) di un attributo non residente. Legge dal disco
+	con read_at, senza spostarne il cursore: pi DatarunStream (ad esempio, duplicati con dup
+	per thread diversi) possono quindi leggere in parallelo dallo stesso DiskFile. I tratti
+	sparsi sono letti come zeri, senza accedere al disco."""
 	def __init__ (self, dataruns, size, diskstream):
 		self._runs = dataruns
 		self._disk = diskstream
-		self.curdatarun = 0 # indice del datarun per l'offset attuale
-		self.curdatarunpos = 0 # posizione nel datarun corrente
 		self.size = size # dimensione totale dello stream virtuale
 		self.seekpos = 0 # posizione virtuale nello stream virtuale
 
 	def read(self, size=-1):
 		buf = array.array('c')
-		logging.debug("read() loop with size=%d", size)
-		
+		debug = logging.root.isEnabledFor(logging.DEBUG)
+		if debug: logging.debug("read() loop with size=%d", size)
+
 		# legge tutto ci che avanza, non oltre la fine dello stream virtuale
 		if size < 0 or self.seekpos + size > self.size:
 			size = self.size - self.seekpos
-			logging.debug("size adjusted to %d", size)
-			
-		while size > 0:
-			self.seek(self.seekpos) # carica i dati relativi al datarun corrente
-			# non legge oltre la fine del datarun corrente
-			if self.curdatarunpos + size <= self._runs[self.curdatarun]:
-				logging.debug("reading %d bytes streampos=@%d, datarunpos=%d", size, self.seekpos, self.curdatarunpos)
-				buf += self._disk.read(size)
-				self.seekpos += size
-				break
-			else:
-				readsize = self._runs[self.curdatarun] - self.curdatarunpos # byte residui nel run
-				if not readsize:
-					logging.debug("readsize == 0 ending loop")
-					break
-				buf += self._disk.read(readsize)
-				self.seekpos += readsize
-				size -= readsize
-				logging.debug("read truncated to %d bytes (%d byte last) @streampos=%d, datarunpos=%d", readsize, size, self.seekpos, self.curdatarunpos)
+			if debug: logging.debug("size adjusted to %d", size)
+
+		extents = self.extents(self.seekpos, size)
+		wanted = [e for e in extents if e[0] is not None]
+		if len(extents) == 1 and wanted: # un solo datarun: passa per la cache del disco
+			buf += self._disk.read_at(*extents[0])
+		elif extents: # pi datarun: una lettura per gruppo di estensioni vicine
+			views = iter(wanted and self._disk.read_extents(wanted) or ())
+			for offset, length in extents:
+				if offset is None:
+					buf.fromstring(length*'\x00')
+				else:
+					buf.fromstring(views.next())
+		self.seekpos += len(buf)
 		return buf
-		
+
+	def extents(self, offset, size):
+		"Estensioni fisiche (offset sul disco, o None se sparse, e lunghezza) che compongono un tratto dello stream"
+		return self._runs.extents(offset, size)
+
+	def extent_map(self):
+		"""Mappa dello stream: lista di (posizione, lunghezza, dati), dove dati  falso per i
+		tratti sparsi (letti come zeri); i tratti contigui dello stesso tipo sono riuniti"""
+		map = []
+		pos = 0
+		for offset, length in self.extents(0, self.size):
+			data = offset is not None
+			if map and map[-1][2] == data:
+				map[-1] = (map[-1][0], map[-1][1] + length, data)
+			else:
+				map += [(pos, length, data)]
+			pos += length
+		return map
+
+	def copy_to(self, outstream):
+		"""Copia l'intero stream nel file outstream (dalla sua posizione corrente), un'estensione
+		fisica alla volta, direttamente dal disco (v. DiskFile.copy_extent): i tratti sparsi sono
+		saltati, e vanno poi fissati con truncate se lo stream termina con uno di essi"""
+		for offset, length in self.extents(0, self.size):
+			if offset is None:
+				outstream.seek(length, 1)
+			elif self._disk.copy_extent(offset, length, outstream) < length:
+				raise EOFError("estensione @%x oltre la fine del disco" % offset)
 
 	def tell(self):
 		return self.seekpos
-		
+
+	def dup(self):
+		"Nuovo cursore, indipendente, sugli stessi datarun"
+		return DatarunStream(self._runs, self.size, self._disk)
+
 	def seek(self, offset, whence=0):
 		if whence == 1:
 			self.seekpos += offset
@@ -50,18 +146,5 @@ class DatarunStream(object):
 			self.seekpos = self.size - offset
 		else:
 			self.seekpos = offset
-		i, todo = 0, self.seekpos
-		for i in range(2, len(self._runs), 2):
-			# se la posizione supera (o eguaglia: poich dobbiamo leggere
-			# il byte SUCCESSIVO) il primo intervallo...
-			self.curdatarun = i
-			self.curdatarunpos = todo
-			if todo >= self._runs[i]:
-				todo -= self._runs[i] # ,,,avanza al prossimo datarun
-				continue
-			else:
-				break
-		# Trovato il datarun in cui cade la posizione finale, eseguiamo il seek dal suo offset
-		logging.debug("seek @%x, datarun=%d, relativepos=%x", self.seekpos, i-2, todo)
-		# BUGBUG: pare che un problema con Index() si annidi qui: dev'essere il disco REALE, non quello emulato dal datarun, ke fa seek!
-		self._disk.seek(self._runs[i+1] + todo)
+		if logging.root.isEnabledFor(logging.DEBUG):
+			logging.debug("seek @%x, datarun=%d", self.seekpos, self._runs.locate(self.seekpos))
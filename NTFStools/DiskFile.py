@@ -1,151 +1,172 @@
 # -*- coding: mbcs -*-
 import array
-from collections import Counter, OrderedDict
+import ctypes
+import ctypes.util
+import errno
 import logging
+import mmap
+import os
+import re
+import stat
+import struct
+import sys
+import threading
+import time
+from NTFStools.Cache import *
+from NTFStools.IOStats import *
+from NTFStools.IOTrace import IOTrace
+try:
+	import fcntl
+except ImportError: # Windows
+	fcntl = None
 
-"""
-Come dovrebbe operare purge():
-- determinare la frequenza minima di servizio di un blocco; quindi
-- rimuovere il blocco pi anticamente inserito, con quella frequenza.
+# Lettura posizionale atomica, se il sistema la offre (Python 3.3+ su POSIX)
+pread = getattr(os, 'pread', None)
 
-In tal modo, gli elementi meno richiesti e pi vecchi sono eliminati per primi, 
-dando modo a quelli pi recenti di avere pi chance di richiamo.
+# ioctl Linux per i dispositivi a blocchi (linux/fs.h)
+BLKSSZGET = 0x1268 # dimensione logica del settore (int)
+BLKGETSIZE64 = 0x80081272 # dimensione del dispositivo in byte (u64)
 
-*** Proteggere l'ultimo elemento servito dall'eliminazione? ***
+# pread della libreria C, per leggere in un buffer allineato (O_DIRECT) e, in mancanza di
+# os.pread (Python 2), per le letture posizionali ordinarie
+_libc_pread = None
+if os.name == 'posix':
+	try:
+		_libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+		_libc_pread = getattr(_libc, 'pread64', None) or _libc.pread
+		_libc_pread.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t, ctypes.c_longlong]
+		_libc_pread.restype = ctypes.c_ssize_t
+	except (OSError, AttributeError):
+		_libc_pread = None
 
-Si possono usare diverse strategie per la manutenzione della cache.
 
-Una cache non purgata pu consumare memoria all'infinito, e ci non  auspicabile.
+def _ctypes_pread(fd, size, offset):
+	"""Come os.pread, con la pread della libreria C: ctypes rilascia il GIL durante la
+	chiamata, sicch le letture di pi thread si sovrappongono"""
+	buf = ctypes.create_string_buffer(size)
+	n = _libc_pread(fd, buf, size, offset)
+	if n < 0:
+		raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+	return buf.raw[:n]
 
-Dai risultati di cui innanzi, da test su un filesystem tipico di una chiavetta, appare che le prestazioni migliori
-(in termini di minor tempo per la manutenzione) si ottengono azzerando completamente la cache al 
-superamento della soglia.
+if not pread and _libc_pread:
+	pread = _ctypes_pread
 
-Il caching del solo ultimo blocco letto non si rivela tanto penalizzante (solo 5" di differenza).
+# copy_file_range e sendfile della libreria C (Linux), se Python non li offre (3.8+, 3.3+):
+# copiano dati tra due descrittori senza farli transitare per la memoria del processo
+_libc_copy_file_range = _libc_sendfile = None
+if sys.platform.startswith('linux'):
+	try:
+		_libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+		_libc_sendfile = _libc.sendfile64
+		_libc_sendfile.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(ctypes.c_longlong), ctypes.c_size_t]
+		_libc_sendfile.restype = ctypes.c_ssize_t
+		_libc_copy_file_range = _libc.copy_file_range # glibc 2.27+
+		_libc_copy_file_range.argtypes = [ctypes.c_int, ctypes.POINTER(ctypes.c_longlong), ctypes.c_int,
+		ctypes.POINTER(ctypes.c_longlong), ctypes.c_size_t, ctypes.c_uint]
+		_libc_copy_file_range.restype = ctypes.c_ssize_t
+	except (OSError, AttributeError):
+		pass
 
-Il metodo pi lento (di 1 minuto!)  invece quello che rimuove il pi antico blocco meno usato, anche
-perch l'elaborazione deve essere ripetuta a ogni inserimento di blocco successivo al superamento
-della soglia.
 
-Tale metodo, e anche quello che rimuove la met meno usata dei blocchi, sarebbero molto pi efficienti
-se si disponesse di una tabella gi ordinata per frequenza di servizio e si potesse rimuovere tutti gli 
-elementi voluti in *una* sola operazione.
+def _libc_check(n):
+	if n < 0:
+		raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+	return n
 
-FAT32 3,12GB in 12110 file e 491 cartelle
-no purge		6:37
-purge all		6:45
-purge half		6:49
-simple cache	6:50
-purge least used	7:45
-"""
-class Cache(object):
-	def __init__ (self, items=2000, itemsize=4096):
-		self.items = items
-		self.itemsize = itemsize
-		# dizionario di blocchi, ordinati per tempo di inserimento
-		self.cache = OrderedDict()
-		self.hits = OrderedDict()
 
-	def update(self, disk):
-		if len(disk.buf) > self.itemsize:
-			return
-		if disk.si in self.cache and len(disk.buf) <= len(self.cache[disk.si]):
-			self.hits[disk.si] += 1
-			return
-		if len(self.cache) > self.items:
-			self.purge()
-		self.cache[disk.si] = disk.buf
-		self.hits[disk.si] = 0
-	
-	def purge0(self):
-		"*NON* azzera la cache: ma spreca memoria illimitatamente!"
-		pass
-		
-	def purge1(self):
-		"Azzera la cache non appena piena"
-		self.cache = OrderedDict()
-		self.hits = OrderedDict()
-		
-	def purge2(self):
-		"Elimina il primo blocco meno frequentemente usato"
-		# Determina la frequenza minima di riciclo di un blocco
-		minfreq = Counter(self.hits).most_common()[-2][1]
-		# Determina il blocco pi vecchio con tale frequenza
-		i = self.hits.values().index(minfreq)
-		# Determina il n di blocco corrispondente
-		key = self.hits.keys()[i]
-		# Lo rimuove dalla cache
-		del self.cache[key]
-		del self.hits[key]
-
-	def purge3(self):
-		"Elimina la met dei blocchi meno usati"
-		#Errore nel canc. chiave inesistente?
-		half_commons = Counter(self.hits).most_common(self.items/2)
-		g = set(self.hits)
-		h = set(half_commons)
-		for key in (g - h):
-			del self.cache[key]
-			del self.hits[key]
-		#~ self.hits = OrderedDict(dict(half_commons))
-	
-	purge = purge1
-	
-	def retrieve(self, disk):
-		if disk.si in self.cache and disk.asize <= len(self.cache[disk.si]):
-			disk.buf = self.cache[disk.si]
-			return 1
-		return 0
-
-	def print_stats(self):
-		#~ logging.info("Voci di cache in memoria:", len(self.hits))
-		print "Voci di cache in memoria:", len(self.hits)
-		#~ logging.info("Voci di cache riscontrate:")
-		print "Voci di cache riscontrate:"
-		for i, freq in self.hits.iteritems():
-			if freq < 1: continue
-			logging.info("Blocco %Xh, %d volte.", i, freq)
-			print "Blocco %Xh, %d volte." % (i, freq)
-
-
-class SimpleCache(object):
-	"Semplice cache che registra e serve solo l'ultimo blocco letto"
-	def __init__ (self, itemsize=4096):
-		self.itemsize = itemsize
-		self.hits = 0
-		
-	def update(self, disk):
-		pass
-		
-	def retrieve(self, disk):
-		if disk.si == disk.lastsi and len(disk.buf) == disk.asize:
-			self.hits += 1
-			return 1
-		return 0
-		
-	def print_stats(self):
-		print "Riscontri dalla cache", self.hits
-		
-		
-#~ diskcache = Cache()
-diskcache = SimpleCache()
+def copy_file_range(infd, outfd, inoffset, outoffset, size):
+	"Copia nel kernel size byte (o meno) tra due descrittori, dalle posizioni indicate"
+	if hasattr(os, 'copy_file_range'):
+		return os.copy_file_range(infd, outfd, size, inoffset, outoffset)
+	if not _libc_copy_file_range:
+		raise OSError(errno.ENOSYS, "copy_file_range non disponibile")
+	inoff, outoff = ctypes.c_longlong(inoffset), ctypes.c_longlong(outoffset)
+	return _libc_check(_libc_copy_file_range(infd, ctypes.byref(inoff), outfd, ctypes.byref(outoff), size, 0))
+
+
+def sendfile(infd, outfd, inoffset, outoffset, size):
+	"Come copy_file_range, con sendfile (che ammette anche un dispositivo a blocchi come origine)"
+	os.lseek(outfd, outoffset, 0) # sendfile scrive alla posizione corrente
+	if hasattr(os, 'sendfile'):
+		return os.sendfile(outfd, infd, inoffset, size)
+	if not _libc_sendfile:
+		raise OSError(errno.ENOSYS, "sendfile non disponibile")
+	return _libc_check(_libc_sendfile(outfd, infd, ctypes.byref(ctypes.c_longlong(inoffset)), size))
+
+
+def blockdevice_geometry(fd):
+	"Dimensione in byte e settore logico di un dispositivo a blocchi Linux"
+	size = struct.unpack('Q', fcntl.ioctl(fd, BLKGETSIZE64, struct.pack('Q', 0)))[0]
+	sector = struct.unpack('i', fcntl.ioctl(fd, BLKSSZGET, struct.pack('i', 0)))[0]
+	return size, sector
 
 
 class DiskFile(object):
 	"""Un disco pu essere aperto come un file, tuttavia: 1) read, write, seek devono essere allineate
 	a settori di 512 byte; 2) seek dalla fine non  ammesso; 3) seek oltre la fine seguito
-	da una lettura non d errori."""
+	da una lettura non d errori.
+
+	DiskFile legge quindi blocchi interi, conservandoli in una propria cache (per default LRU,
+	16 MiB; vedi Cache.py): ogni istanza ha la sua, cos la FAT e i dati, o la MFT e gli
+	indici, non si contendono la stessa memoria. Le letture di almeno bypass byte vanno
+	direttamente al disco, per non svuotare la cache con dati che non saranno riletti.
+
+	Se le letture procedono in sequenza (ciascuna inizia dove finiva la precedente) o con
+	passo costante, a ogni blocco mancante DiskFile legge anche i successivi, con una
+	finestra di read-ahead che raddoppia fino a readahead byte; un accesso casuale la
+	dimezza. Cos chi legge slot di directory da 32 byte o record MFT da 1 KiB ottiene
+	quasi le prestazioni di una lettura in blocco (vedi la nota in FATtools/FAT.py).
+
+	read_at legge da una posizione assoluta senza toccare il cursore dell'oggetto: i
+	thread possono condividere un solo DiskFile (e un solo handle del disco), usando
+	ciascuno i propri cursori: DatarunStream, Chain o i duplicati ottenuti con dup.
+
+	Su Linux un dispositivo a blocchi (/dev/sdX, /dev/sdX1...)  riconosciuto: la sua
+	dimensione e il settore logico sono ricavati con gli ioctl BLKGETSIZE64 e BLKSSZGET
+	(per un file immagine, la dimensione  quella del file), sicch anche seek dalla fine
+	funziona. Con direct=1, le letture in blocco (di almeno bypass byte) avvengono in
+	O_DIRECT su buffer allineati: copiando gigabyte di dati non si svuota la page cache
+	del sistema, di cui altri servizi potrebbero avere bisogno.
+
+	enable_stats collega un oggetto IOStats (vedi IOStats.py) che registra richieste,
+	letture fisiche, distanze di seek, latenze e riscontri della cache; record_trace
+	registra la sequenza delle richieste, da riprodurre poi con IOTrace.py.
+
+	copy_extent copia un tratto del disco direttamente in un file: se le posizioni del disco
+	sono quelle del file aperto (rawfile), con copy_file_range o sendfile, altrimenti a grossi
+	blocchi allineati, senza mai passare per la cache."""
+
+	rawfile = 1 # le posizioni del disco sono quelle di self._file
 	
-	def __init__(self, name, mode='rb', buffering=0, size=0):
+	def __init__(self, name, mode='rb', buffering=0, size=0, cache=None, blocksize=4096, bypass=1<<20, readahead=4<<20, direct=0):
 		self.pos = 0 # posizione lineare
-		self.si = 0 # n di blocco
-		self.so = 0 # offset nel blocco
-		self.lastsi = 0 # ultimo blocco letto dal *disco*
 		self.size = size # dimensione del filesystem (se nota)
 		self._file = open(name, mode, buffering)
-		self.buf = ''
-		self.blocksize = diskcache.itemsize
-		self.cache = diskcache
+		self._lock = threading.Lock() # serializza seek+read, in mancanza di pread
+		self.sectorsize = 512 # settore logico del disco
+		st = os.fstat(self._file.fileno())
+		if stat.S_ISBLK(st.st_mode) and fcntl:
+			devsize, self.sectorsize = blockdevice_geometry(self._file.fileno())
+			if not self.size: self.size = devsize
+		elif stat.S_ISREG(st.st_mode) and not self.size:
+			self.size = st.st_size
+		if blocksize % self.sectorsize:
+			blocksize = (blocksize/self.sectorsize + 1) * self.sectorsize
+		self.blocksize = blocksize # unit di lettura (multipla del settore)
+		self.bypass = bypass
+		self._direct = None # descrittore aperto in O_DIRECT
+		if direct:
+			self._opendirect(name)
+		self.stats = None # strumentazione (IOStats), se attiva
+		self.tag = None # etichetta fissa delle letture (altrimenti, quella del thread)
+		self.trace = None # traccia delle richieste (IOTrace), se in registrazione
+		self.cache = makecache(cache)
+		self.readahead = readahead # finestra massima di read-ahead, in byte (0=disattivato)
+		self.window = 0 # finestra di read-ahead attuale
+		self._lastpos = -1 # inizio dell'ultima lettura
+		self._lastend = -1 # fine dell'ultima lettura
+		self._stride = 0 # passo tra le ultime due letture
 
 	def seek(self, offset, whence=0):
 		if whence == 1:
@@ -157,39 +178,353 @@ class DiskFile(object):
 				self.pos = 0
 		else:
 			self.pos = offset
-		self.si = self.pos / self.blocksize
-		self.so = self.pos % self.blocksize
-		if self.si == self.lastsi:
-			return # non sposta la testina di lettura se il settore  invariato
-		self._file.seek(self.si*self.blocksize)
-		#~ logging.debug("DiskFile seek @%Xh", self.si*self.blocksize)
-		#~ logging.debug("si=%Xh lastsi=%Xh so=%Xh", self.si,self.lastsi,self.so)
 		
 	def tell(self): return self.pos
+
+	def enable_stats(self):
+		"Attiva la strumentazione dell'I/O, restituendo l'oggetto IOStats"
+		if not self.stats:
+			self.stats = IOStats()
+		return self.stats
+
+	def record_trace(self, name):
+		"Registra nel file indicato la sequenza delle richieste, fino a stop_trace o close"
+		self.stop_trace()
+		self.trace = IOTrace(name)
+		return self.trace
+
+	def stop_trace(self):
+		if self.trace:
+			self.trace.close()
+			self.trace = None
+
+	def close(self):
+		self.stop_trace()
+		if self._direct is not None:
+			os.close(self._direct)
+			self._direct = None
+		self._file.close()
+
+	def dup(self, cache=None):
+		"""Nuovo cursore sullo stesso handle del disco; usa la cache indicata o, in
+		mancanza, condivide quella di questo oggetto"""
+		new = object.__new__(self.__class__)
+		new.__dict__.update(self.__dict__)
+		new.pos = 0
+		new.window, new._lastpos, new._lastend, new._stride = 0, -1, -1, 0
+		if cache is not None:
+			new.cache = makecache(cache)
+		return new
+
+	def _pread(self, offset, size):
+		"Legge size byte dalla posizione assoluta offset del disco, in modo sicuro tra thread"
+		if pread:
+			fd = self._file.fileno()
+			s = pread(fd, size, offset)
+			while len(s) < size: # le letture posizionali possono essere parziali
+				t = pread(fd, size-len(s), offset+len(s))
+				if not t: break
+				s += t
+			return s
+		with self._lock:
+			self._file.seek(offset)
+			return self._file.read(size)
+
+	def _opendirect(self, name):
+		if not _libc_pread or not hasattr(os, 'O_DIRECT'):
+			logging.warning("O_DIRECT non disponibile su questo sistema")
+			return
+		try:
+			self._direct = os.open(name, os.O_RDONLY | os.O_DIRECT)
+		except OSError, e:
+			logging.warning("Impossibile aprire %s in O_DIRECT: %s", name, e)
+
+	def _pread_direct(self, offset, size):
+		"Legge in O_DIRECT, allineando posizione e lunghezza al settore e il buffer alla pagina"
+		align = max(self.sectorsize, 512)
+		start = offset - offset % align
+		end = (offset + size + align - 1) / align * align
+		buf = mmap.mmap(-1, end-start) # memoria anonima, allineata alla pagina
+		addr = ctypes.addressof(ctypes.c_char.from_buffer(buf))
+		done = 0
+		while done < end-start:
+			n = _libc_pread(self._direct, addr+done, end-start-done, start+done)
+			if n < 0:
+				raise IOError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+			if not n: break
+			done += n
+		return buf[offset-start : min(offset-start+size, done)]
+
+	def _io(self, read, offset, size):
+		"Esegue una lettura fisica, registrandola se la strumentazione  attiva"
+		if not self.stats:
+			return read(offset, size)
+		t = time.time()
+		data = read(offset, size)
+		self.stats.read(offset, len(data), time.time() - t, self.tag)
+		return data
+
+	def _bulkread(self, offset, size):
+		"Lettura di un grosso blocco di dati, in O_DIRECT se richiesto"
+		if self._direct is not None and size >= self.bypass:
+			return self._io(self._pread_direct, offset, size)
+		return self._io(self._pread, offset, size)
+
+	def _readblocks(self, si, count):
+		"Legge dal disco count blocchi consecutivi a partire dal blocco si"
+		#~ logging.debug("DiskFile: letti %d blocchi dal blocco %Xh", count, si)
+		return self._io(self._pread, si*self.blocksize, count*self.blocksize)
+
+	def _blocks(self, si, se, ahead=0):
+		"""Restituisce i blocchi da si a se (escluso), dalla cache o dal disco; se occorre
+		leggere dal disco l'ultimo tratto, vi aggiunge fino a ahead blocchi successivi"""
+		blocks = []
+		bs = self.blocksize
+		i = si
+		hits = misses = 0
+		while i < se:
+			data = self.cache.get(i)
+			if data is not None:
+				blocks += [data]
+				hits += 1
+				i += 1
+				continue
+			# Raccoglie in un'unica lettura i blocchi mancanti consecutivi
+			j = i + 1
+			while j < se and j not in self.cache:
+				j += 1
+			if j == se: # read-ahead, fino al primo blocco gi in cache
+				while j < se + ahead and j not in self.cache:
+					j += 1
+			data = self._readblocks(i, j-i)
+			misses += j-i
+			for k in range(0, len(data), bs):
+				block = data[k:k+bs]
+				self.cache.put(i + k/bs, block)
+				if i + k/bs < se:
+					blocks += [block]
+			if len(data) < (j-i)*bs: # fine del disco
+				break
+			i = j
+		if self.stats:
+			self.stats.cache(hits, misses, self.tag)
+		return blocks
+
+	def _detect(self, pos, size):
+		"Adatta la finestra di read-ahead alla sequenza degli accessi"
+		stride = pos - self._lastpos
+		if pos == self._lastend or (stride > 0 and stride == self._stride and stride <= self.readahead):
+			self.window = min(max(2*self.window, 2*self.blocksize), self.readahead)
+		else:
+			self.window /= 2
+			if self.window < 2*self.blocksize:
+				self.window = 0
+		self._stride = stride
+		self._lastpos = pos
+		self._lastend = pos + size
 		
 	def read(self, size=-1):
-		self.seek(self.pos)
+		buf = self.read_at(self.pos, size)
+		self.pos += len(buf)
+		return buf
+
+	def read_at(self, offset, size=-1):
+		"Legge size byte dalla posizione offset, senza usare n spostare il cursore"
 		# Se la q.t  negativa, la aggiusta...
 		if size < 0:
 			size = 0
-			if self.size: size = self.size
+			if self.size: size = self.size - offset
 		# Se la q.t eccede la dimensione del file, la limita a essa
-		if self.size and self.pos + size > self.size:
-			size = self.size - self.pos
-		se = (self.pos+size)/self.blocksize
-		if (self.pos+size)%self.blocksize:
-			se += 1
-		self.asize = (se - self.si) * self.blocksize # n di blocchi interi da leggere
-		# Se la q.t da leggere  nella cache...
-		if self.cache.retrieve(self):
-			#~ logging.debug("letti %d byte dalla cache" % self.asize)
-			self.pos += size
-			self.cache.update(self)
-			return self.buf[self.so : self.so+size]
-		self.buf = array.array('c')
-		self.buf.fromfile(self._file, self.asize)
-		self.lastsi = self.si
-		self.pos += size
-		#~ logging.debug("letti %d byte dal disco" % self.asize)
-		self.cache.update(self)
-		return self.buf[self.so : self.so+size]
+		if self.size and offset + size > self.size:
+			size = self.size - offset
+		buf = array.array('c')
+		if size <= 0:
+			return buf
+		if self.stats:
+			self.stats.request(size, self.tag)
+		if self.trace:
+			self.trace.record(offset, size)
+		si = offset / self.blocksize # n di blocco
+		so = offset % self.blocksize # offset nel blocco
+		se = (offset + size + self.blocksize - 1) / self.blocksize
+		if self.readahead:
+			self._detect(offset, size)
+		if size >= self.bypass:
+			data = self._bulkread(si*self.blocksize, (se - si)*self.blocksize)
+		else:
+			data = ''.join(self._blocks(si, se, self.window/self.blocksize))
+		buf.fromstring(buffer(data, so, size))
+		return buf
+
+	def _groups(self, extents, gap):
+		"""Ordina le estensioni (offset, lunghezza) e fonde quelle adiacenti o distanti
+		meno di gap byte: restituisce i gruppi [inizio, fine, indici delle estensioni]"""
+		groups = []
+		for i in sorted(range(len(extents)), key=lambda i: extents[i][0]):
+			offset, size = extents[i]
+			if groups and offset <= groups[-1][1] + gap:
+				group = groups[-1]
+				group[1] = max(group[1], offset+size)
+				group[2] += [i]
+			else:
+				groups += [[offset, offset+size, [i]]]
+		return groups
+
+	def read_extents(self, extents, gap=65536):
+		"""Legge una lista di estensioni (offset, lunghezza) del disco, restituendo nello
+		stesso ordine una vista (buffer) sui dati di ciascuna. Le estensioni vicine sono
+		lette con una sola chiamata per gruppo, senza passare per la cache: i byte che le
+		separano (meno di gap) costano meno di una chiamata di sistema in pi."""
+		views = [None] * len(extents)
+		if self.stats:
+			self.stats.request(sum([size for offset, size in extents]), self.tag)
+		if self.trace:
+			self.trace.batch(extents)
+		for start, end, members in self._groups(extents, gap):
+			data = self._bulkread(start, end-start)
+			for i in members:
+				offset, size = extents[i]
+				views[i] = buffer(data, offset-start, size)
+		return views
+
+
+	def _kernelcopy(self, offset, size, outstream):
+		"""Copia con copy_file_range o, se non riesce (file system diversi, dispositivo a
+		blocchi, sistema che non li offre...), con sendfile; restituisce i byte copiati"""
+		try:
+			outstream.flush()
+			outfd = outstream.fileno()
+			outpos = outstream.tell()
+		except (AttributeError, IOError, ValueError): # non  un file del sistema
+			return 0
+		infd = self._file.fileno()
+		done = 0
+		for copy in (copy_file_range, sendfile):
+			try:
+				while done < size:
+					t = time.time()
+					n = copy(infd, outfd, offset+done, outpos+done, min(size-done, 1<<30))
+					if self.stats:
+						self.stats.read(offset+done, n, time.time() - t, self.tag)
+					if not n: # fine del disco
+						break
+					done += n
+				break
+			except OSError, e:
+				logging.debug("%s non riuscita (%s)", copy.__name__, e)
+		outstream.seek(outpos + done)
+		return done
+
+	def copy_extent(self, offset, size, outstream, bufsize=8<<20):
+		"""Copia size byte dalla posizione offset del disco nel file outstream, alla sua
+		posizione corrente; restituisce i byte copiati (meno di size alla fine del disco)"""
+		if self.size and offset + size > self.size:
+			size = max(0, self.size - offset)
+		if self.stats:
+			self.stats.request(size, self.tag)
+		if self.trace:
+			self.trace.record(offset, size)
+		done = 0
+		if self.rawfile and size:
+			done = self._kernelcopy(offset, size, outstream)
+		# Altrimenti, a blocchi di bufsize byte allineati al settore (in O_DIRECT se attivo)
+		bufsize -= bufsize % self.sectorsize
+		while done < size:
+			n = min(size - done, bufsize - (offset + done) % self.sectorsize)
+			data = self._bulkread(offset + done, n)
+			if not data:
+				break
+			outstream.write(data)
+			done += len(data)
+		return done
+
+
+class MappedDiskFile(DiskFile):
+	"""Immagine disco (file regolare) mappata in memoria.
+
+	Il contratto di seek, tell e read  quello di DiskFile: ma una lettura non richiede
+	chiamate di sistema, n la lettura di blocchi interi da ritagliare in seguito, bens
+	una sola copia dalla mappa. Il metodo view restituisce invece una vista di sola
+	lettura (buffer) sulla mappa, senza alcuna copia, per chi non deve modificare i
+	dati letti (ad esempio applicando il fixup).
+
+	Su un Python a 32 bit lo spazio di indirizzamento limita la dimensione dell'immagine."""
+
+	def __init__(self, name, mode='rb', buffering=0, size=0, cache=None):
+		DiskFile.__init__(self, name, mode, buffering, size, cache)
+		self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+		if not self.size:
+			self.size = len(self._map)
+
+	def seek(self, offset, whence=0):
+		if whence == 1:
+			self.pos += offset
+		elif whence == 2:
+			if offset < self.size:
+				self.pos = self.size - offset
+			else:
+				self.pos = 0
+		else:
+			self.pos = offset
+
+	def _clamp(self, offset, size):
+		"Limita la quantit da leggere alla fine dell'immagine"
+		if size < 0 or offset + size > self.size:
+			size = self.size - offset
+		return max(size, 0)
+
+	def _pread(self, offset, size):
+		return self._map[offset:offset+self._clamp(offset, size)]
+
+	def read_at(self, offset, size=-1):
+		buf = array.array('c')
+		buf.fromstring(self.view_at(offset, size))
+		return buf
+
+	def view(self, size=-1):
+		"Come read, ma restituisce una vista sulla mappa anzich una copia"
+		buf = self.view_at(self.pos, size)
+		self.pos += len(buf)
+		return buf
+
+	def view_at(self, offset, size=-1):
+		"Come read_at, ma restituisce una vista sulla mappa anzich una copia"
+		size = self._clamp(offset, size)
+		if self.stats:
+			self.stats.request(size, self.tag)
+		if self.trace:
+			self.trace.record(offset, size)
+		return buffer(self._map, offset, size)
+
+	def read_extents(self, extents, gap=0):
+		"Nessuna lettura  necessaria: restituisce le viste sulla mappa"
+		if self.stats:
+			self.stats.request(sum([size for offset, size in extents]), self.tag)
+		if self.trace:
+			self.trace.batch(extents)
+		return [buffer(self._map, offset, self._clamp(offset, size)) for offset, size in extents]
+
+	def close(self):
+		self._map.close()
+		DiskFile.close(self)
+
+
+def opendisk(name, mode='rb', buffering=0, size=0, cache=None, direct=0):
+	"""Apre un disco o un'immagine, scegliendo la classe DiskFile pi adatta: un file
+	immagine  mappato in memoria, salvo si chieda di aggirare la page cache (direct);
+	un'immagine compressa (gzip o a blocchi)  aperta in sola lettura con CompressedImage,
+	una suddivisa in segmenti (disk.001, disk.002...) con SegmentedImage"""
+	if type(name) in (type([]), type(())) or re.search(r'\.0*1$', name):
+		from NTFStools.SegmentedImage import SegmentedDiskFile, find_segments
+		if type(name) in (type([]), type(())) or len(find_segments(name)) > 1:
+			return SegmentedDiskFile(name, mode, buffering, size, cache)
+	if os.path.isfile(name):
+		magic = open(name, 'rb').read(8)
+		if magic[:2] == '\x1f\x8b' or magic == 'PDTCHUNK':
+			from NTFStools.CompressedImage import GzipDiskFile, ChunkedDiskFile
+			if magic[:2] == '\x1f\x8b':
+				return GzipDiskFile(name, mode, buffering, size, cache)
+			return ChunkedDiskFile(name, mode, buffering, size, cache)
+	if not direct and 'w' not in mode and '+' not in mode and os.path.isfile(name) and os.path.getsize(name):
+		return MappedDiskFile(name, mode, buffering, size, cache)
+	return DiskFile(name, mode, buffering, size, cache, direct=direct)
@@ -0,0 +1,159 @@
+# -*- coding: mbcs -*-
+import json
+import threading
+
+"""
+Strumentazione dell'I/O su disco
+================================
+
+Un oggetto IOStats, collegato a un DiskFile con enable_stats(), registra:
+
+- le richieste logiche (read, read_at, read_extents) e i byte richiesti;
+- le letture fisiche (chiamate di sistema), i byte letti e la loro latenza;
+- la distanza di ogni lettura fisica dalla fine della precedente (seek);
+- riscontri e mancati della cache di blocchi.
+
+Ogni evento  attribuito all'etichetta corrente del thread, impostata dal chiamante con iotag
+prima di leggere: 'boot' (settore di avvio), 'mft' (record MFT), 'indx' (blocchi INDX),
+'dirslot' (slot di directory FAT), 'data' (contenuto dei file). Un DiskFile duplicato per
+un solo uso pu invece avere un'etichetta fissa nell'attributo tag:  il caso della FAT
+('fat'), letta a pi riprese durante la lettura di una catena.
+
+Latenze e distanze sono raccolte in istogrammi a potenze di 2: i percentili sono quindi
+approssimati al limite superiore della classe. A strumentazione disattivata (stats = None,
+il default) il costo si riduce a un test per lettura.
+"""
+
+__all__ = ['IOStats', 'iotag']
+
+
+def _log2class(n):
+	"Classe dell'istogramma: il minimo k tale che n < 2**k"
+	return int(n).bit_length()
+
+
+class _Counters(object):
+	"Contatori di una singola etichetta"
+	def __init__ (self):
+		self.requests = 0 # richieste logiche
+		self.requested = 0 # byte richiesti
+		self.reads = 0 # letture fisiche (chiamate di sistema)
+		self.bytes = 0 # byte letti fisicamente
+		self.hits = 0 # blocchi serviti dalla cache
+		self.misses = 0 # blocchi letti dal disco
+		self.seeks = {} # classe della distanza: frequenza
+		self.latency = {} # classe della latenza in microsecondi: frequenza
+
+	def export(self):
+		blocks = self.hits + self.misses
+		return {'requests': self.requests, 'requested_bytes': self.requested,
+		'reads': self.reads, 'bytes_read': self.bytes,
+		'cache_hits': self.hits, 'cache_misses': self.misses,
+		'cache_hit_ratio': blocks and float(self.hits)/blocks or 0.0,
+		'seek_histogram': _histogram(self.seeks), 'latency_us_histogram': _histogram(self.latency),
+		'latency_us_percentiles': _percentiles(self.latency, (50, 90, 99, 100))}
+
+
+def _histogram(h):
+	"Istogramma esportabile: limite superiore della classe (escluso): frequenza"
+	return [(1 << k, h[k]) for k in sorted(h)]
+
+
+def _percentiles(h, wanted):
+	"Percentili approssimati (limite superiore della classe) di un istogramma a potenze di 2"
+	total = sum(h.values())
+	result = {}
+	for p in wanted:
+		need = total * p / 100.0
+		seen = 0
+		for k in sorted(h):
+			seen += h[k]
+			if seen >= need:
+				result['p%d' % p] = 1 << k
+				break
+	return result
+
+
+class IOStats(object):
+	"Statistiche di I/O di un DiskFile, per etichetta del chiamante"
+	def __init__ (self):
+		self._local = threading.local()
+		self._lock = threading.Lock()
+		self._tags = {}
+		self._lastend = None # fine dell'ultima lettura fisica
+
+	def settag(self, tag):
+		self._local.tag = tag
+
+	def _counters(self, tag=None):
+		tag = tag or getattr(self._local, 'tag', None) or 'other'
+		c = self._tags.get(tag)
+		if c is None:
+			c = self._tags.setdefault(tag, _Counters())
+		return c
+
+	def request(self, size, tag=None):
+		"Registra una richiesta logica di size byte"
+		c = self._counters(tag)
+		with self._lock:
+			c.requests += 1
+			c.requested += size
+
+	def cache(self, hits, misses, tag=None):
+		"Registra i blocchi serviti dalla cache e quelli da leggere"
+		c = self._counters(tag)
+		with self._lock:
+			c.hits += hits
+			c.misses += misses
+
+	def read(self, offset, size, seconds, tag=None):
+		"Registra una lettura fisica"
+		c = self._counters(tag)
+		with self._lock:
+			c.reads += 1
+			c.bytes += size
+			if self._lastend is not None:
+				k = _log2class(abs(offset - self._lastend))
+				c.seeks[k] = c.seeks.get(k, 0) + 1
+			self._lastend = offset + size
+			k = _log2class(seconds * 1000000)
+			c.latency[k] = c.latency.get(k, 0) + 1
+
+	def export(self, disk=None):
+		"Tutte le statistiche, per etichetta e complessive, in un dizionario"
+		total = _Counters()
+		tags = {}
+		with self._lock:
+			for tag, c in self._tags.items():
+				tags[tag] = c.export()
+				for k in ('requests', 'requested', 'reads', 'bytes', 'hits', 'misses'):
+					setattr(total, k, getattr(total, k) + getattr(c, k))
+				for h in ('seeks', 'latency'):
+					th = getattr(total, h)
+					for k, v in getattr(c, h).items():
+						th[k] = th.get(k, 0) + v
+		result = {'total': total.export(), 'tags': tags}
+		if disk is not None and getattr(disk, 'cache', None) is not None:
+			result['cache'] = disk.cache.stats()
+		if disk is not None and getattr(disk, 'dentries', None) is not None:
+			result['dentries'] = disk.dentries.stats()
+		return result
+
+	def dump(self, fp, disk=None):
+		"Esporta le statistiche in JSON su un file (aperto o da creare)"
+		if type(fp) in (type(''), type(u'')):
+			out = open(fp, 'w')
+			json.dump(self.export(disk), out, indent=1, sort_keys=True)
+			out.close()
+		else:
+			json.dump(self.export(disk), fp, indent=1, sort_keys=True)
+
+
+def iotag(obj, tag):
+	"""Etichetta le prossime letture del thread corrente; obj  il DiskFile o uno stream
+	che vi legge (DatarunStream, Chain, Boot FAT...). Non fa nulla a strumentazione spenta"""
+	for attr in ('_disk', 'stream'):
+		obj = getattr(obj, attr, obj)
+	stats = getattr(obj, 'stats', None)
+	if stats:
+		stats.settag(tag)
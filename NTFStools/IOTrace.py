@@ -0,0 +1,129 @@
+# -*- coding: mbcs -*-
+import struct
+import sys
+import threading
+import time
+
+"""
+Registrazione e riproduzione delle tracce di I/O
+================================================
+
+I dischi dei clienti non possono uscire dalla sede, ma il modo in cui li leggiamo s. Con
+record_trace(nomefile) un DiskFile registra la sequenza delle richieste ricevute (read, read_at,
+read_extents), ad esempio durante una visita completa dell'albero o la copia di un hive del
+registro; replay_trace ripete poi la stessa sequenza su un file locale di dimensioni adeguate,
+con qualunque classe DiskFile, politica e dimensione della cache, finestra di read-ahead.
+Si confrontano cos le impostazioni a parit di carico, fuori sede e in modo riproducibile.
+
+Il formato della traccia  binario e compatto:
+
+	0x00	8s	firma 'PDTTRACE'
+	0x08	<I	versione (1)
+	0x0C	...	record <QQ: offset e lunghezza di ogni richiesta
+
+Una richiesta read_extents  registrata come un record marcatore (offset 2**64-1), la cui
+lunghezza indica il numero n delle estensioni, seguito dagli n record delle estensioni stesse.
+Sono registrate le richieste logiche, non le letture fisiche: queste dipendono proprio dalla
+cache e dal read-ahead che si vogliono confrontare.
+"""
+
+__all__ = ['IOTrace', 'read_trace', 'replay_trace', 'TRACE_MAGIC']
+
+TRACE_MAGIC = 'PDTTRACE'
+TRACE_HEADER = struct.Struct('<8sI')
+TRACE_RECORD = struct.Struct('<QQ')
+TRACE_BATCH = 0xFFFFFFFFFFFFFFFF # marcatore di una richiesta read_extents
+
+
+class IOTrace(object):
+	"Scrive una traccia delle richieste di I/O; pi thread possono registrarvi insieme"
+	def __init__ (self, name):
+		self._file = open(name, 'wb')
+		self._file.write(TRACE_HEADER.pack(TRACE_MAGIC, 1))
+		self._lock = threading.Lock()
+		self.records = 0 # richieste registrate
+
+	def record(self, offset, size):
+		"Registra una richiesta read o read_at"
+		with self._lock:
+			self._file.write(TRACE_RECORD.pack(offset, size))
+			self.records += 1
+
+	def batch(self, extents):
+		"Registra una richiesta read_extents"
+		s = TRACE_RECORD.pack(TRACE_BATCH, len(extents)) + \
+		''.join([TRACE_RECORD.pack(offset, size) for offset, size in extents])
+		with self._lock:
+			self._file.write(s)
+			self.records += 1
+
+	def close(self):
+		with self._lock:
+			if not self._file.closed:
+				self._file.close()
+
+
+def read_trace(name):
+	"Genera le richieste di una traccia: (offset, lunghezza) o la lista delle estensioni"
+	f = open(name, 'rb')
+	magic, version = TRACE_HEADER.unpack(f.read(TRACE_HEADER.size))
+	if magic != TRACE_MAGIC or version != 1:
+		raise IOError("%s non  una traccia di I/O" % name)
+	size = TRACE_RECORD.size
+	while 1:
+		s = f.read(size)
+		if len(s) < size:
+			break
+		offset, length = TRACE_RECORD.unpack(s)
+		if offset == TRACE_BATCH:
+			s = f.read(length*size)
+			yield [TRACE_RECORD.unpack_from(s, i*size) for i in range(len(s)/size)]
+		else:
+			yield offset, length
+	f.close()
+
+
+def replay_trace(disk, name):
+	"""Ripete su un DiskFile le richieste di una traccia; restituisce il numero delle
+	richieste, i byte richiesti e la durata in secondi"""
+	requests = requested = 0
+	t = time.time()
+	for req in read_trace(name):
+		if type(req) == type([]):
+			disk.read_extents(req)
+			requested += sum([size for offset, size in req])
+		else:
+			disk.read_at(*req)
+			requested += req[1]
+		requests += 1
+	return requests, requested, time.time() - t
+
+
+if __name__ == '__main__':
+	if len(sys.argv) < 3:
+		print """Uso: IOTrace.py <traccia> <immagine> [classe [politica [cache [read-ahead]]]]
+
+  classe: auto (scelta da opendisk, il default), disk (DiskFile), mmap o direct (O_DIRECT)
+  politica: lru (il default), 2q, arc o clock
+  cache e read-ahead: dimensioni in KiB (per default 16384 e 4096)"""
+		sys.exit(1)
+	from NTFStools.DiskFile import *
+	from NTFStools.Cache import makecache
+	args = sys.argv[3:] + [None]*4
+	backend = args[0] or 'auto'
+	cache = makecache(args[1] or 'lru', int(args[2] or 16384)<<10)
+	readahead = int(args[3] or 4096)<<10
+	image = sys.argv[2]
+	if backend == 'mmap':
+		disk = MappedDiskFile(image, 'rb', cache=cache)
+	elif backend in ('disk', 'direct'):
+		disk = DiskFile(image, 'rb', cache=cache, readahead=readahead, direct=backend=='direct')
+	else:
+		disk = opendisk(image, 'rb', cache=cache)
+		disk.readahead = readahead
+	stats = disk.enable_stats()
+	requests, requested, seconds = replay_trace(disk, sys.argv[1])
+	total = stats.export()['total']
+	print "%s (%s): %d richieste, %d byte richiesti in %.3f s" % (image, disk.__class__.__name__, requests, requested, seconds)
+	print "Letture fisiche: %d, %d byte; latenze (us): %s" % (total['reads'], total['bytes_read'], total['latency_us_percentiles'])
+	disk.cache.print_stats()
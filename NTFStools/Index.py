@@ -1,6 +1,10 @@
 # -*- coding: mbcs -*-
+import array
 import logging
+import struct
+import sys
 from NTFStools.Commons import *
+from NTFStools.IOStats import iotag
 
 class Index(object):
 	def __init__ (self, indxstream, bitmap, resident=0):
@@ -8,6 +12,7 @@ class Index(object):
 		self._bitmap = bitmap # ce l'ha solo la $INDEX_ALLOCATION
 		self._pos = self._stream.tell()
 		self._resident = resident
+		iotag(indxstream, 'indx')
 		# La $BITMAP determina quali cluster dell'indice sono liberi
 		# I cluster finali liberi possono essere privi di marcatore INDX!
 		#~ if not self._bitmap.isset(self._pos/4096):
@@ -64,6 +69,154 @@ class Index(object):
 					# Trasforma in eccezione gestita da for ... in
 					raise StopIteration
 
+class UpCase(object):
+	"""Tabella $UpCase del volume (record 10): la maiuscola di ciascuno dei 65536 caratteri
+	UTF-16, secondo cui NTFS ordina e confronta i nomi negli indici delle directory"""
+	def __init__ (self, table=None):
+		self._map = None # senza tabella, valgono le regole di Python
+		if table:
+			if type(table) != type(''):
+				table = table.tostring()
+			a = array.array('H', table[:131072])
+			if sys.byteorder == 'big':
+				a.byteswap()
+			self._map = {}
+			for i, c in enumerate(a):
+				if i != c:
+					self._map[i] = c
+
+	def upper(self, name):
+		"Il nome (unicode) in maiuscolo, come chiave di collazione"
+		if type(name) != type(u''):
+			name = name.decode(sys.getfilesystemencoding() or 'mbcs')
+		if self._map is None:
+			return name.upper()
+		return name.translate(self._map)
+
+	def tostring(self):
+		"La tabella nel formato di $UpCase (vuota, senza tabella)"
+		if self._map is None:
+			return ''
+		a = array.array('H', range(65536))
+		for i, c in self._map.items():
+			a[i] = c
+		if sys.byteorder == 'big':
+			a.byteswap()
+		return a.tostring()
+
+class IndexTree(object):
+	"""Indice $I30 di una directory visto come B+albero. Le voci di ogni nodo sono ordinate
+	per nome in maiuscolo ($UpCase); una voce con il flag 1 punta al nodo (blocco INDX di
+	$INDEX_ALLOCATION) dei nomi che la precedono, l'ultima voce (senza nome) a quello dei
+	nomi che seguono tutte le altre. Si parte da $INDEX_ROOT: cercare un nome legge un blocco
+	per livello, anzich l'intero indice come Index.next()"""
+	def __init__ (self, record, upcase=None):
+		self.upcase = upcase or UpCase()
+		root = record.find_attribute("$INDEX_ROOT")
+		if not root:
+			raise BadIndex
+		# Il contenuto di $INDEX_ROOT (sempre residente) segue il nome $I30: se ne legge
+		# direttamente la specifica, la cui posizione nel layout di Index_Root vale solo senza nome
+		root[0].file.seek(0)
+		self._rootbuf = root[0].file.read()
+		if type(self._rootbuf) == type(''):
+			self._rootbuf = array.array('c', self._rootbuf)
+		self._blocksize = struct.unpack_from('<I', self._rootbuf, 8)[0] or 4096
+		self._alloc = None
+		alloc = record.find_attribute("$INDEX_ALLOCATION")
+		if alloc:
+			self._alloc = alloc[0].file
+			iotag(self._alloc, 'indx')
+		# Il VCN di un blocco INDX  in cluster, o in settori se il blocco  pi piccolo
+		self._vcnsize = getattr(record._disk, 'clustersize', 4096)
+		if self._blocksize < self._vcnsize:
+			self._vcnsize = 512
+
+	def _node(self, vcn=None):
+		"Le voci del nodo vcn (None: $INDEX_ROOT), come lista di (Index_Entry, VCN del sottonodo o None)"
+		if vcn is None:
+			buf = self._rootbuf
+			i = 16 # INDEX_HEADER dopo la specifica di $INDEX_ROOT
+		else:
+			if not self._alloc:
+				raise BadIndex
+			self._alloc.seek(vcn * self._vcnsize)
+			buf = self._alloc.read(self._blocksize)
+			i = 24 # INDEX_HEADER dopo l'INDEX_BLOCK
+		if type(buf) == type(''):
+			buf = array.array('c', buf)
+		if vcn is not None:
+			if len(buf) < self._blocksize:
+				raise EndOfStream
+			Index_Block(buf) # verifica la firma e applica il fixup
+		h = Index_Header(buf, i)
+		entries = []
+		j = i + h.dwEntriesOffset
+		while j < i + h.dwIndexLength:
+			e = Index_Entry(buf, j)
+			if e.wsizeOfIndexEntry < 16:
+				raise BadIndex
+			sub = None
+			if e.wFlags & 0x1:
+				sub = struct.unpack_from('<Q', buf, j + e.wsizeOfIndexEntry - 8)[0]
+			entries += [(e, sub)]
+			if e.wFlags & 0x2: # ultima voce del nodo
+				break
+			j += e.wsizeOfIndexEntry
+		return entries
+
+	def find(self, name):
+		"La voce di nome name (senza distinzione tra maiuscole e minuscole), o None"
+		key = self.upcase.upper(name)
+		vcn, seen = None, set()
+		while 1:
+			child = None
+			for e, sub in self._node(vcn):
+				if e.FileName:
+					k = self.upcase.upper(e.FileName)
+					if k == key:
+						return e
+					if k < key:
+						continue
+				child = sub
+				break
+			if child is None or child in seen: # foglia, o indice corrotto
+				return None
+			seen.add(child)
+			vcn = child
+
+	def iterate(self, start=None, stop=None):
+		"""Genera le voci in ordine di collazione; se indicati, solo i nomi da start incluso
+		a stop escluso, visitando i soli nodi che possono contenerli"""
+		if start is not None:
+			start = self.upcase.upper(start)
+		if stop is not None:
+			stop = self.upcase.upper(stop)
+		return self._walk(None, start, stop, set())
+
+	__iter__ = iterate
+
+	def _walk(self, vcn, start, stop, seen):
+		for e, sub in self._node(vcn):
+			k = e.FileName and self.upcase.upper(e.FileName)
+			if k and start is not None and k < start:
+				continue # la voce e il suo sottonodo precedono start
+			if sub is not None and sub not in seen:
+				seen.add(sub)
+				for x in self._walk(sub, start, stop, seen):
+					yield x
+			if not k or (stop is not None and k >= stop):
+				return
+			yield e
+
+	def prefix(self, prefix):
+		"Genera in ordine le voci il cui nome inizia per prefix (senza distinzione tra maiuscole e minuscole)"
+		p = self.upcase.upper(prefix)
+		for e in self.iterate(prefix):
+			if not self.upcase.upper(e.FileName).startswith(p):
+				break
+			yield e
+
 class Index_Block(object):
 	layout = {
 	0x00: ('sMagic', '4s'),
@@ -71,14 +224,11 @@ class Index_Block(object):
 	0x06: ('wUSASize', '<H'), # Array size (in sectors)
 	0x08: ('u64LSN', '<Q'),
 	0x10: ('u64IndexVCN', '<Q') } # 0x18 (24) byte
+	_layout = compile_layout(layout)
 
 	def __init__ (self, indx):
 		self._i = 0
 		self._buf = indx
-		self._kv = Index_Block.layout.copy()
-		self._vk = {} # { nome: offset}
-		for k, v in self._kv.items():
-			self._vk[v[0]] = k
 		if self.sMagic != 'INDX':
 			raise BadIndex
 		self.fixup()
@@ -108,46 +258,48 @@ class Index_Header(object):
 	0x08: ('dwAllocatedSize', '<I'),
 	0x0C: ('bIsLeafNode', 'B'),
 	0x0D: ('sPadding', '3s') } # Size = 0x10 (16 byte)
+	_layout = compile_layout(layout)
 	
 	def __init__ (self, indx, offset=0):
 		self._buf = indx
 		self._i = offset
-		self._kv = Index_Header.layout.copy()
-		self._vk = {} # { nome: offset}
-		for k, v in self._kv.items():
-			self._vk[v[0]] = k
 
 	__getattr__ = common_getattr
 		
 	def __str__ (self):
 		return class2str(self, "Index Header @%x\n" % self._i)
 
-class Index_Entry(object):
-	layout = {
-	0x00: ('u64mftReference', '<Q'),
-	0x08: ('wsizeOfIndexEntry', '<H'),
-	0x0A: ('wfilenameOffset', '<H'),
-	0x0C: ('wFlags', '<H'),
-	0x0E: ('sPadding', '2s'),
-	0x10: ('u64mftFileReferenceOfParent', '<Q'),
-	0x18: ('u64creationTime', '<Q'),
-	0x20: ('u64lastModified', '<Q'),
-	0x28: ('u64lastModifiedForFileRecord', '<Q'),
-	0x30: ('u64lastAccessTime', '<Q'),
-	0x38: ('u64allocatedSizeOfFile', '<Q'),
-	0x40: ('u64realFileSize', '<Q'),
-	0x48: ('u64fileFlags', '<Q'),
-	0x50: ('ucbFileName', 'B'),
-	0x51: ('chfilenameNamespace', 'B') } # Size = 0x52 (82 byte)
+_entry_layout = {
+0x00: ('u64mftReference', '<Q'),
+0x08: ('wsizeOfIndexEntry', '<H'),
+0x0A: ('wfilenameOffset', '<H'),
+0x0C: ('wFlags', '<H'),
+0x0E: ('sPadding', '2s'),
+0x10: ('u64mftFileReferenceOfParent', '<Q'),
+0x18: ('u64creationTime', '<Q'),
+0x20: ('u64lastModified', '<Q'),
+0x28: ('u64lastModifiedForFileRecord', '<Q'),
+0x30: ('u64lastAccessTime', '<Q'),
+0x38: ('u64allocatedSizeOfFile', '<Q'),
+0x40: ('u64realFileSize', '<Q'),
+0x48: ('u64fileFlags', '<Q'),
+0x50: ('ucbFileName', 'B'),
+0x51: ('chfilenameNamespace', 'B') } # Size = 0x52 (82 byte)
+
+class Index_Entry(fields_class(_entry_layout)):
+	"Voce di un indice: un record compatto a __slots__, con i campi decodificati subito"
+	__slots__ = ('_buf', '_i', 'FileName')
+	layout = _entry_layout
+	_layout = compile_layout(layout)
 	
 	def __init__ (self, buffer, index):
-		self._kv = Index_Entry.layout.copy()
-		self._vk = {} # { nome: offset}
-		for k, v in self._kv.items():
-			self._vk[v[0]] = k
 		self._buf = buffer
 		self._i = index
 		self.FileName = ''
+		try:
+			self._layout.fill(self, buffer, index)
+		except struct.error: # voce finale a ridosso della fine del buffer: campi decodificati all'uso
+			pass
 		if self.wfilenameOffset: # Un'ultima voce pu essere priva di nome!
 			j = index + 82
 			self.FileName = ('\xFF\xFE' + self._buf[j: j+self.ucbFileName*2].tostring()).decode('utf16')
@@ -160,7 +312,7 @@ class Index_Entry(object):
 		L1 = class2str(self, "Index Entry @%x\n" % self._i).split('\n')
 		L2 = []
 		for key in (0x18, 0x20, 0x28, 0x30):
-			o = self._kv[key][0]
+			o = self._layout.kv[key][0]
 			v = getattr(self, o)
 			v = nt2uxtime(v)
 			L2 += ['%x: %s = %s' % (key, o, v)]
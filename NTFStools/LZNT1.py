@@ -0,0 +1,200 @@
+# -*- coding: mbcs -*-
+import array
+import logging
+from NTFStools.Cache import LRUCache
+
+"""
+File compressi NTFS (LZNT1)
+===========================
+
+Un attributo non residente con il flag 0x0001 (wFlags)  compresso a unit di 2**wCompressionSize
+cluster (di norma 16, cio 64 KiB con cluster di 4 KiB). Nei datarun un'unit pu essere:
+
+- del tutto allocata: i dati non sono compressi (la compressione non convieniva);
+- del tutto sparsa:  fatta di zeri;
+- allocata solo in parte, e sparsa per il resto: i cluster allocati contengono l'unit
+compressa con LZNT1.
+
+Il formato LZNT1  una sequenza di blocchi, ciascuno dei quali vale 4096 byte decompressi e
+inizia con una WORD: bit 0-11 la lunghezza del blocco meno 3 (WORD compresa), bit 15 il blocco
+ compresso. Un blocco compresso alterna un byte di flag a 8 elementi: un byte letterale (bit
+0) o una WORD di riferimento all'indietro (bit 1), i cui bit si ripartiscono tra distanza e
+lunghezza a seconda della posizione nel blocco (pi se ne  scritto, pi bit alla distanza).
+
+CompressedStream legge uno di questi attributi come DatarunStream: decomprime soltanto le unit
+che servono, una per volta (la memoria occupata non dipende dalla dimensione del file), e
+conserva le pi recenti in una LRUCache per gli accessi casuali.
+"""
+
+__all__ = ['lznt1_decompress', 'CompressedStream']
+
+# Bit di lunghezza di un riferimento, secondo la posizione nel blocco: 12 (e 4 di distanza)
+# fino alla posizione 16, poi uno in meno per ogni raddoppio della posizione
+_shifts = [12]
+for _pos in range(1, 4097):
+	_shifts += [12 - max(0, (_pos - 1).bit_length() - 4)]
+
+
+def lznt1_decompress(buf, size=None):
+	"""Decomprime i dati LZNT1 in buf (un'unit di compressione NTFS), completando con zeri
+	fino a size byte, se indicato; solleva IOError se i dati non sono validi"""
+	src = bytearray(buf)
+	out = bytearray()
+	i, n = 0, len(src)
+	while i + 2 <= n:
+		h = src[i] | (src[i+1] << 8)
+		if not h: # fine dei dati
+			break
+		end = min(n, i + 3 + (h & 0xFFF))
+		i += 2
+		if not h & 0x8000: # blocco non compresso
+			out += src[i:end]
+			i = end
+			continue
+		chunk = bytearray()
+		while i < end:
+			tags = src[i]
+			i += 1
+			for bit in range(8):
+				if i >= end:
+					break
+				if not tags & (1 << bit): # byte letterale
+					chunk.append(src[i])
+					i += 1
+					continue
+				if i + 2 > end:
+					raise IOError("blocco LZNT1 troncato")
+				token = src[i] | (src[i+1] << 8)
+				i += 2
+				shift = _shifts[min(len(chunk), 4096)]
+				offset = (token >> shift) + 1
+				length = (token & (0xFFFF >> (16 - shift))) + 3
+				start = len(chunk) - offset
+				if start < 0:
+					raise IOError("riferimento LZNT1 prima dell'inizio del blocco")
+				if offset >= length:
+					chunk += chunk[start:start+length]
+				else: # sovrapposto: ripete il motivo di offset byte
+					chunk += (chunk[start:] * (length / offset + 1))[:length]
+		if len(chunk) < 4096: # un blocco vale sempre 4096 byte
+			chunk += bytearray(4096 - len(chunk))
+		out += chunk
+	if size is not None:
+		if len(out) < size:
+			out += bytearray(size - len(out))
+		del out[size:]
+	return str(out)
+
+
+class CompressedStream(object):
+	"""Stream virtuale (con l'interfaccia di DatarunStream) su un attributo compresso: runs  la
+	sua RunList, unitsize la dimensione dell'unit di compressione in byte; le ultime unit
+	decompresse sono conservate in una LRUCache di cachesize byte"""
+	def __init__ (self, runs, size, diskstream, unitsize, cachesize=1<<20):
+		self._runs = runs
+		self._disk = diskstream
+		self.size = size
+		self.unitsize = unitsize
+		self.seekpos = 0
+		self._cachesize = cachesize
+		self._units = LRUCache(cachesize)
+
+	def _unit(self, k):
+		"I dati (decompressi) dell'unit k-esima"
+		data = self._units.get(k)
+		if data is not None:
+			return data
+		start = k * self.unitsize
+		extents = self._runs.extents(start, self.unitsize)
+		wanted = [e for e in extents if e[0] is not None]
+		allocated = sum([length for offset, length in wanted])
+		if not allocated: # unit sparsa
+			return None
+		if len(wanted) == 1:
+			raw = self._disk.read_at(*wanted[0])
+		else:
+			raw = ''.join([str(view) for view in self._disk.read_extents(wanted)])
+		if type(raw) != type(''):
+			raw = raw.tostring()
+		if allocated < self.unitsize and extents[-1][0] is None: # compressa
+			try:
+				raw = lznt1_decompress(raw, self.unitsize)
+			except IOError, e:
+				logging.warning("unit compressa @%x illeggibile (%s): sostituita da zeri", start, e)
+				raw = self.unitsize*'\x00'
+		self._units.put(k, raw)
+		return raw
+
+	def read(self, size=-1):
+		if size < 0 or self.seekpos + size > self.size:
+			size = max(0, self.size - self.seekpos)
+		buf = array.array('c')
+		pos, end = self.seekpos, self.seekpos + size
+		while pos < end:
+			k, i = divmod(pos, self.unitsize)
+			n = min(end - pos, self.unitsize - i)
+			data = self._unit(k)
+			if data is None:
+				buf.fromstring(n*'\x00')
+			else:
+				piece = data[i:i+n]
+				# un'unit decompressa pi corta (troncata o danneggiata)  completata con zeri,
+				# perch i byte seguenti restino alla loro posizione
+				buf.fromstring(piece + (n-len(piece))*'\x00')
+			pos += n
+		self.seekpos = pos
+		return buf
+
+	def extent_map(self):
+		"""Mappa dello stream, come per DatarunStream: le unit con cluster allocati (compresse
+		o no) sono tratti di dati, le unit sparse tratti sparsi"""
+		u = self.unitsize
+		spans = [] # tratti di dati, arrotondati alle unit
+		pos = 0
+		for offset, length in self._runs.extents(0, self.size):
+			if offset is not None:
+				end = pos + length
+				first, last = pos - pos % u, min(self.size, end + (-end % u))
+				if spans and spans[-1][1] >= first:
+					spans[-1][1] = max(spans[-1][1], last)
+				else:
+					spans += [[first, last]]
+			pos += length
+		map, pos = [], 0
+		for first, last in spans:
+			if first > pos:
+				map += [(pos, first - pos, False)]
+			map += [(first, last - first, True)]
+			pos = last
+		if pos < self.size:
+			map += [(pos, self.size - pos, False)]
+		return map
+
+	def copy_to(self, outstream, bufsize=4<<20):
+		"Copia l'intero stream nel file outstream, decomprimendolo e saltando le unit sparse"
+		for pos, length, data in self.extent_map():
+			if not data:
+				outstream.seek(length, 1)
+				continue
+			self.seek(pos)
+			while length > 0:
+				s = self.read(min(length, bufsize))
+				if not s:
+					break
+				outstream.write(s)
+				length -= len(s)
+
+	def tell(self):
+		return self.seekpos
+
+	def dup(self):
+		"Nuovo cursore, indipendente, sugli stessi datarun (e con una propria cache)"
+		return CompressedStream(self._runs, self.size, self._disk, self.unitsize, self._cachesize)
+
+	def seek(self, offset, whence=0):
+		if whence == 1:
+			self.seekpos += offset
+		elif whence == 2:
+			self.seekpos = self.size - offset
+		else:
+			self.seekpos = offset
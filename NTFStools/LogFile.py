@@ -12,6 +12,7 @@ class RestartAreaHeader(object):
 	0x18: ('wRestartAreaOffset', '<H'),
 	0x1A: ('wMinVer', '<H'),
 	0x1C: ('wMajVer', '<H') } # Size = 0x1E (30 byte)
+	_layout = compile_layout(layout)
 	
 	def __init__ (self, diskstream):
 		self._i = 0
@@ -19,10 +20,6 @@ class RestartAreaHeader(object):
 		self._buf = diskstream.read(4096) # dimensione standard del settore di avvio
 		if len(self._buf) != 4096:
 			raise EndOfStream
-		self._kv = RestartAreaHeader.layout.copy()
-		self._vk = {} # { nome: offset}
-		for k, v in self._kv.items():
-			self._vk[v[0]] = k
 		
 		self.fixup()
 
@@ -61,16 +58,13 @@ class RestartArea(object):
 	0x26: ('wLogPageDataOffset', '<H'),
 	0x28: ('dwRestartLogOpenCount', '<I'),
 	0x2C: ('sReserved', '4s') } # Size = 0x30 (48 byte)
+	_layout = compile_layout(layout)
 	
 	def __init__ (self, parent, offset):
 		self._i = offset
 		self._parent = parent
 		#~ self._pos = diskstream.tell() # posizione iniziale
 		self._buf = parent._buf
-		self._kv = RestartArea.layout.copy()
-		self._vk = {} # { nome: offset}
-		for k, v in self._kv.items():
-			self._vk[v[0]] = k
 		
 	__getattr__ = common_getattr
 		
@@ -88,15 +82,12 @@ class LogClientRecord(object):
 	0x16: ('sReserved', '6s'),
 	0x1C: ('dwClientNameLength', '<I'),
 	0x20: ('sClientName', '64s') } # Size = 0xA0 (160 byte)
+	_layout = compile_layout(layout)
 	
 	def __init__ (self, parent, offset):
 		self._i = offset
 		self._parent = parent
 		self._buf = parent._buf
-		self._kv = LogClientRecord.layout.copy()
-		self._vk = {} # { nome: offset}
-		for k, v in self._kv.items():
-			self._vk[v[0]] = k
 		
 	__getattr__ = common_getattr
 		
@@ -0,0 +1,101 @@
+# -*- coding: mbcs -*-
+import collections
+import multiprocessing
+import sys
+from NTFStools.DiskFile import opendisk
+from NTFStools.Utilities import ntfs_open_mft, ntfs_iter_records
+
+"""
+Scansione parallela della MFT
+=============================
+
+Decodificare gli attributi in Record.__init__ impegna la CPU, e un solo processore. mft_scan
+divide invece l'intervallo dei record in porzioni (shard) e le affida a un gruppo di processi:
+ciascuno apre il disco per proprio conto (con opendisk: nessun handle  condiviso), percorre
+la sua porzione con ntfs_iter_records e restituisce per ogni record in uso un RecordSummary,
+una tupla compatta e quindi rapida da trasferire, anzich un Record. I risultati sono poi
+ricomposti nell'ordine dei record.
+
+Le porzioni sono pi numerose dei processi (4 per processo, per default), sicch uno che termini
+prima degli altri ne riceve subito un'altra.
+
+Uso da riga di comando: MFTScan.py <disco o immagine> [processi]
+"""
+
+__all__ = ['RecordSummary', 'record_summary', 'mft_scan']
+
+RecordSummary = collections.namedtuple('RecordSummary',
+'recno sequence flags base parent name size resident ctime mtime atime rtime')
+
+
+def record_summary(record):
+	"Riassume un Record nei campi di un RecordSummary"
+	name, parent, size, resident = u'', 0, 0, False
+	names = record.find_attribute("$FILE_NAME")
+	if names:
+		fn = names[0]
+		for a in names: # il nome pi lungo, come ntfs_get_filename
+			if len(a.FileName) > len(fn.FileName):
+				fn = a
+		name, parent, size = fn.FileName, fn.u64FileReference & 0x0000FFFFFFFFFFFF, fn.u64RealSize
+	for data in record.find_attribute("$DATA") or ():
+		if not data.uchNameLength: # lo stream principale
+			resident = not data.uchNonResFlag
+			if resident:
+				size = data.dwLength
+			else:
+				size = data.u64RealSize
+			break
+	times = (0, 0, 0, 0)
+	si = record.find_attribute("$STANDARD_INFORMATION")
+	if si:
+		times = si[0].u64CTime, si[0].u64MTime, si[0].u64ATime, si[0].u64RTime
+	return RecordSummary(record.dwMFTRecNumber, record.wSequence, record.wFlags,
+	record.u64BaseMftRec & 0x0000FFFFFFFFFFFF, parent, name, size, resident, *times)
+
+
+def _scan_shard(args):
+	"Processo secondario: riassume i record in uso da first a last (escluso)"
+	name, first, last, chunksize = args
+	disk = opendisk(name, 'rb')
+	try:
+		mft = ntfs_open_mft(disk)
+		return [record_summary(r) for r in ntfs_iter_records(mft, chunksize, first, last)]
+	finally:
+		disk.close()
+
+
+def mft_scan(name, processes=None, shards=None, chunksize=4<<20):
+	"""Genera, nell'ordine dei record, il RecordSummary di ogni record in uso della MFT del
+	volume name (disco o immagine, come per opendisk), decodificandola in processes processi"""
+	disk = opendisk(name, 'rb')
+	try:
+		count = ntfs_open_mft(disk).find_attribute("$DATA")[0].u64RealSize / 1024
+	finally:
+		disk.close()
+	processes = processes or multiprocessing.cpu_count()
+	shards = shards or 4*processes
+	per = max(chunksize / 1024, (count + shards - 1) / shards) # record per porzione
+	tasks = [(name, first, min(first + per, count), chunksize) for first in range(0, count, per)]
+	if processes < 2 or len(tasks) < 2:
+		for task in tasks:
+			for summary in _scan_shard(task):
+				yield summary
+		return
+	pool = multiprocessing.Pool(processes)
+	try:
+		for part in pool.imap(_scan_shard, tasks): # imap conserva l'ordine delle porzioni
+			for summary in part:
+				yield summary
+	finally:
+		pool.terminate()
+
+
+if __name__ == '__main__':
+	if len(sys.argv) < 2:
+		print "Uso: MFTScan.py <disco o immagine> [processi]"
+		sys.exit(1)
+	processes = None
+	if len(sys.argv) > 2: processes = int(sys.argv[2])
+	for s in mft_scan(sys.argv[1], processes):
+		print ("%d\t%d\t%d\t%s\t%d" % (s.recno, s.parent, s.size, s.name, s.flags & 2 and 1 or 0)).encode('utf8')
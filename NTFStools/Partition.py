@@ -20,6 +20,7 @@ class Partition(object):
 	0x07: ('chLastCylinder', 'B'),
 	0x08: ('dwRelativeSector', '<I'), # inizio della partizione, in settori
 	0x0C: ('dwNumberSectors', '<I') } # dimensione della partizione, in settori
+	_layout = compile_layout(layout)
 	
 	def __init__ (self, diskstream):
 		self._i = 0x1BE # offset della Partition Table nel MBR
@@ -29,10 +30,6 @@ class Partition(object):
 			raise EndOfStream
 		if self._buf[-2:].tostring() != '\x55\xAA':
 			print "Bad MBR!"
-		self._kv = Partition.layout.copy()
-		self._vk = {} # { nome: offset}
-		for k, v in self._kv.items():
-			self._vk[v[0]] = k
 
 	__getattr__ = common_getattr
 		
@@ -0,0 +1,130 @@
+# -*- coding: mbcs -*-
+import sys
+from NTFStools import BulkMFT
+from NTFStools.DiskFile import opendisk
+from NTFStools.Utilities import ntfs_open_mft, ntfs_iter_records
+
+"""
+Percorsi completi dai riferimenti dei $FILE_NAME
+================================================
+
+Elencare ogni file del volume visitando ricorsivamente gli indici delle directory salta di
+continuo da un blocco INDX all'altro. Ogni $FILE_NAME per annota gi il riferimento della
+directory genitrice (u64FileReference): ntfs_path_table legge quindi la $MFT una sola volta,
+in ordine (con BulkMFT se c' NumPy, altrimenti con ntfs_iter_records), raccogliendo per ogni
+record in uso genitore e nome, e PathTable ricompone poi i percorsi risalendo la catena dei
+genitori. I percorsi gi composti sono memorizzati, sicch ogni directory si risolve una volta.
+
+Di pi nomi si sceglie uno solo, preferendo gli spazi dei nomi Win32 a POSIX e DOS (come in
+BulkMFT): di un file con pi collegamenti (hard link) si ha un solo percorso.
+
+Un record  orfano se il genitore manca (non in uso),  stato riutilizzato (la sua sequenza
+differisce da quella del riferimento) o la catena dei genitori si chiude su s stessa: il suo
+percorso inizia allora con ORPHANS.
+
+Uso da riga di comando: PathTable.py <disco o immagine>
+"""
+
+__all__ = ['PathTable', 'ntfs_path_table', 'ORPHANS']
+
+ORPHANS = u'\\$OrphanFiles' # directory virtuale dei record orfani
+
+# Preferenza tra gli spazi dei nomi del $FILE_NAME: POSIX=0, Win32=1, DOS=2, Win32&DOS=3
+_nsrank = (2, 3, 1, 3)
+
+
+class PathTable(object):
+	"Tabella dei genitori e dei nomi dei record MFT, da cui risolve i percorsi completi"
+	def __init__ (self):
+		self._names = {} # { record: (genitore, sequenza del genitore, nome) }
+		self._sequence = {} # { record: sequenza }
+		self._paths = {5: u''} # percorsi gi risolti (ROOT  la radice)
+
+	def __len__ (self):
+		return len(self._names)
+
+	def __contains__ (self, n):
+		return n in self._names
+
+	def add(self, n, sequence, parent, name):
+		"""Annota il record n, con la sua sequenza, il riferimento (con sequenza) del genitore
+		e il nome; un record gi annotato non  sostituito"""
+		if n not in self._names:
+			self._sequence[n] = sequence
+			self._names[n] = (parent & 0x0000FFFFFFFFFFFF, parent >> 48, name)
+
+	def path(self, n):
+		"Percorso completo del record n (None se non annotato)"
+		if n not in self._paths and n not in self._names:
+			return None
+		chain, onchain = [], set()
+		top = None
+		while n not in self._paths:
+			chain += [n]
+			onchain.add(n)
+			parent, sequence, name = self._names[n]
+			if parent in onchain or parent not in self._names or \
+			(sequence and self._sequence.get(parent, sequence) != sequence):
+				top = ORPHANS # genitore assente, riutilizzato o ciclo
+				break
+			n = parent
+		if top is None:
+			top = self._paths[n]
+		for m in reversed(chain):
+			top = self._paths[m] = top + u'\\' + self._names[m][2]
+		if not chain:
+			return top or u'\\'
+		return self._paths[chain[0]]
+
+	def parent(self, n):
+		"Il record genitore di n (None se non annotato)"
+		if n in self._names:
+			return self._names[n][0]
+		return None
+
+	def items(self):
+		"Genera (record, percorso) di tutti i record annotati, in ordine di record"
+		for n in sorted(self._names):
+			yield n, self.path(n)
+
+	__iter__ = items
+
+
+def ntfs_path_table(mft, chunksize=4<<20):
+	"""Costruisce la PathTable del volume, dato il record $MFT (v. ntfs_open_mft), con una sola
+	lettura sequenziale della $MFT"""
+	table = PathTable()
+	if BulkMFT.numpy:
+		stream = mft.find_attribute("$DATA")[0].file.dup()
+		cols = BulkMFT.mft_decode_stream(stream, chunksize)
+		used = cols['valid'] & (cols['flags'] & 1 != 0) & (cols['name'] != u'')
+		# Prima i record base: il nome di un record di estensione vale solo se il base non ne ha
+		for i in sorted(used.nonzero()[0], key=lambda i: cols['base'][i] != 0):
+			n = int(cols['base'][i]) or int(cols['recno'][i])
+			if n >= len(cols['recno']):
+				continue # record base oltre la fine della $MFT
+			# la sequenza  quella del record base (le righe sono in ordine di numero di record)
+			table.add(n, int(cols['sequence'][n]), int(cols['parent'][i]) | (int(cols['parent_sequence'][i]) << 48), cols['name'][i])
+		return table
+	for record in ntfs_iter_records(mft, chunksize):
+		if record.u64BaseMftRec & 0x0000FFFFFFFFFFFF:
+			continue # i suoi attributi sono gi nel record base
+		names = record.find_attribute("$FILE_NAME")
+		if not names:
+			continue
+		fn = names[0]
+		for a in names:
+			if _nsrank[a.uFileNameNamespace & 3] > _nsrank[fn.uFileNameNamespace & 3]:
+				fn = a
+		table.add(record.dwMFTRecNumber, record.wSequence, fn.u64FileReference, fn.FileName)
+	return table
+
+
+if __name__ == '__main__':
+	if len(sys.argv) < 2:
+		print "Uso: PathTable.py <disco o immagine>"
+		sys.exit(1)
+	disk = opendisk(sys.argv[1], 'rb')
+	table = ntfs_path_table(ntfs_open_mft(disk))
+	for n, path in table:
+		print ("%d\t%s" % (n, path)).encode('utf8')
@@ -3,40 +3,58 @@ import array
 import logging
 import struct
 from NTFStools.Attribute import *
+from NTFStools.Cache import LRUCache
 from NTFStools.Commons import *
+from NTFStools.DatarunStream import *
+from NTFStools.IOStats import iotag
 
 __all__ = ['Record']
 
-class Record(object):
-	layout = {
-	0x00: ('fileSignature', '4s'),
-	0x04: ('wUSAOffset', '<H'), # Update Sequence Array offset
-	0x06: ('wUSASize', '<H'), # Array size (in sectors)
-	0x08: ('u64LogSeqNumber', '<Q'),
-	0x10: ('wSequence', '<H'),
-	0x12: ('wHardLinks', '<H'),
-	0x14: ('wAttribOffset', '<H'),
-	0x16: ('wFlags', '<H'),
-	0x18: ('dwRecLength', '<I'),
-	0x1C: ('dwAllLength', '<I'),
-	0x20: ('u64BaseMftRec', '<Q'),
-	0x28: ('wNextAttrID', '<H'),
-	0x2A: ('wFixupPattern', '<H'),
-	0x2C: ('dwMFTRecNumber', '<I') } # Size = 0x30 (48 byte)
+# Classe di ciascun tipo di attributo (le altre sono decodificate come Attribute)
+_classes = {0x10: Standard_Information, 0x20: Attribute_List, 0x30: File_Name, 0x80: Data,
+0x90: Index_Root, 0xA0: Index_Allocation, 0xB0: Bitmap}
+
+_record_layout = {
+0x00: ('fileSignature', '4s'),
+0x04: ('wUSAOffset', '<H'), # Update Sequence Array offset
+0x06: ('wUSASize', '<H'), # Array size (in sectors)
+0x08: ('u64LogSeqNumber', '<Q'),
+0x10: ('wSequence', '<H'),
+0x12: ('wHardLinks', '<H'),
+0x14: ('wAttribOffset', '<H'),
+0x16: ('wFlags', '<H'),
+0x18: ('dwRecLength', '<I'),
+0x1C: ('dwAllLength', '<I'),
+0x20: ('u64BaseMftRec', '<Q'),
+0x28: ('wNextAttrID', '<H'),
+0x2A: ('wFixupPattern', '<H'),
+0x2C: ('dwMFTRecNumber', '<I') } # Size = 0x30 (48 byte)
+
+class Record(fields_class(_record_layout)):
+	"""Record della MFT: i campi dell'intestazione sono slot della classe base generata dal
+	layout, decodificati tutti insieme appena letto il record"""
+	layout = _record_layout
+	_layout = compile_layout(layout)
 	
-	def __init__ (self, mftstream, disk=None):
+	def __init__ (self, mftstream, disk=None, buf=None, pos=0):
+		"Legge il record alla posizione corrente di mftstream o, se indicato, lo decodifica da buf"
 		self._disk = disk
 		self._i = 0 # posizione nel buffer
-		self._pos = mftstream.tell() # posizione iniziale
-		self._buf = mftstream.read(1024) # dimensione standard del record MFT
+		if buf is None:
+			self._pos = mftstream.tell() # posizione iniziale
+			iotag(mftstream, 'mft')
+			self._buf = mftstream.read(1024) # dimensione standard del record MFT
+		else: # gi letto (es. a blocchi, da ntfs_iter_records) alla posizione pos
+			self._pos = pos
+			self._buf = buf
 		self._stream = mftstream
-		self._attributes = {} # dizionario { tipo attributo: [lista esemplari] }
+		self._table = [] # (tipo, offset) di ogni attributo, nell'ordine del record
+		self._attributes = {} # dizionario { tipo attributo: [lista esemplari] }, costruito all'uso
+		self._attrlist = 0 # c' un $ATTRIBUTE_LIST da esaminare al primo find_attribute
+		self._pending = {} # { tipo: record di estensione che lo contengono, ancora da leggere }
 		if len(self._buf) != 1024:
 			raise EndOfStream
-		self._kv = Record.layout.copy()
-		self._vk = {} # { nome: offset}
-		for k, v in self._kv.items():
-			self._vk[v[0]] = k
+		self._layout.fill(self, self._buf)
 			
 		if not self.wFlags & 0x1: # Record non in uso
 			return
@@ -47,40 +65,23 @@ class Record(object):
 		
 		self.fixup() # verifica e applica il fixup
 		
-		# Decodifica gli attributi
+		# Annota soltanto tipo e posizione degli attributi: gli oggetti sono costruiti,
+		# per tipo, alla prima richiesta (v. find_attribute)
 		offset = self.wAttribOffset
 		while offset < 1024:
-			dwType = struct.unpack_from('<I', self._buf, offset)[0]
+			dwType, dwFullLength = struct.unpack_from('<II', self._buf, offset)
 			if dwType == 0xFFFFFFFF:
 				break
-			elif dwType == 0x10:
-				a = Standard_Information(self, offset)
-			elif dwType == 0x20:
-				a = Attribute_List(self, offset)
-				self._expand_attribute_list(a)
-			elif dwType == 0x30:
-				a = File_Name(self, offset)
-			elif dwType == 0x80:
-				a = Data(self, offset)
-			elif dwType == 0x90:
-				a = Index_Root(self, offset)
-			elif dwType == 0xA0:
-				a = Index_Allocation(self, offset)
-			elif dwType == 0xB0:
-				a = Bitmap(self, offset)
-			else:
-				a = Attribute(self, offset)
-			logging.debug("Decodificato attributo:\n%s", a)
-			if a.dwType in self._attributes:
-				self._attributes[a.dwType] += [a]
-			else:
-				self._attributes[a.dwType] = [a]
+			self._table += [(dwType, offset)]
+			if dwType == 0x20:
+				self._attrlist = 1
 			# Se l'attributo cade oltre un record, qualcosa non va...
-			if a.dwFullLength + offset > 1018:
-				logging.debug("Attributo oltre il record!!!\n%s", self)
+			if dwFullLength + offset > 1018 or not dwFullLength:
+				logging.debug("Attributo oltre il record @%x!!!", self._pos)
 				break
-			offset += a.dwFullLength
-		logging.debug("Esaminato Record MFT #%x @%x:\n%s", self.dwMFTRecNumber, self._pos, self)
+			offset += dwFullLength
+		if logging.root.isEnabledFor(logging.DEBUG):
+			logging.debug("Esaminato Record MFT #%x @%x:\n%s", self.dwMFTRecNumber, self._pos, self)
 
 	__getattr__ = common_getattr
 		
@@ -100,35 +101,127 @@ class Record(object):
 			#~ offs = self.wUSAOffset+2*i # offset della WORD da sostituire nello USA
 			#~ self._buf[fixuppos:fixuppos+2] = self._buf[offs:offs+2]
 			
-	def next(self, index=1): # BUG! AVANZA anche oltre la fine dello stream!
-		"Avanza al prossimo o allo n-esimo record indicato"
-		if index > 1:
-			self._stream.seek(1024*index)
+	def next(self, index=None):
+		"Avanza al prossimo record o allo n-esimo indicato; oltre la fine dello stream, solleva EndOfStream"
+		if index is not None:
+			pos = 1024*index
 		else:
-			self._stream.seek(self._pos + 1024*index)
-		logging.debug("next MFT Record @0x%X, index=%d", self._stream.tell(), index)
+			pos = self._pos + 1024
+		size = getattr(self._stream, 'size', 0)
+		if size and pos + 1024 > size:
+			raise EndOfStream
+		self._stream.seek(pos)
+		logging.debug("next MFT Record @0x%X, index=%s", pos, index)
 		return Record(self._stream, self._disk)
 		
 	def find_attribute(self, typ):
 		if type(typ) == type(''):
 			typ = attributes_by_name[typ]
-		if typ in self._attributes:
-			return self._attributes[typ]
-		else:
-			return None
+		if self._attrlist: # esamina l'$ATTRIBUTE_LIST al primo accesso
+			self._attrlist = 0
+			self._decode(0x20)
+			self._parse_attribute_list(self._attributes[0x20][0])
+		if typ not in self._attributes:
+			self._decode(typ)
+		if typ in self._pending: # in record di estensione non ancora letti
+			self._expand(typ)
+		return self._attributes[typ] or None
+
+	def _decode(self, typ):
+		"Costruisce gli oggetti degli attributi typ presenti nel record"
+		cls = _classes.get(typ, Attribute)
+		L = self._attributes[typ] = [cls(self, offset) for t, offset in self._table if t == typ]
+		if logging.root.isEnabledFor(logging.DEBUG):
+			for a in L: logging.debug("Decodificato attributo:\n%s", a)
 
-	def _expand_attribute_list(self, al):
-		i = al._i + 24
-		expanded = ()
-		while i < al._i + al.dwFullLength:
+	def _parse_attribute_list(self, al):
+		"Annota, per tipo, i record di estensione indicati dall'$ATTRIBUTE_LIST (senza leggerli)"
+		self._attrlist = 0
+		if al.uchNonResFlag: # lista molto lunga, fuori dal record
+			common_dataruns_decode(al)
+			buf = DatarunStream(al.dataruns, al.u64RealSize, self._disk).read()
+			i, end = 0, len(buf)
+		else:
+			buf = al._buf
+			i = al._i + al.wAttrOffset
+			end = i + al.dwLength
+		while i + 26 <= end:
 			dwListedAttrType, wEntryLength, bNameLen,\
 			bNameOffs, u64StartVCN, u64BaseMFTFileRef,\
-			wAttrID = struct.unpack_from("<IHBBQQH", al._buf, i)
-			logging.debug("dwListedAttrType=%s wEntryLength=%s bNameLen=%s bNameOffs=%s u64StartVCN=%s u64BaseMFTFileRef=%s wAttrID=%s", dwListedAttrType, wEntryLength, bNameLen, bNameOffs, u64StartVCN, u64BaseMFTFileRef, wAttrID)
+			wAttrID = struct.unpack_from("<IHBBQQH", buf, i)
+			if wEntryLength < 26:
+				break
 			base = u64BaseMFTFileRef & 0x0000FFFFFFFFFFFF
-			if self.dwMFTRecNumber != base and base not in expanded: # attributo in altro record collegato
-				rec = Record(self._stream, self._disk)
-				rec = rec.next(base)
-				self._attributes.update(rec._attributes)
-				expanded += (base,)
+			if self.dwMFTRecNumber != base: # attributo in altro record collegato
+				self._pending.setdefault(dwListedAttrType, set()).add(base)
 			i += wEntryLength # avanza al prossimo elemento della lista
+
+	def _expand(self, typ):
+		"""Aggiunge (senza sostituire quelli del record base) gli attributi typ dei record di
+		estensione, e riunisce in un solo stream i segmenti di un attributo non residente"""
+		numbers = sorted(self._pending.pop(typ))
+		for rec in self._fetch(numbers):
+			if rec.wFlags & 0x1:
+				self._attributes[typ].extend(rec.find_attribute(typ) or [])
+		pieces = {}
+		for a in self._attributes.get(typ, []):
+			if a.uchNonResFlag and hasattr(a, 'dataruns'):
+				j = a._i + a.wNameOffset
+				pieces.setdefault(a._buf[j:j+2*a.uchNameLength].tostring(), []).append(a)
+		for L in pieces.values():
+			if len(L) < 2:
+				continue
+			L.sort(key=lambda a: a.u64StartVCN)
+			first = L[0]
+			runs = RunList(first.dataruns.clustersize)
+			for a in L:
+				runs.extend(a.dataruns)
+			# solo il primo segmento (StartVCN 0) indica la dimensione dello stream
+			first.dataruns = runs
+			first.__dict__.pop('file', None) # lo stream sar ricreato sui run riuniti
+			for a in L[1:]:
+				self._attributes[typ].remove(a)
+			logging.debug("riuniti %d segmenti dell'attributo %x", len(L), typ)
+
+	def _fetch(self, numbers):
+		"""I record (di estensione) numbers, letti dalla $MFT con una sola read_extents in ordine
+		di posizione e memorizzati per volume nella cache (LRU) disk.mftrecords"""
+		stream = self._stream
+		if self.dwMFTRecNumber == 0 and not hasattr(stream, 'extents') and self._attributes.get(0x80):
+			# $MFT letto dal disco (v. ntfs_open_mft): i suoi record di estensione cadono
+			# nel primo segmento del suo $DATA
+			stream = self._attributes[0x80][0].file
+		cache = None
+		if self._disk is not None:
+			cache = getattr(self._disk, 'mftrecords', None)
+			if cache is None:
+				cache = self._disk.mftrecords = LRUCache(4<<20)
+		bufs = {}
+		missing = []
+		for n in numbers:
+			buf = cache is not None and cache.get(n) or None
+			if buf is None:
+				missing += [n]
+			else:
+				bufs[n] = buf
+		if missing and hasattr(stream, 'extents') and hasattr(self._disk, 'read_extents'):
+			extents, owners = [], []
+			for n in missing:
+				for e in stream.extents(n*1024, 1024):
+					extents += [e]
+					owners += [n]
+			iotag(stream, 'mft')
+			for n, view in zip(owners, self._disk.read_extents(extents)):
+				bufs[n] = bufs.get(n, '') + str(view)
+		else:
+			for n in missing:
+				stream.seek(n*1024)
+				iotag(stream, 'mft')
+				buf = stream.read(1024)
+				if type(buf) != type(''):
+					buf = buf.tostring()
+				bufs[n] = buf
+		if cache is not None:
+			for n in missing:
+				cache.put(n, bufs[n])
+		return [Record(stream, self._disk, array.array('c', bufs[n]), n*1024) for n in numbers if len(bufs[n]) == 1024]
@@ -0,0 +1,110 @@
+# -*- coding: mbcs -*-
+import bisect
+import os
+import re
+import threading
+from NTFStools.DiskFile import DiskFile, pread
+
+"""
+Immagini disco suddivise in segmenti
+====================================
+
+Le acquisizioni arrivano spesso in pi file (disk.001, disk.002, ...) da concatenare.
+SegmentedDiskFile li presenta come un unico disco virtuale, con l'interfaccia di DiskFile:
+la posizione assoluta  ricondotta a segmento e offset relativo con una ricerca binaria sugli
+inizi dei segmenti, e una lettura a cavallo di pi segmenti avviene in una sola chiamata.
+
+Se una lettura di almeno parallel byte tocca pi segmenti (magari su dischi diversi), le parti
+sono lette contemporaneamente, da un thread per segmento.
+"""
+
+__all__ = ['SegmentedDiskFile', 'find_segments']
+
+
+def find_segments(name):
+	"""Elenca i segmenti di un'immagine a partire dal primo (disk.001, disk.002...);
+	la numerazione prosegue finch i file esistono"""
+	m = re.match(r'(.*\.)(0*1)$', name)
+	if not m:
+		return [name]
+	head, num = m.groups()
+	segments = []
+	i = 1
+	while 1:
+		seg = '%s%0*d' % (head, len(num), i)
+		if not os.path.isfile(seg):
+			break
+		segments += [seg]
+		i += 1
+	return segments
+
+
+class SegmentedDiskFile(DiskFile):
+	"Concatenazione virtuale, in sola lettura, dei segmenti di un'immagine disco"
+	rawfile = 0 # pi file: copy_extent legge a blocchi
+	def __init__(self, names, mode='rb', buffering=0, size=0, cache=None, parallel=8<<20):
+		if type(names) == type(''):
+			names = find_segments(names)
+		DiskFile.__init__(self, names[0], 'rb', buffering, 0, cache)
+		self.parallel = parallel
+		self._segments = [self._file] + [open(name, 'rb', buffering) for name in names[1:]]
+		self._seglocks = [threading.Lock() for name in names]
+		self._starts = [] # posizione iniziale di ogni segmento nel disco virtuale
+		total = 0
+		for f in self._segments:
+			self._starts += [total]
+			total += os.fstat(f.fileno()).st_size
+		self.imagesize = total
+		self.size = size or total
+
+	def close(self):
+		for f in self._segments[1:]:
+			f.close()
+		DiskFile.close(self)
+
+	def _segread(self, i, offset, size):
+		"Legge dal segmento i-esimo, a partire dal suo offset relativo"
+		f = self._segments[i]
+		if pread:
+			s = pread(f.fileno(), size, offset)
+			while len(s) < size: # le letture posizionali possono essere parziali
+				t = pread(f.fileno(), size-len(s), offset+len(s))
+				if not t: break
+				s += t
+			return s
+		with self._seglocks[i]:
+			f.seek(offset)
+			return f.read(size)
+
+	def _pieces(self, offset, size):
+		"Suddivide un tratto del disco virtuale in (segmento, offset relativo, lunghezza)"
+		pieces = []
+		end = min(offset + size, self.imagesize)
+		i = bisect.bisect_right(self._starts, offset) - 1
+		while offset < end and i < len(self._starts):
+			segend = self._starts[i+1] if i+1 < len(self._starts) else self.imagesize
+			n = min(end, segend) - offset
+			if n > 0:
+				pieces += [(i, offset - self._starts[i], n)]
+				offset += n
+			i += 1
+		return pieces
+
+	def _pread(self, offset, size):
+		pieces = self._pieces(offset, size)
+		if len(pieces) < 2 or size < self.parallel:
+			return ''.join([self._segread(*piece) for piece in pieces])
+		# Un thread per segmento: le parti su dischi diversi sono lette in parallelo
+		parts = [''] * len(pieces)
+		errors = []
+		def worker(k, piece):
+			try:
+				parts[k] = self._segread(*piece)
+			except (IOError, OSError), e:
+				errors.append(e)
+		threads = [threading.Thread(target=worker, args=(k, piece)) for k, piece in enumerate(pieces)]
+		for t in threads: t.start()
+		for t in threads: t.join()
+		if errors:
+			raise errors[0]
+		return ''.join(parts)
@@ -7,11 +7,63 @@ import StringIO
 import struct
 import sys
 from NTFStools.Boot import *
+from NTFStools.Cache import DentryCache
+from NTFStools.Commons import nt2epoch
 from NTFStools.DiskFile import *
+from NTFStools.IOStats import iotag
 from NTFStools.Index import *
 from NTFStools.Record import *
 
 
+def ntfs_open_mft(disk):
+	"""Apre la Master File Table del volume NTFS su disk, restituendone il record $MFT
+	letto attraverso il suo $DATA (il cui stream  quindi _stream); annota in
+	disk.clustersize la dimensione del cluster"""
+	disk.seek(0)
+	boot = Bootsector(disk)
+	disk.clustersize = boot.wBytesPerSec * boot.uchSecPerClust
+	# Posizione della $MFT relativa all'inizio del boot sector (=LCN * cluster size)
+	disk.seek(boot.u64MFTLogicalClustNum * disk.clustersize)
+	mft = Record(disk, disk)
+	names = mft.find_attribute("$FILE_NAME")
+	if not names or names[0].FileName != '$MFT':
+		raise BadRecord
+	return Record(mft.find_attribute("$DATA")[0].file, disk)
+
+
+def ntfs_iter_records(mft, chunksize=4<<20, first=0, last=None, select=None):
+	"""Genera tutti i record in uso della MFT (o quelli da first a last escluso), dato il
+	record $MFT (v. ntfs_open_mft). Legge il $DATA della $MFT a blocchi di chunksize byte,
+	saltando (senza leggerli) i record che la $BITMAP della $MFT indica liberi, e si
+	arresta a u64RealSize. Se indicata, la funzione select(n, buf, offset) decide, vista
+	l'intestazione del record n-esimo in buf, se decodificarlo (v. Catalog.refresh)"""
+	stream = mft.find_attribute("$DATA")[0].file.dup()
+	bitmap = mft.find_attribute("$BITMAP")[0].file
+	bitmap.seek(0)
+	bits = bitmap.read()
+	if type(bits) != type(''):
+		bits = bits.tostring()
+	n = min(stream.size / 1024, len(bits) * 8) # record nello stream
+	if last is not None:
+		n = min(n, last)
+	per = max(1, chunksize / 1024) # record per blocco
+	for start in range(first, n, per):
+		end = min(start + per, n)
+		# Limita la lettura al tratto tra il primo e l'ultimo record in uso del blocco
+		used = [i for i in range(start, end) if ord(bits[i >> 3]) & (1 << (i & 7))]
+		if not used:
+			continue
+		stream.seek(used[0] * 1024)
+		buf = stream.read((used[-1] + 1 - used[0]) * 1024)
+		for i in used:
+			j = (i - used[0]) * 1024
+			if select and not select(i, buf, j):
+				continue
+			record = Record(stream, mft._disk, buf[j : j+1024], i * 1024)
+			if record.wFlags & 0x1:
+				yield record
+
+
 def ntfs_get_filename(mftrecord):
 	"Trova il nome (pi) lungo appropriato associato al record MFT"
 	names = mftrecord.find_attribute("$FILE_NAME")
@@ -23,69 +75,101 @@ def ntfs_get_filename(mftrecord):
 			wanted = name.FileName
 	return wanted
 	
-def ntfs_copy_file(mftrecord, outfile=None):
-	"Copia un file da un record MFT alla cartella attiva (o alla diversa destinazione indicata)"
+def ntfs_copy_file(mftrecord, outfile=None, times=1):
+	"""Copia un file da un record MFT alla cartella attiva (o alla diversa destinazione indicata).
+	Un file non residente  copiato un'estensione alla volta direttamente dal disco (v.
+	DatarunStream.copy_to); i tratti sparsi non sono letti dal disco n scritti: la destinazione
+	li salta, risultando a sua volta sparsa se il suo file system lo consente. Il risultato 
+	troncato a u64RealSize; se times, e outfile  un nome, riceve le date di accesso e modifica
+	di $STANDARD_INFORMATION"""
 	selected = mftrecord.find_attribute("$DATA")[-1].file
+	iotag(selected, 'data')
 	if not outfile:
 		outfile = ntfs_get_filename(mftrecord)
 	if type(outfile) == type(file): # pu essere un file gi aperto
 		outstream = outfile
 	else:
 		outstream = open(outfile,'wb')
-	while 1:
-		s = selected.read(4096*1024)
-		if not s:
-			break
-		outstream.write(s)
+	if hasattr(selected, 'copy_to'): # non residente
+		start = outstream.tell()
+		selected.copy_to(outstream)
+		outstream.truncate(start + selected.size) # se il file termina con un tratto sparso
+	else:
+		while 1:
+			s = selected.read(4096*1024)
+			if not s:
+				break
+			outstream.write(s)
 	outstream.close()
+	si = mftrecord.find_attribute("$STANDARD_INFORMATION")
+	if times and si and outstream is not outfile:
+		os.utime(outfile, (nt2epoch(si[0].u64ATime), nt2epoch(si[0].u64MTime)))
 	
 
+def ntfs_open_upcase(record):
+	"Legge la tabella $UpCase del volume (record 10), dato un qualsiasi record della sua MFT"
+	data = record.next(10).find_attribute("$DATA")
+	if not data:
+		return UpCase()
+	data[0].file.seek(0)
+	return UpCase(data[0].file.read())
+
+
 def ntfs_open_file(abspathname, mftstream, diskstream):
-	"Apre un file di cui  indicato il percorso assoluto, navigando attraverso gli indici"
-	tail = ' '
-	head = abspathname
-	path = []
-	while tail != '':
-		head, tail = os.path.split(head)
-		path += [tail]
-	path.reverse()
+	"""Apre un file di cui  indicato il percorso assoluto, discendendo per ogni directory nel
+	B+albero del suo indice (v. IndexTree); un elemento con caratteri jolly (*, ?, [)  invece
+	confrontato con fnmatch con tutte le voci, in ordine. Restituisce None se non lo trova.
+	Gli esiti delle ricerche sono annotati nella DentryCache del disco (diskstream.dentries):
+	ripetute sotto le stesse directory, non leggono pi gli indici (un nome non trovato 
+	cercato di nuovo se il record della directory ha cambiato LSN)"""
+	if type(abspathname) != type(u''):
+		abspathname = abspathname.decode(sys.getfilesystemencoding() or 'mbcs')
+	path = abspathname.replace('\\', '/').split('/')
+	if path and len(path[0]) == 2 and path[0][1] == ':': # lettera di unit
+		del path[0]
+	path = [obj for obj in path if obj and obj != '.']
 	mftstream.seek(5*1024) # salta direttamente a ROOT
 	rfile = Record(mftstream, diskstream)
-	indx = None
+	# La tabella $UpCase e la cache delle voci sono una sola per disco
+	upcase = getattr(diskstream, 'upcase', None)
+	if not upcase:
+		upcase = diskstream.upcase = ntfs_open_upcase(rfile)
+	dentries = getattr(diskstream, 'dentries', None)
+	if dentries is None:
+		dentries = diskstream.dentries = DentryCache()
 	for obj in path:
-		if not obj:
-			obj = '.' # ROOT
-			
 		logging.debug("Ricerca di <%s> nel percorso <%s>", obj, path)
-		
-		if indx: # Se c' un indice aperto...
-			for name in indx.next():
-				logging.debug("Esamino voce di indice <%s>", name.FileName)
+		parent = rfile.dwMFTRecNumber | (rfile.wSequence << 48)
+		wild = '*' in obj or '?' in obj or '[' in obj
+		if not wild:
+			key = upcase.upper(obj)
+			ref = dentries.get(parent, key, rfile.u64LogSeqNumber)
+			if ref == 0: # voce negativa
+				logging.debug("<%s> non trovato (dalla cache)", obj)
+				return None
+			if ref:
+				child = rfile.next(ref & 0x0000FFFFFFFFFFFF)
+				if child.wSequence == ref >> 48 and child.wFlags & 0x1:
+					rfile = child
+					continue
+				dentries.stale(parent, key)
+		if not rfile.find_attribute("$INDEX_ROOT"): # non  una directory
+			return None
+		tree = IndexTree(rfile, upcase)
+		if wild:
+			for name in tree.iterate():
 				if fnmatch.fnmatch(name.FileName, obj):
-					logging.debug("<%s> concorda con <%s>: selezione record $MFT %s", obj, name.FileName, hex(name.u64mftReference & 0x0000FFFFFFFFFFFF))
-					rfile = rfile.next(name.u64mftReference & 0x0000FFFFFFFFFFFF)
-					if path.index(obj)+1 == len(path): # ultimo elemento == file
-						return rfile
-					indx = None
 					break
-					
-		while 1: # Cerca nella $MFT il nome di oggetto voluto
-			attr = rfile.find_attribute("$FILE_NAME")
-			if attr:
-				for name in attr: # Per ogni nome: corto, lungo...
-					if fnmatch.fnmatch(name.FileName, obj):
-						logging.debug("<%s> concorda con <%s>: apertura dell'indice", obj, name.FileName)
-						attr = rfile.find_attribute("$INDEX_ALLOCATION")
-						if attr:
-							bitmap = rfile.find_attribute("$BITMAP")[0]
-							indx = Index(attr[0].file, bitmap, 0)
-							break
-						# Se non c' 0xA0, allora  residente in 0x90!
-						attr = rfile.find_attribute("$INDEX_ROOT")
-						if attr and not attr[0].uchNonResFlag:
-							indx = Index(attr[0].file, None, 1)
-							logging.debug("nota: indice residente")
-							break
-			if indx: break
-			rfile = rfile.next()
-			logging.debug("selezione del prossimo record $MFT")
+			else:
+				name = None
+		else:
+			name = tree.find(obj)
+		if not name:
+			logging.debug("<%s> non trovato", obj)
+			if not wild:
+				dentries.put(parent, key, 0, rfile.u64LogSeqNumber)
+			return None
+		logging.debug("<%s> concorda con <%s>: selezione record $MFT %s", obj, name.FileName, hex(name.u64mftReference & 0x0000FFFFFFFFFFFF))
+		dentries.put(parent, upcase.upper(name.FileName), name.u64mftReference)
+		rfile = rfile.next(name.u64mftReference & 0x0000FFFFFFFFFFFF)
+	return rfile
@@ -1,9 +1,20 @@
 # -*- coding: mbcs -*-
 from Attribute import *
 from Boot import *
+from BulkCopy import *
+from BulkMFT import *
+from Cache import *
+from Catalog import *
 from Commons import *
+from CompressedImage import *
 from DatarunStream import *
 from DiskFile import *
 from Index import *
+from IOStats import *
+from IOTrace import *
+from LZNT1 import *
+from MFTScan import *
+from PathTable import *
 from Record import *
+from SegmentedImage import *
 from Utilities import *
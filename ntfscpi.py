@@ -10,7 +10,12 @@ Example syntax:
 	ntfscpi \\.\C: C:\Windows\System32\config\SYSTEM .
 
 Open disk C: for direct access and copies in the current directory the SYSTEM registry hive
-(tipically locked by the NT kernel)."""
+(tipically locked by the NT kernel).
+
+	ntfscpi \\.\C: C:\Windows\System32\config C:\Users\*\NTUSER.DAT C:\Windows\Prefetch\*.pf out
+
+Bulk mode: copies in the directory "out" all the registry hives, the users' hives and the prefetch
+files, reading them in a single pass over the disk, in physical order."""
 
 import os.path
 import sys
@@ -18,23 +23,39 @@ from NTFStools import *
 
 def say(s): print s.encode('cp850')
 
-class myDiskFile(DiskFile):
-		def __init__ (self, name, mode='rb', buffering=0, size=0, offset=0):
-			self.relative_offset = offset
-			DiskFile.__init__(self, name, mode, buffering, size)
-			
-		def seek(self, offset, whence=0):
-			offset += self.relative_offset
-			DiskFile.seek(self, offset, whence)
-			
-if len(sys.argv) < 2:
-	say( """Copy a file from a NTFS filesystem directly accessing it.
-
-NTFSCPI <filesystem> <source> <destination>
-
-  <filesystem> is a disk (i.e. \\\\.\\C:) or disk image
+statsfile = None
+catalogfile = None
+listfile = None
+while len(sys.argv) > 2 and sys.argv[1] in ('-s', '-c', '-l'):
+	if sys.argv[1] == '-s':
+		statsfile = sys.argv[2]
+	elif sys.argv[1] == '-l':
+		listfile = sys.argv[2]
+	else:
+		catalogfile = sys.argv[2]
+	del sys.argv[1:3]
+
+sources = sys.argv[2:-1]
+if listfile:
+	sources += [line.strip() for line in open(listfile) if line.strip() and not line.startswith('#')]
+
+if len(sys.argv) < 3 or not sources:
+	say( """Copy files from a NTFS filesystem directly accessing it.
+
+NTFSCPI [-s <statsfile>] [-c <catalog>] [-l <listfile>] <filesystem> <source>... <destination>
+
+  <filesystem> is a disk (i.e. \\\\.\\C: or /dev/sda1) or disk image: raw,
+               split in segments (disk.001, disk.002...) or compressed (gzip)
   <source> is an absolute pathname to the file to copy
   <destination> is the target directory for the copied file
+  -s saves in <statsfile> the disk I/O statistics (JSON)
+  -c resolves <source> (up to its first wildcard) with the SQLite <catalog> of
+     the MFT, built at first use and refreshed when stale
+  -l reads more sources from <listfile>, one per line (# starts a comment)
+
+With more sources, wildcards (* ? [) in a source or a directory as source, all the
+matching files are copied under <destination>, directories with their contents,
+reading the extents of all of them in a single pass over the disk.
 
 It can operate on the Windows system disk, if launched with Administrator privileges.
 
@@ -42,7 +63,7 @@ Sample: ntfscpi \\\\.\\C: C:\\Windows\\System32\\config\\SYSTEM .""")
 	sys.exit(1)
 
 try:
-	disk = myDiskFile(sys.argv[1], 'rb')
+	disk = opendisk(sys.argv[1], 'rb')
 except:
 	disk = None
 	
@@ -50,27 +71,55 @@ if not disk:
 	say( "Can't open '%s' for direct disk access." % sys.argv[1])
 	sys.exit(1)
 
-boot = Bootsector(disk)
-# Posizione della $MFT relativa all'inizio del boot sector (=LCN * cluster size)
-mftstart = boot.u64MFTLogicalClustNum * boot.wBytesPerSec * boot.uchSecPerClust
-disk.seek(mftstart)
-
-print "$MFT retrieved @", hex(mftstart)
-mft = Record(disk, disk)
+if statsfile:
+	disk.enable_stats()
 
-if mft.find_attribute("$FILE_NAME")[0].FileName == '$MFT':
-	mft = Record(mft.find_attribute(0x80)[0].file, disk)
-else:
+try:
+	mft = ntfs_open_mft(disk)
+except (BadRecord, EndOfStream):
 	say( "The NTFS Master File Table $MFT was not found!")
 	sys.exit(1)
 
-record = ntfs_open_file(sys.argv[2], mft._stream, disk)
-if not record:
-	say('Source file "%s" not found!' % sys.argv[1])
-	sys.exit(1)
-
-head, src = os.path.split(sys.argv[2])
-head, dst = os.path.split(sys.argv[3])
+bulk = listfile or len(sources) > 1 or [c for c in '*?[' if c in sources[0]]
+
+catalog = None
+if catalogfile:
+	catalog = Catalog(catalogfile)
+	if not len(catalog):
+		say('Building the MFT catalog "%s"...' % catalogfile)
+		catalog.build(disk)
+
+record = None
+if not bulk:
+	if catalog:
+		record = catalog.open(sources[0], mft)
+	else:
+		record = ntfs_open_file(sources[0], mft._stream, disk)
+	if not record:
+		say('Source file "%s" not found!' % sources[0])
+		sys.exit(1)
+	bulk = record.wFlags & 0x2 # a directory is copied with its contents
+
+if bulk:
+	files = []
+	for source in sources:
+		found = list(ntfs_glob(source, mft, disk, catalog))
+		if not found:
+			say('Source "%s" not found!' % source)
+		files += found
+	if catalog:
+		catalog.close()
+	count, size = ntfs_bulk_copy(files, sys.argv[-1])
+	if statsfile:
+		disk.stats.dump(statsfile, disk)
+	say('Successfully copied %d files (%d bytes) to "%s"' % (count, size, sys.argv[-1]))
+	sys.exit(0)
+
+if catalog:
+	catalog.close()
+
+head, src = os.path.split(sources[0])
+head, dst = os.path.split(sys.argv[-1])
 
 if dst == '.' or dst == '..':
 	dst += '/'+src
@@ -80,4 +129,7 @@ if dst[1] == ':' and len(dst) == 2:
 	
 ntfs_copy_file(record, dst)
 
+if statsfile:
+	disk.stats.dump(statsfile, disk)
+
 say('Successfully copied "%s" to "%s"' % (src, dst))
@@ -0,0 +1 @@
+# -*- coding: mbcs -*-
@@ -0,0 +1,310 @@
+# -*- coding: mbcs -*-
+import struct
+
+"""
+Immagini NTFS sintetiche per i test
+===================================
+
+Quanto basta di un volume NTFS per le funzioni del pacchetto: settore di avvio, $MFT (con la
+sua $Bitmap), $UpCase nel record 10 e i record aggiunti dal test, ciascuno con i suoi
+attributi. Cluster di 4096 byte, record di 1024.
+
+	img = Image()
+	img.mkdir(5, u'.', 5, [(u'a.txt', 16)])
+	img.add(16, [standard_information(), file_name(u'a.txt'), resident(0x80, 'ciao')])
+	img.build(nome)
+
+I datarun sono liste di (lcn, cluster), con lcn None per un run sparso; gli indici delle
+directory sono B+alberi veri (radice in $INDEX_ROOT e blocchi INDX in $INDEX_ALLOCATION),
+ordinati secondo la stessa funzione upper della tabella $UpCase.
+"""
+
+CLUSTER = 4096
+RECORD = 1024
+NT_TIME = 131000000000000000 # 15/2/2016, in lassi di 100 ns dall'1/1/1601
+
+
+def upper(s):
+	"Maiuscole della tabella $UpCase di prova: quelle di Python, tranne la  e oltre U+024F"
+	return u''.join([c != u'\xdf' and c < u'\u0250' and len(c.upper()) == 1 and c.upper() or c for c in s])
+
+
+def upcase_table(upper=upper):
+	"La tabella $UpCase (65536 WORD) della funzione upper"
+	table = bytearray(131072)
+	for i in range(65536):
+		struct.pack_into('<H', table, 2*i, ord(upper(unichr(i))))
+	return str(table)
+
+
+def _pad(a):
+	"Allinea l'attributo a 8 byte e ne scrive la lunghezza"
+	a += '\x00' * (-len(a) % 8)
+	return a[:4] + struct.pack('<I', len(a)) + a[8:]
+
+
+def resident(typ, content, name=u'', indexed=0):
+	"Attributo residente"
+	n = name.encode('utf-16-le')
+	off = 24 + len(n)
+	off += -off % 8
+	hdr = struct.pack('<IIBBHHHIHBB', typ, 0, 0, len(name), name and 24 or 0, 0, 0, len(content), off, indexed, 0)
+	return _pad(hdr + n + '\x00'*(off-24-len(n)) + content)
+
+
+def dataruns(runs):
+	"Codifica i datarun [(lcn o None, cluster)]"
+	s = ''
+	prev = 0
+	for lcn, n in runs:
+		length = struct.pack('<q', n).rstrip('\x00') or '\x00'
+		if lcn is None:
+			s += chr(len(length)) + length
+			continue
+		delta = lcn - prev
+		prev = lcn
+		for k in range(1, 9):
+			if -(1 << (8*k-1)) <= delta < (1 << (8*k-1)):
+				break
+		s += chr(len(length) | (k << 4)) + length + struct.pack('<q', delta)[:k]
+	return s + '\x00'
+
+
+def nonresident(typ, runs, size, name=u'', cu=0, flags=0, startvcn=0):
+	"Attributo non residente di size byte; cu e flags: unit di compressione (log2) e wFlags"
+	vcns = sum([n for lcn, n in runs])
+	n = name.encode('utf-16-le')
+	off = 64 + len(n)
+	off += -off % 8
+	hdr = struct.pack('<IIBBHHHQQHH4sQQQ', typ, 0, 1, len(name), name and 64 or 0, flags, 0,
+	startvcn, startvcn+vcns-1, off, cu, '\x00'*4, vcns*CLUSTER, size, size)
+	return _pad(hdr + n + '\x00'*(off-64-len(n)) + dataruns(runs))
+
+
+def standard_information():
+	"$STANDARD_INFORMATION"
+	return resident(0x10, struct.pack('<QQQQIIIIIIQQ', NT_TIME, NT_TIME+1, NT_TIME+2, NT_TIME+3,
+	0x20, 0, 0, 0, 0, 0x100, 0, 0))
+
+
+def file_name_key(name, parent=5, ns=1, flags=0, size=5000):
+	"""Il contenuto di un $FILE_NAME, che  anche la chiave di una voce di indice; parent  il
+	record della directory o il riferimento completo (per default, con sequenza 1)"""
+	if not parent >> 48:
+		parent |= 1 << 48
+	return struct.pack('<QQQQQQQIIBB', parent, NT_TIME, NT_TIME+1, NT_TIME+2, NT_TIME+3,
+	size + (-size % CLUSTER), size, flags, 0, len(name), ns) + name.encode('utf-16-le')
+
+
+def file_name(name, parent=5, ns=1, flags=0, size=5000):
+	"$FILE_NAME (ns: 0 POSIX, 1 Win32, 2 DOS, 3 Win32 e DOS)"
+	return resident(0x30, file_name_key(name, parent, ns, flags, size), indexed=1)
+
+
+def attribute_list(entries):
+	"$ATTRIBUTE_LIST residente delle voci [(tipo, riferimento al record[, VCN iniziale])]"
+	s = ''
+	for e in entries:
+		typ, ref, vcn = (tuple(e) + (0,))[:3]
+		s += struct.pack('<IHBBQQH6x', typ, 0x20, 0, 0x1A, vcn, ref, 0)
+	return resident(0x20, s)
+
+
+def record(attrs, recno=0, flags=1, seq=1, base=0, lsn=0):
+	"Record MFT di 1024 byte, con il fixup applicato (flags: 1 in uso, 2 directory)"
+	s = struct.pack('<4sHHQHHHHIIQHHI', 'FILE', 0x30, 3, lsn, seq, 1, 0x38, flags, 0, RECORD, base, 4, 0, recno)
+	s += struct.pack('<HHH', 0x1234, 0, 0) + '\x00\x00'
+	s += ''.join(attrs) + struct.pack('<I', 0xFFFFFFFF) + '\x00'*4
+	b = bytearray(s + '\x00'*(RECORD - len(s)))
+	struct.pack_into('<I', b, 0x18, len(s))
+	b[0x32:0x34], b[0x34:0x36] = b[510:512], b[1022:1024]
+	b[510:512] = b[1022:1024] = '\x34\x12'
+	return str(b)
+
+
+def _entry(ref, name=None, parent=5, child=None):
+	"Voce di indice: di un file, o l'ultima del nodo (name None); child  il VCN del sottonodo"
+	key = name is not None and file_name_key(name, parent) or ''
+	size = 16 + len(key)
+	size += -size % 8
+	flags = 0
+	if child is not None:
+		size += 8
+		flags |= 1
+	if name is None:
+		flags |= 2
+	e = struct.pack('<QHHHH', name is not None and ref | (1<<48) or 0, size, len(key), flags, 0) + key
+	e += '\x00' * (size - len(e) - (child is not None and 8 or 0))
+	if child is not None:
+		e += struct.pack('<Q', child)
+	return e
+
+
+class _IndexTree(object):
+	"B+albero di un indice $I30: la radice ha al pi rootfan voci, i blocchi INDX al pi fan"
+	def __init__ (self, parent, fan=6):
+		self.parent = parent
+		self.fan = fan
+		self.blocks = []
+
+	def node(self, items, fan):
+		"Le voci di un nodo con gli elementi ordinati [(nome, record)] e se ha sottonodi"
+		if len(items) <= fan:
+			return ''.join([_entry(r, n, self.parent) for n, r in items]) + _entry(0), False
+		per = (len(items) - fan) / (fan + 1)
+		s, i = '', 0
+		for j in range(fan):
+			child = self.block(items[i:i+per])
+			i += per
+			s += _entry(items[i][1], items[i][0], self.parent, child)
+			i += 1
+		return s + _entry(0, child=self.block(items[i:])), True
+
+	def block(self, items):
+		"Blocco INDX (con il fixup applicato); restituisce il suo VCN"
+		vcn = len(self.blocks)
+		self.blocks += [None]
+		entries, inner = self.node(items, self.fan)
+		b = bytearray(CLUSTER)
+		b[0:24] = struct.pack('<4sHHQQ', 'INDX', 0x28, 9, 0, vcn)
+		b[24:40] = struct.pack('<IIIB3x', 0x28, 0x28+len(entries), CLUSTER-24, inner)
+		b[0x40:0x40+len(entries)] = entries
+		b[0x28:0x2A] = '\x07\x00'
+		for i in range(1, 9):
+			b[0x28+2*i:0x2A+2*i] = b[i*512-2:i*512]
+			b[i*512-2:i*512] = '\x07\x00'
+		self.blocks[vcn] = str(b)
+		return vcn
+
+
+def lznt1_compress(data):
+	"Comprime con LZNT1 (un'unit), cercando i riferimenti tra le ultime posizioni di ogni trigramma"
+	s = ''
+	for i in range(0, len(data), 4096):
+		chunk = data[i:i+4096]
+		z = _compress_chunk(chunk)
+		if len(z) < len(chunk):
+			s += struct.pack('<H', 0xB000 | (len(z) - 1)) + z
+		else:
+			s += struct.pack('<H', 0x3000 | (len(chunk) - 1)) + chunk
+	return s + '\x00\x00'
+
+
+def _compress_chunk(data):
+	s = ''
+	seen = {} # trigramma: posizioni in cui compare
+	pos, n = 0, len(data)
+	while pos < n:
+		tags, items = 0, ''
+		for bit in range(8):
+			if pos >= n:
+				break
+			shift = 12 - max(0, (pos - 1).bit_length() - 4)
+			maxlen = (0xFFF >> (12 - shift)) + 3
+			best, where = 0, 0
+			for p in reversed(seen.get(data[pos:pos+3], [])[-16:]):
+				if pos - p > 1 << (16 - shift):
+					break
+				k = 0
+				while k < maxlen and pos + k < n and data[p+k] == data[pos+k]:
+					k += 1
+				if k > best:
+					best, where = k, pos - p
+			step = 1
+			if best >= 3:
+				tags |= 1 << bit
+				items += struct.pack('<H', ((where - 1) << shift) | (best - 3))
+				step = best
+			else:
+				items += data[pos]
+			for p in range(pos, pos + step):
+				seen.setdefault(data[p:p+3], []).append(p)
+			pos += step
+		s += chr(tags) + items
+	return s
+
+
+class Image(object):
+	"Volume NTFS in memoria: la $MFT (mftrecs record) inizia al cluster mftlcn"
+	def __init__ (self, clusters=256, mftlcn=4, mftrecs=64, upper=upper):
+		self.data = bytearray(clusters*CLUSTER)
+		self.mftlcn = mftlcn
+		self.mftrecs = mftrecs
+		self.records = {} # numero: (attributi, flags, sequenza, record base, LSN)
+		self.next_lcn = mftlcn + mftrecs*RECORD/CLUSTER
+		self.upper = upper
+		lcn = self.write(upcase_table(upper))
+		self.add(10, [standard_information(), file_name(u'$UpCase', 5, 3), nonresident(0x80, [(lcn, 32)], 131072)])
+
+	def alloc(self, n):
+		"Riserva n cluster; restituisce il primo"
+		lcn = self.next_lcn
+		self.next_lcn += n
+		return lcn
+
+	def put(self, lcn, s):
+		"Scrive s a partire dal cluster lcn"
+		end = lcn*CLUSTER + len(s)
+		if len(self.data) < end:
+			self.data += bytearray(end - len(self.data) + (-end % CLUSTER))
+		self.data[lcn*CLUSTER:end] = s
+
+	def write(self, s):
+		"Scrive s in cluster nuovi; restituisce il primo"
+		lcn = self.alloc((len(s) + CLUSTER - 1) / CLUSTER)
+		self.put(lcn, s)
+		return lcn
+
+	def add(self, recno, attrs, flags=1, seq=1, base=0, lsn=0):
+		self.records[recno] = (attrs, flags, seq, base, lsn)
+
+	def index(self, items, parent, rootfan=3):
+		"Attributi dell'indice $I30 di una directory con gli elementi [(nome, record)]"
+		items = sorted(items, key=lambda x: self.upper(x[0]))
+		tree = _IndexTree(parent)
+		entries, inner = tree.node(items, rootfan)
+		root = struct.pack('<IIIB3x', 0x30, 1, CLUSTER, 1) + \
+		struct.pack('<IIIB3x', 0x10, 0x10+len(entries), 0x10+len(entries), inner) + entries
+		attrs = [resident(0x90, root, u'$I30')]
+		if tree.blocks:
+			lcn = self.write(''.join(tree.blocks))
+			attrs += [nonresident(0xA0, [(lcn, len(tree.blocks))], len(tree.blocks)*CLUSTER, u'$I30'),
+			resident(0xB0, '\xff'*8, u'$I30')]
+		return attrs
+
+	def mkdir(self, recno, name, parent, items, rootfan=3, lsn=0):
+		"Aggiunge la directory recno, con gli elementi [(nome, record)]"
+		self.add(recno, [standard_information(), file_name(name, parent, recno == 5 and 3 or 1, 0x10000000)] +
+		self.index(items, recno, rootfan), flags=3, lsn=lsn)
+
+	def mkfile(self, recno, name, parent, content, resident_data=0):
+		"Aggiunge il file recno, con i dati in cluster contigui (o residenti)"
+		if resident_data:
+			data = resident(0x80, content)
+		else:
+			lcn = self.write(content or '\x00')
+			data = nonresident(0x80, [(lcn, (len(content) + CLUSTER - 1) / CLUSTER or 1)], len(content))
+		self.add(recno, [standard_information(), file_name(name, parent, 1, 0, len(content)), data])
+
+	def mft_attributes(self, bitmap):
+		"Gli attributi del record $MFT, data la sua $Bitmap"
+		return [standard_information(), file_name(u'$MFT', 5, 3),
+		nonresident(0x80, [(self.mftlcn, self.mftrecs*RECORD/CLUSTER)], self.mftrecs*RECORD),
+		resident(0xB0, bitmap)]
+
+	def build(self, path, bitmap_extra=()):
+		"Scrive l'immagine; bitmap_extra: altri record da segnare in uso nella $Bitmap della $MFT"
+		bits = bytearray(self.mftrecs/8)
+		for recno in [0] + [r for r, v in self.records.items() if v[1] & 1] + list(bitmap_extra):
+			bits[recno >> 3] |= 1 << (recno & 7)
+		self.records[0] = (self.mft_attributes(str(bits)), 1, 1, 0, 0)
+		boot = bytearray(512)
+		boot[0:11] = '\xebR\x90NTFS    '
+		struct.pack_into('<HB', boot, 0x0B, 512, CLUSTER/512)
+		struct.pack_into('<QQ', boot, 0x30, self.mftlcn, self.mftlcn)
+		boot[510:512] = '\x55\xaa'
+		self.data[0:512] = boot
+		for recno, (attrs, flags, seq, base, lsn) in self.records.items():
+			offset = self.mftlcn*CLUSTER + recno*RECORD
+			self.data[offset:offset+RECORD] = record(attrs, recno, flags, seq, base, lsn)
+		open(path, 'wb').write(self.data)
@@ -0,0 +1,70 @@
+# -*- coding: mbcs -*-
+import os
+import shutil
+import tempfile
+import unittest
+from NTFStools.DiskFile import opendisk
+from NTFStools.Utilities import *
+from tests.ntfsimage import *
+
+
+class SplitMFTImage(Image):
+	"La $MFT ha un $ATTRIBUTE_LIST: il secondo segmento del suo $DATA  nel record 15"
+	def mft_attributes(self, bitmap):
+		half = self.mftrecs*RECORD/CLUSTER/2
+		self.add(15, [nonresident(0x80, [(self.mftlcn + half, half)], 0, startvcn=half)])
+		return [standard_information(),
+		attribute_list([(0x10, 0), (0x20, 0), (0x30, 0), (0x80, 0), (0x80, 15, half), (0xB0, 0)]),
+		file_name(u'$MFT', 5, 3), nonresident(0x80, [(self.mftlcn, half)], self.mftrecs*RECORD),
+		resident(0xB0, bitmap)]
+
+
+class AttributeListTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.name = os.path.join(self.dir, 'ntfs.img')
+		img = SplitMFTImage()
+		img.mkdir(5, u'.', 5, [(u'big.db', 40), (u'late.txt', 50)])
+		a = img.write('A'*8192)
+		b = img.write('B'*4096)
+		img.add(40, [standard_information(), file_name(u'big.db', 5, 1),
+		attribute_list([(0x10, 40), (0x20, 40), (0x30, 40), (0x30, 41), (0x80, 41), (0x80, 42, 2)])])
+		img.add(41, [file_name(u'BIG~1.DB', 5, 2), nonresident(0x80, [(a, 2)], 8192+100)], base=40)
+		img.add(42, [nonresident(0x80, [(b, 1)], 0, startvcn=2)], base=40)
+		img.mkfile(50, u'late.txt', 5, 'late record', 1) # oltre il primo segmento della $MFT
+		img.build(self.name)
+		self.disk = opendisk(self.name)
+		self.disk.enable_stats()
+		self.mft = ntfs_open_mft(self.disk)
+
+	def tearDown(self):
+		self.disk.close()
+		shutil.rmtree(self.dir)
+
+	def test_mft(self):
+		self.assertEqual(self.mft._stream.size, 64*1024)
+		self.assertEqual(self.mft.next(50).find_attribute("$DATA")[0].file.read(), 'late record')
+		self.assertEqual(ntfs_open_file(u'/late.txt', self.mft._stream, self.disk).dwMFTRecNumber, 50)
+
+	def test_lazy(self):
+		r = self.mft.next(40)
+		mft = lambda: self.disk.stats.export()['tags']['mft']['requests']
+		before = mft()
+		self.assertEqual(r.find_attribute("$STANDARD_INFORMATION")[0].u64CTime, NT_TIME)
+		self.assertEqual(mft(), before) # i record di estensione non sono ancora letti
+		self.assertEqual([n.FileName for n in r.find_attribute("$FILE_NAME")], [u'big.db', u'BIG~1.DB'])
+		self.assertEqual(mft(), before + 1)
+		data = r.find_attribute("$DATA")
+		self.assertEqual(len(data), 1) # i due segmenti riuniti
+		self.assertEqual(data[0].file.size, 8192+100)
+		s = data[0].file.read().tostring()
+		self.assertEqual(s, 'A'*8192 + 'B'*100)
+		# i record di estensione sono ora nella cache del disco
+		before, hits = mft(), self.disk.mftrecords.stats()['hits']
+		self.mft.next(40).find_attribute("$DATA")
+		self.assertEqual(mft(), before + 1) # il solo record base
+		self.assertEqual(self.disk.mftrecords.stats()['hits'], hits + 2)
+
+
+if __name__ == '__main__':
+	unittest.main()
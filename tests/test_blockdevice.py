@@ -0,0 +1,56 @@
+# -*- coding: mbcs -*-
+import os
+import random
+import shutil
+import stat
+import tempfile
+import unittest
+from NTFStools.DiskFile import *
+
+
+class BlockDeviceTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.name = os.path.join(self.dir, 'disk.img')
+		self.raw = os.urandom(3<<20) + 'x'*1000
+		open(self.name, 'wb').write(self.raw)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def test_size(self):
+		disk = DiskFile(self.name)
+		self.assertEqual(disk.size, len(self.raw))
+		self.assertEqual(disk.sectorsize, 512)
+		disk.seek(1000, 2) # dalla fine
+		self.assertEqual(disk.read().tostring(), 'x'*1000)
+		disk.close()
+
+	def test_direct(self):
+		"Letture in blocco in O_DIRECT (dove il file system non lo ammette, come tmpfs, ordinarie)"
+		disk = opendisk(self.name, direct=1)
+		self.assertFalse(isinstance(disk, MappedDiskFile))
+		r = random.Random(2)
+		for i in range(50):
+			offset = r.randrange(len(self.raw))
+			size = r.choice([100, 4096, 1<<20, 1500000])
+			self.assertEqual(disk.read_at(offset, size).tostring(), self.raw[offset:offset+size])
+		disk.close()
+
+	def test_device(self):
+		"Su Linux, il primo dispositivo a blocchi leggibile (se c')"
+		for name in ('/dev/loop0', '/dev/sda', '/dev/vda', '/dev/nvme0n1'):
+			if os.path.exists(name) and stat.S_ISBLK(os.stat(name).st_mode) and os.access(name, os.R_OK):
+				break
+		else:
+			self.skipTest("nessun dispositivo a blocchi accessibile")
+		try:
+			disk = DiskFile(name)
+		except IOError:
+			self.skipTest("%s non leggibile" % name)
+		self.assertTrue(disk.sectorsize >= 512 and disk.blocksize % disk.sectorsize == 0)
+		disk.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,126 @@
+# -*- coding: mbcs -*-
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+from NTFStools.BulkCopy import *
+from NTFStools.Catalog import Catalog
+from NTFStools.DiskFile import opendisk
+from NTFStools.Utilities import ntfs_open_mft
+from tests.ntfsimage import *
+
+
+class Warnings(logging.Handler):
+	"Raccoglie gli avvisi registrati"
+	def __init__ (self):
+		logging.Handler.__init__(self, logging.WARNING)
+		self.messages = []
+
+	def emit(self, record):
+		self.messages += [record.getMessage()]
+
+
+class BulkCopyTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.name = os.path.join(self.dir, 'ntfs.img')
+		self.out = os.path.join(self.dir, 'out')
+		img = Image(clusters=1024)
+		files = {20: (u'A.pf', 31), 21: (u'B.PF', 31), 22: (u'c.txt', 31), 23: (u'SYSTEM', 33),
+		24: (u'SOFTWARE', 33), 25: (u'NTUSER.DAT', 35), 26: (u'NTUSER.DAT', 36)}
+		# tre frammenti per file, sparsi e intercalati sul disco
+		r = random.Random(2)
+		pieces = [(n, k) for n in files for k in range(3)]
+		r.shuffle(pieces)
+		runs, self.content = {}, {}
+		for n, k in pieces:
+			s = os.urandom(2*CLUSTER)
+			runs.setdefault(n, {})[k] = (img.write(s), 2)
+			img.alloc(1)
+			self.content.setdefault(n, {})[k] = s
+		for n, (name, parent) in files.items():
+			size = 6*CLUSTER - n
+			self.content[n] = ''.join([self.content[n][k] for k in range(3)])[:size]
+			img.add(n, [standard_information(), file_name(name, parent), nonresident(0x80, [runs[n][k] for k in range(3)], size)])
+		img.mkfile(27, u'small.txt', 5, 'hello resident', 1)
+		lcn = img.write('S'*CLUSTER)
+		img.add(28, [standard_information(), file_name(u'sparse.bin', 33), nonresident(0x80, [(None, 10), (lcn, 1), (None, 5)], 16*CLUSTER - 100)])
+		img.mkdir(30, u'Windows', 5, [(u'Prefetch', 31), (u'System32', 32)])
+		img.mkdir(31, u'Prefetch', 30, [(u'A.pf', 20), (u'B.PF', 21), (u'c.txt', 22)])
+		img.mkdir(32, u'System32', 30, [(u'config', 33)])
+		img.mkdir(33, u'config', 32, [(u'SYSTEM', 23), (u'SOFTWARE', 24), (u'sparse.bin', 28), (u'Journal', 37)])
+		img.mkdir(34, u'Users', 5, [(u'bob', 35), (u'alice', 36)])
+		img.mkdir(35, u'bob', 34, [(u'NTUSER.DAT', 25)])
+		img.mkdir(36, u'alice', 34, [(u'NTUSER.DAT', 26)])
+		img.mkdir(37, u'Journal', 33, []) # directory vuota
+		img.mkdir(5, u'.', 5, [(u'Windows', 30), (u'Users', 34), (u'small.txt', 27)], 5)
+		img.build(self.name)
+		self.disk = opendisk(self.name)
+		self.mft = ntfs_open_mft(self.disk)
+
+	def tearDown(self):
+		self.disk.close()
+		shutil.rmtree(self.dir)
+
+	def glob(self, pattern, catalog=None):
+		return [(p, r.dwMFTRecNumber) for p, r in ntfs_glob(pattern, self.mft, self.disk, catalog)]
+
+	def test_glob(self):
+		self.assertEqual(self.glob(u'\\Windows\\Prefetch\\*.pf'), [(u'A.pf', 20), (u'B.PF', 21)])
+		self.assertEqual(self.glob('C:\\users\\*\\ntuser.dat'), [(os.path.join(u'alice', u'NTUSER.DAT'), 26), (os.path.join(u'bob', u'NTUSER.DAT'), 25)])
+		config = [(u'config', 33), (os.path.join(u'config', u'Journal'), 37), (os.path.join(u'config', u'SOFTWARE'), 24),
+		(os.path.join(u'config', u'sparse.bin'), 28), (os.path.join(u'config', u'SYSTEM'), 23)]
+		self.assertEqual(self.glob(u'/Windows/System32/config'), config)
+		self.assertEqual(self.glob(u'\\small.txt'), [(u'small.txt', 27)])
+		self.assertEqual(self.glob(u'\\Windows\\nope\\*'), [])
+		self.assertEqual(self.glob(u'\\Users\\b[o]b'), [(u'bob', 35), (os.path.join(u'bob', u'NTUSER.DAT'), 25)])
+		catalog = Catalog(os.path.join(self.dir, 'ntfs.catalog'))
+		catalog.build(self.disk)
+		self.assertEqual(self.glob(u'/Windows/System32/config', catalog), config)
+		catalog.close()
+
+	def test_copy(self):
+		disk = sys.modules[self.disk.__class__.__module__].DiskFile
+		order = []
+		copy_extent = disk.copy_extent
+		def spy(self, offset, size, outstream, *args):
+			order.append(offset)
+			return copy_extent(self, offset, size, outstream, *args)
+		disk.copy_extent = spy
+		try:
+			files = []
+			for pattern in (u'\\Windows\\Prefetch\\*.pf', u'\\Users\\*\\NTUSER.DAT', u'\\Windows\\System32\\config', u'\\small.txt'):
+				files += list(ntfs_glob(pattern, self.mft, self.disk))
+			self.assertEqual(ntfs_bulk_copy(files, self.out, maxopen=2), (8, 6*(6*CLUSTER) - (20+21+23+24+25+26) + 14 + 16*CLUSTER - 100))
+		finally:
+			disk.copy_extent = copy_extent
+		self.assertEqual(order, sorted(order)) # in ordine fisico
+		self.assertEqual(len(order), 6*3 + 1)
+		expected = {'A.pf': 20, 'B.PF': 21, 'config/SYSTEM': 23, 'config/SOFTWARE': 24, 'bob/NTUSER.DAT': 25, 'alice/NTUSER.DAT': 26}
+		for path, n in expected.items():
+			path = os.path.join(self.out, *path.split('/'))
+			self.assertEqual(open(path, 'rb').read(), self.content[n], path)
+			self.assertEqual(int(os.stat(path).st_mtime), 1455526400)
+		self.assertEqual(open(os.path.join(self.out, 'small.txt'), 'rb').read(), 'hello resident')
+		s = open(os.path.join(self.out, 'config', 'sparse.bin'), 'rb').read()
+		self.assertEqual(s, '\x00'*10*CLUSTER + 'S'*CLUSTER + '\x00'*(5*CLUSTER - 100))
+		self.assertTrue(os.path.isdir(os.path.join(self.out, 'config', 'Journal'))) # anche se vuota
+
+	def test_collision(self):
+		"Una destinazione ripetuta  ignorata, con un avviso"
+		files = list(ntfs_glob(u'\\Windows\\Prefetch\\A.pf', self.mft, self.disk)) * 2
+		handler = Warnings()
+		logging.getLogger().addHandler(handler)
+		try:
+			self.assertEqual(ntfs_bulk_copy(files, self.out), (1, 6*CLUSTER - 20))
+		finally:
+			logging.getLogger().removeHandler(handler)
+		self.assertEqual(len(handler.messages), 1)
+		self.assertTrue(handler.messages[0].startswith('A.pf: destinazione'))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,72 @@
+# -*- coding: mbcs -*-
+import os
+import shutil
+import tempfile
+import unittest
+from NTFStools.BulkMFT import *
+from NTFStools.DiskFile import opendisk
+from NTFStools.Record import Record
+from tests.ntfsimage import *
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+@unittest.skipIf(numpy is None, "numpy non disponibile")
+class BulkMFTTest(unittest.TestCase):
+	def setUp(self):
+		recs = [record([standard_information(), file_name(u'PROGRA~1', 5, 2, 0x10000000),
+		file_name(u'Program Files \xe8', 5, 1, 0x10000000)], 0, flags=3, seq=7),
+		record([standard_information(), file_name(u'ciao.txt', 0, 0), resident(0x80, 'hello world')], 1),
+		record([standard_information(), file_name(u'deleted.txt', 0), resident(0x80, 'x')], 2, flags=0),
+		record([nonresident(0x80, [(100, 3)], 10000)], 3, base=1, seq=2)]
+		bad = bytearray(record([standard_information(), file_name(u'bad', 0)], 4))
+		bad[510] = 0 # fixup errato
+		self.buf = ''.join(recs) + str(bad) + '\x00'*1024
+
+	def test_decode(self):
+		cols = mft_decode(self.buf, 100)
+		self.assertEqual(list(cols['recno']), range(100, 106))
+		self.assertEqual(list(cols['valid']), [True]*4 + [False]*2)
+		self.assertEqual(list(cols['flags'][:4]), [3, 1, 0, 1])
+		self.assertEqual(list(cols['sequence'][:4]), [7, 1, 1, 2])
+		self.assertEqual(cols['base'][3], 1)
+		self.assertEqual(cols['name'][0], u'Program Files \xe8') # Win32 anzich DOS
+		self.assertEqual(cols['namespace'][0], 1)
+		self.assertEqual((cols['name'][1], cols['parent'][1], cols['parent_sequence'][1]), (u'ciao.txt', 0, 1))
+		self.assertEqual((cols['size'][1], cols['resident'][1]), (11, True))
+		self.assertEqual((cols['size'][3], cols['resident'][3]), (10000, False))
+		self.assertEqual(cols['size'][0], 5000) # senza $DATA: dal $FILE_NAME
+		self.assertEqual([int(cols[k][1]) - NT_TIME for k in ('si_ctime', 'si_atime', 'si_mtime', 'si_rtime')], [0, 1, 2, 3])
+		self.assertEqual(cols['name'][2], u'') # record libero
+		self.assertEqual(mft_decode('', 0)['name'].shape, (0,))
+
+	def test_stream(self):
+		"Decodifica a blocchi e confronto con Record"
+		dir = tempfile.mkdtemp()
+		try:
+			img = Image()
+			img.mkdir(5, u'.', 5, [])
+			for n in range(16, 60, 3):
+				img.mkfile(n, u'file%d.txt' % n, 5, 'x' * (n*10), n % 2)
+			img.build(os.path.join(dir, 'ntfs.img'))
+			disk = opendisk(os.path.join(dir, 'ntfs.img'))
+			disk.seek(img.mftlcn * CLUSTER)
+			mft = Record(disk, disk) # il record $MFT, letto dal disco...
+			mft = Record(mft.find_attribute("$DATA")[0].file, disk) # ...e attraverso il suo $DATA
+			cols = mft_decode_stream(mft.find_attribute("$DATA")[0].file, chunksize=5000)
+			self.assertEqual(len(cols['recno']), 64)
+			for n in [0, 5, 10] + range(16, 60, 3): # i record in uso
+				r = mft.next(n)
+				self.assertEqual(cols['name'][n], r.find_attribute("$FILE_NAME")[0].FileName)
+				self.assertEqual(cols['sequence'][n], r.wSequence)
+				if n >= 16:
+					self.assertEqual((cols['size'][n], cols['resident'][n]), (n*10, bool(n % 2)))
+			disk.close()
+		finally:
+			shutil.rmtree(dir)
+
+
+if __name__ == '__main__':
+	unittest.main()
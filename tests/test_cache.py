@@ -0,0 +1,122 @@
+# -*- coding: mbcs -*-
+import random
+import sys
+import threading
+import unittest
+from StringIO import StringIO
+from NTFStools.Cache import *
+
+
+class PolicyTest(unittest.TestCase):
+	"Correttezza e limite di memoria di ogni politica"
+	def test_budget(self):
+		r = random.Random(1)
+		for name, policy in sorted(cache_policies.items()):
+			cache = policy(64*1024)
+			stored = {}
+			for i in range(5000):
+				key = r.randrange(200)
+				if r.random() < 0.5:
+					data = chr(65 + key % 26) * r.choice([512, 4096, 10000])
+					cache.put(key, data)
+					stored[key] = data
+				else:
+					data = cache.get(key)
+					if data is not None:
+						self.assertEqual(data, stored[key], name)
+				self.assertTrue(cache.used <= cache.maxsize, name)
+			# used  la somma dei blocchi presenti
+			present = [k for k in stored if k in cache]
+			self.assertEqual(len(present), len(cache), name)
+			self.assertEqual(sum([len(stored[k]) for k in present]), cache.used, name)
+			self.assertTrue(cache.evictions > 0, name)
+			cache.clear()
+			self.assertEqual((len(cache), cache.used), (0, 0), name)
+
+	def test_update(self):
+		for name, policy in sorted(cache_policies.items()):
+			cache = policy(8192)
+			cache.put(1, 'a'*4096)
+			cache.put(1, 'b'*1000)
+			self.assertEqual(cache.get(1), 'b'*1000, name)
+			self.assertEqual(cache.used, 1000, name)
+			self.assertEqual(cache.get(2), None, name)
+			self.assertEqual((cache.hits, cache.misses), (1, 1), name)
+
+	def test_lru_order(self):
+		cache = LRUCache(3*4096)
+		for k in (1, 2, 3):
+			cache.put(k, 'x'*4096)
+		cache.get(1) # 2  ora il meno recente
+		cache.put(4, 'x'*4096)
+		self.assertTrue(1 in cache and 2 not in cache)
+
+	def test_clock_second_chance(self):
+		cache = ClockCache(3*4096)
+		for k in (1, 2, 3):
+			cache.put(k, 'x'*4096)
+		cache.get(1)
+		cache.put(4, 'x'*4096)
+		self.assertTrue(1 in cache and 2 not in cache)
+
+	def test_scan_resistance(self):
+		"Una scansione di blocchi letti una volta non scalza quelli richiesti di continuo"
+		for policy in (TwoQCache, ARCCache):
+			cache = policy(64*4096)
+			def touch(keys):
+				for k in keys:
+					if cache.get(k) is None:
+						cache.put(k, 'x'*4096)
+			hot = range(16)
+			touch(hot)
+			touch(range(1000, 1064))
+			touch(hot) # richiesti di nuovo (e ancora): ora sono blocchi "caldi"
+			touch(hot)
+			touch(range(2000, 2400)) # scansione
+			self.assertEqual([k for k in hot if k not in cache], [], policy.__name__)
+
+	def test_print_stats(self):
+		cache = LRUCache(4096)
+		cache.put(1, 'x'*10)
+		cache.get(1); cache.get(1); cache.get(1); cache.get(2)
+		stdout, sys.stdout = sys.stdout, StringIO()
+		try:
+			cache.print_stats()
+			out = sys.stdout.getvalue()
+		finally:
+			sys.stdout = stdout
+		# la percentuale  quella dei riscontri, accanto ai riscontri
+		self.assertTrue('Riscontri dalla cache: 3 (75.00%), mancati: 1,' in out, out)
+
+
+class StripedCacheTest(unittest.TestCase):
+	def test_threads(self):
+		cache = StripedCache(LRUCache, 1<<20, stripes=4)
+		errors = []
+		def worker(seed):
+			r = random.Random(seed)
+			for i in range(3000):
+				k = r.randrange(500)
+				data = cache.get(k)
+				if data is None:
+					cache.put(k, str(k)*10)
+				elif data != str(k)*10:
+					errors.append(k)
+		threads = [threading.Thread(target=worker, args=(i,)) for i in range(6)]
+		for t in threads: t.start()
+		for t in threads: t.join()
+		self.assertEqual(errors, [])
+		s = cache.stats()
+		self.assertEqual(s['hits'] + s['misses'], 6*3000)
+		self.assertEqual(s['policy'], 'LRUCache')
+		self.assertTrue(s['used'] <= cache.maxsize)
+
+	def test_makecache(self):
+		self.assertTrue(isinstance(makecache(), StripedCache))
+		self.assertEqual(makecache('arc', 1<<20).policy, ARCCache)
+		cache = LRUCache()
+		self.assertTrue(makecache(cache) is cache)
+
+
+if __name__ == '__main__':
+	unittest.main()
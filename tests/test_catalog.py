@@ -0,0 +1,97 @@
+# -*- coding: mbcs -*-
+import os
+import shutil
+import tempfile
+import unittest
+from NTFStools.Catalog import *
+from NTFStools.DiskFile import opendisk
+from NTFStools.Utilities import ntfs_open_mft
+from tests.ntfsimage import *
+
+
+def ascii_upper(s):
+	"$UpCase che converte le sole lettere ASCII"
+	return u''.join([c < u'\x80' and c.upper() or c for c in s])
+
+
+class CatalogTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.name = os.path.join(self.dir, 'ntfs.img')
+		self.catalog = Catalog(catalog_path(self.name))
+
+	def tearDown(self):
+		self.catalog.close()
+		shutil.rmtree(self.dir)
+
+	def make(self, extsize=5000, deleted=0):
+		"Un file con il $DATA in un record di estensione, elencato dal suo $ATTRIBUTE_LIST"
+		img = Image(upper=ascii_upper)
+		img.mkdir(5, u'.', 5, [(u'\xe9t\xe9', 20), (u'big', 30), (u'Docs', 40)])
+		img.mkfile(20, u'\xe9t\xe9', 5, 'x', 1)
+		lcn = img.write('y' * 8000)
+		img.add(30, [standard_information(), file_name(u'big'), attribute_list([(0x10, 30), (0x30, 30), (0x80, 31 | 1<<48)])])
+		img.add(31, [nonresident(0x80, [(lcn, 2)], extsize)], seq=extsize/1000, base=30)
+		img.mkdir(40, u'Docs', 5, [(u'a.txt', 41)])
+		img.mkfile(41, u'a.txt', 40, 'aaa', 1)
+		if deleted:
+			img.add(41, [standard_information(), file_name(u'a.txt', 40)], flags=0, seq=2)
+		img.build(self.name)
+
+	def test_build_lookup(self):
+		self.make()
+		disk = opendisk(self.name)
+		self.assertEqual(self.catalog.build(disk), (8, 0))
+		self.assertEqual(len(self.catalog), 8)
+		self.assertEqual(self.catalog.lookup(u'/Docs/a.txt'), 41)
+		self.assertEqual(self.catalog.lookup('C:\\DOCS\\A.TXT'), 41)
+		# maiuscole secondo la $UpCase del volume, non secondo Python
+		self.assertEqual(self.catalog.lookup(u'/\xe9T\xe9'), 20)
+		self.assertEqual(self.catalog.lookup(u'/\xc9t\xe9'), None)
+		self.assertEqual(self.catalog.lookup(u'/Docs/none'), None)
+		self.assertEqual(self.catalog.record(30)['size'], 5000)
+		self.assertEqual([row[:3] for row in self.catalog.listdir(u'/Docs')], [(u'a.txt', 41, 3)])
+		disk.close()
+		# il catalogo riaperto ha ancora la sua $UpCase
+		catalog = Catalog(catalog_path(self.name))
+		self.assertEqual(catalog.lookup(u'/\xc9t\xe9'), None)
+		self.assertEqual(catalog.lookup(u'/BIG'), 30)
+		catalog.close()
+
+	def test_refresh(self):
+		self.make()
+		disk = opendisk(self.name)
+		self.catalog.build(disk)
+		disk.close()
+		self.make(7000) # cambia soltanto il record di estensione
+		disk = opendisk(self.name)
+		self.assertEqual(self.catalog.refresh(disk), (2, 0))
+		self.assertEqual(self.catalog.record(30)['size'], 7000)
+		self.assertEqual(self.catalog.refresh(disk), (0, 0))
+		disk.close()
+		self.make(7000, deleted=1)
+		disk = opendisk(self.name)
+		self.assertEqual(self.catalog.refresh(disk), (0, 1))
+		self.assertEqual(self.catalog.lookup(u'/Docs/a.txt'), None)
+		disk.close()
+
+	def test_open(self):
+		self.make()
+		disk = opendisk(self.name)
+		mft = ntfs_open_mft(disk)
+		self.catalog.build(disk)
+		self.assertEqual(self.catalog.open(u'/Docs/a.txt', mft).dwMFTRecNumber, 41)
+		# un catalogo incompleto  aggiornato
+		self.catalog.db.execute('DELETE FROM records WHERE recno=41')
+		self.assertEqual(self.catalog.open(u'/Docs/a.txt', mft).dwMFTRecNumber, 41)
+		self.assertEqual(self.catalog.open(u'/Docs/b.txt', mft), None)
+		disk.close()
+		# file eliminato dopo la costruzione del catalogo
+		self.make(deleted=1)
+		disk = opendisk(self.name)
+		self.assertEqual(self.catalog.open(u'/Docs/a.txt', ntfs_open_mft(disk)), None)
+		disk.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: mbcs -*-
+import gzip
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+from NTFStools.CompressedImage import *
+from NTFStools.DiskFile import opendisk
+
+compressed = sys.modules[GzipDiskFile.__module__]
+
+
+class CompressedImageTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		r = random.Random(3)
+		words = [''.join([chr(97+r.randrange(26)) for j in range(r.randrange(2, 9))]) for i in range(2000)]
+		text = ' '.join([r.choice(words) for i in range(300000)])
+		self.raw = text + os.urandom(300000) + '\0'*500000 + text[:700000]
+		self.name = os.path.join(self.dir, 'disk.img')
+		open(self.name, 'wb').write(self.raw)
+		self.gz = self.name + '.gz'
+		f = open(self.gz, 'wb')
+		for k in range(0, len(self.raw), 1500000): # pi membri, come con pigz
+			g = gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6)
+			g.write(self.raw[k:k+1500000])
+			g.close()
+		f.close()
+		compressed._gzindexes.clear()
+
+	def tearDown(self):
+		compressed._gzindexes.clear()
+		shutil.rmtree(self.dir)
+
+	def check(self, disk):
+		self.assertEqual(disk.size, len(self.raw))
+		r = random.Random(1)
+		for i in range(60):
+			offset = r.randrange(len(self.raw))
+			size = r.choice([1, 512, 70000, 300000])
+			self.assertEqual(disk.read_at(offset, size).tostring(), self.raw[offset:offset+size])
+
+	def test_gzip(self):
+		disk = opendisk(self.gz)
+		self.assertTrue(isinstance(disk, GzipDiskFile))
+		disk.close()
+		# l'indice gi costruito vale per ogni span: lo si scarta per averne uno pi fitto
+		compressed._gzindexes.clear()
+		if os.path.exists(gzindex_path(self.gz)):
+			os.remove(gzindex_path(self.gz))
+		disk = GzipDiskFile(self.gz, span=256<<10)
+		self.assertTrue(len(disk._points) > 4)
+		self.check(disk)
+		disk.close()
+
+	def test_gzip_index(self):
+		if not compressed._libz:
+			self.skipTest("zlib della libreria C non disponibile")
+		GzipDiskFile(self.gz, span=256<<10).close()
+		self.assertTrue(os.path.exists(gzindex_path(self.gz)))
+		# riaperto, l'indice  riletto dal file e non ricostruito
+		compressed._gzindexes.clear()
+		build = GzipDiskFile._build
+		GzipDiskFile._build = None
+		try:
+			disk = GzipDiskFile(self.gz, span=256<<10)
+		finally:
+			GzipDiskFile._build = build
+		self.check(disk)
+		disk.close()
+		# cambiata la data del file, l'indice  ricostruito
+		compressed._gzindexes.clear()
+		os.utime(self.gz, (1, 1))
+		calls = []
+		GzipDiskFile._build = lambda self: calls.append(1) or build(self)
+		try:
+			disk = GzipDiskFile(self.gz, span=256<<10)
+		finally:
+			GzipDiskFile._build = build
+		self.assertEqual(calls, [1])
+		self.check(disk)
+		disk.close()
+
+	def test_gzip_without_libz(self):
+		libz = compressed._libz
+		compressed._libz = None
+		try:
+			disk = GzipDiskFile(self.gz, span=512<<10, index=None)
+			self.check(disk)
+			disk.close()
+		finally:
+			compressed._libz = libz
+
+	def test_chunked(self):
+		codecs = ['zlib']
+		if compressed.lzma:
+			codecs += ['lzma']
+		for codec in codecs:
+			name = self.name + '.' + codec
+			make_chunked_image(self.name, name, codec, 256<<10)
+			disk = opendisk(name)
+			self.assertTrue(isinstance(disk, ChunkedDiskFile))
+			self.check(disk)
+			disk.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
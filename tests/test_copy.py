@@ -0,0 +1,70 @@
+# -*- coding: mbcs -*-
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from NTFStools.Commons import nt2epoch
+from NTFStools.DiskFile import *
+from NTFStools.Utilities import *
+from tests.ntfsimage import *
+
+
+class CopyExtentTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.name = os.path.join(self.dir, 'disk.img')
+		self.raw = os.urandom(3<<20)
+		open(self.name, 'wb').write(self.raw)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def test_copy_extent(self):
+		r = random.Random(5)
+		out = os.path.join(self.dir, 'out')
+		for cls in (DiskFile, MappedDiskFile):
+			disk = cls(self.name)
+			for i in range(20):
+				offset, size = r.randrange(len(self.raw)), r.choice([1, 511, 4096, 100000, 2<<20])
+				f = open(out, 'wb')
+				f.write('x')
+				n = disk.copy_extent(offset, size, f, bufsize=64<<10)
+				f.close()
+				expected = self.raw[offset:offset+size]
+				self.assertEqual(n, len(expected)) # meno di size alla fine del disco
+				self.assertEqual(open(out, 'rb').read(), 'x' + expected, cls.__name__)
+			disk.close()
+
+
+class CopyFileTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		name = os.path.join(self.dir, 'ntfs.img')
+		img = Image(clusters=1024)
+		img.mkdir(5, u'.', 5, [])
+		self.content = os.urandom(3*CLUSTER + 100)
+		a = img.write(self.content[:2*CLUSTER])
+		img.alloc(1)
+		b = img.write(self.content[2*CLUSTER:])
+		img.add(20, [standard_information(), file_name(u'frag.bin'), nonresident(0x80, [(a, 2), (b, 2)], len(self.content))])
+		img.mkfile(21, u'small.txt', 5, 'residente', 1)
+		img.build(name)
+		self.disk = opendisk(name)
+		self.mft = ntfs_open_mft(self.disk)
+
+	def tearDown(self):
+		self.disk.close()
+		shutil.rmtree(self.dir)
+
+	def test_copy(self):
+		for n, expected in ((20, self.content), (21, 'residente')):
+			out = os.path.join(self.dir, 'out%d' % n)
+			ntfs_copy_file(self.mft.next(n), out)
+			st = os.stat(out) # prima di leggerlo, che ne cambierebbe la data di accesso
+			self.assertEqual((int(st.st_atime), int(st.st_mtime)), (1455526400, 1455526400))
+			self.assertEqual(open(out, 'rb').read(), expected)
+		self.assertEqual(nt2epoch(116444736000000000 + 15), 1.5e-6)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,82 @@
+# -*- coding: mbcs -*-
+import os
+import shutil
+import tempfile
+import unittest
+from NTFStools.Cache import DentryCache
+from NTFStools.DiskFile import opendisk
+from NTFStools.Utilities import *
+from tests.ntfsimage import *
+
+
+class DentryCacheTest(unittest.TestCase):
+	def test_cache(self):
+		cache = DentryCache(maxitems=2)
+		self.assertEqual(cache.get(5, u'A'), None)
+		cache.put(5, u'A', 16 | (1<<48))
+		cache.put(5, u'B', 0, lsn=100)
+		self.assertEqual(cache.get(5, u'A'), 16 | (1<<48))
+		self.assertEqual(cache.get(5, u'B', 100), 0)
+		self.assertEqual(cache.get(5, u'B', 101), None) # la directory  cambiata
+		self.assertEqual(cache.get(5, u'B', 101), None)
+		cache.put(5, u'C', 17)
+		cache.put(5, u'D', 18)
+		self.assertEqual(cache.get(5, u'A'), None) # eliminata
+		s = cache.stats()
+		self.assertEqual((s['hits'], s['negative_hits'], s['misses'], s['stales'], s['evictions']), (2, 1, 4, 1, 1))
+		cache.stale(5, u'D')
+		self.assertEqual((cache.stats()['stales'], len(cache)), (2, 1))
+
+
+class OpenFileTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.name = os.path.join(self.dir, 'ntfs.img')
+		self.make(1)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def make(self, lsn, created=0):
+		img = Image()
+		img.mkdir(5, u'.', 5, [(u'Windows', 6)])
+		items = [(u'x.dll', 17)]
+		if created:
+			items += [(u'y.dll', 18)]
+			img.mkfile(18, u'y.dll', 6, 'y')
+		img.mkdir(6, u'Windows', 5, items, lsn=lsn)
+		img.mkfile(17, u'x.dll', 6, 'x')
+		img.build(self.name)
+
+	def test_open_file(self):
+		disk = opendisk(self.name)
+		disk.enable_stats()
+		mft = ntfs_open_mft(disk)
+		indx = lambda: disk.stats.export()['tags'].get('indx', {}).get('requests', 0)
+		paths = ['C:\\Windows\\x.dll', '/windows/X.DLL', '/Windows/y.dll']
+		self.assertEqual([ntfs_open_file(p, mft._stream, disk) and 1 for p in paths], [1, 1, None])
+		before = indx()
+		self.assertEqual([ntfs_open_file(p, mft._stream, disk) and 1 for p in paths], [1, 1, None])
+		self.assertEqual(indx(), before) # tutte dalla cache, anche quella negativa
+		self.assertEqual(disk.dentries.stats()['negative_hits'], 1)
+		# record riutilizzato: la sequenza non  quella annotata
+		disk.dentries.put(6 | (1<<48), u'X.DLL', 17 | (5<<48))
+		self.assertEqual(ntfs_open_file('/Windows/x.dll', mft._stream, disk).dwMFTRecNumber, 17)
+		self.assertEqual(disk.dentries.stales, 1)
+		disk.close()
+
+	def test_negative_expires(self):
+		"Un nome non trovato  cercato di nuovo se la directory ha cambiato LSN"
+		disk = opendisk(self.name)
+		mft = ntfs_open_mft(disk)
+		self.assertEqual(ntfs_open_file('/Windows/y.dll', mft._stream, disk), None)
+		self.make(2, created=1) # il file  creato: cambia l'LSN della directory
+		mft = ntfs_open_mft(disk)
+		disk.cache.clear()
+		self.assertEqual(ntfs_open_file('/Windows/y.dll', mft._stream, disk).dwMFTRecNumber, 18)
+		self.assertEqual(disk.dentries.stales, 1)
+		disk.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,74 @@
+# -*- coding: mbcs -*-
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from NTFStools.DiskFile import opendisk
+from NTFStools.Index import *
+from NTFStools.Utilities import *
+from tests.ntfsimage import *
+
+
+class IndexTreeTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.name = os.path.join(self.dir, 'ntfs.img')
+		r = random.Random(1)
+		self.big = [(u'f%04d_%s.dat' % (i, r.choice('aB_z')), 40) for i in range(300)]
+		self.big += [(u'_under', 41), (u'Stra\xdfe', 42), (u'\xe9t\xe9', 43), (u'System32', 7)]
+		img = Image(clusters=512)
+		img.mkdir(5, u'.', 5, [(u'Windows', 6), (u'a.txt', 16)], 5)
+		img.mkdir(6, u'Windows', 5, self.big)
+		img.mkdir(7, u'System32', 6, [(u'x.dll', 17)])
+		for n in (16, 17, 40, 41, 42, 43):
+			img.mkfile(n, u'n%d' % n, 5, 'record %d' % n)
+		img.build(self.name)
+		self.disk = opendisk(self.name)
+		self.mft = ntfs_open_mft(self.disk)
+		self.upcase = ntfs_open_upcase(self.mft)
+
+	def tearDown(self):
+		self.disk.close()
+		shutil.rmtree(self.dir)
+
+	def test_upcase(self):
+		self.assertEqual(self.upcase.upper(u'Stra\xdfe \xe9t\xe9'), u'STRA\xdfE \xc9T\xc9')
+		self.assertEqual(self.upcase.upper('ntuser.dat'), u'NTUSER.DAT') # anche una stringa di byte
+		self.assertEqual(self.upcase.tostring(), upcase_table())
+		self.assertEqual(UpCase().upper(u'\xe9t\xe9'), u'\xc9T\xc9') # senza tabella, le regole di Python
+		self.assertEqual(UpCase().tostring(), '')
+
+	def test_iterate(self):
+		tree = IndexTree(self.mft.next(6), self.upcase)
+		names = [e.FileName for e in tree]
+		self.assertEqual(names, [n for n, r in sorted(self.big, key=lambda x: upper(x[0]))])
+		self.assertEqual([e.FileName for e in tree.iterate(u'f0100', u'F0103')], names[100:103])
+		self.assertEqual([e.FileName for e in tree.prefix(u'F012')], names[120:130])
+		self.assertEqual([e.FileName for e in tree.prefix(u'zzz')], [])
+
+	def test_find(self):
+		stats = self.disk.enable_stats()
+		tree = IndexTree(self.mft.next(6), self.upcase)
+		tree.find(self.big[150][0])
+		# un nome  cercato leggendo un blocco per livello, non l'intero indice
+		self.assertTrue(stats.export()['tags']['indx']['requests'] <= 3)
+		for name, n in self.big:
+			e = tree.find(name.lower())
+			self.assertEqual(e and e.u64mftReference & 0xFFFFFFFFFFFF, n, name)
+		self.assertEqual(tree.find(u'STRASSE'), None) # la  non ha maiuscola
+		self.assertEqual(tree.find(u'f0100'), None)
+
+	def test_open_file(self):
+		open_file = lambda path: ntfs_open_file(path, self.mft._stream, self.disk)
+		self.assertEqual(open_file(u'/a.txt').dwMFTRecNumber, 16)
+		self.assertEqual(open_file('C:\\WINDOWS\\system32\\X.DLL').dwMFTRecNumber, 17)
+		self.assertEqual(open_file(u'/Windows/stra\xdfe').dwMFTRecNumber, 42)
+		self.assertEqual(open_file(u'/Windows/\xc9T\xc9').dwMFTRecNumber, 43)
+		self.assertEqual(open_file(u'/Windows/f01*').dwMFTRecNumber, 40)
+		self.assertEqual(open_file(u'/Windows/nope'), None)
+		self.assertEqual(open_file(u'/a.txt/x'), None) # non  una directory
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,69 @@
+# -*- coding: mbcs -*-
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from NTFStools.DiskFile import *
+from NTFStools.IOStats import *
+
+
+class IOStatsTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.name = os.path.join(self.dir, 'disk.img')
+		open(self.name, 'wb').write(os.urandom(1<<20))
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def test_disabled(self):
+		disk = DiskFile(self.name)
+		iotag(disk, 'mft') # a strumentazione spenta non fa nulla
+		disk.read_at(0, 100)
+		self.assertEqual(disk.stats, None)
+		disk.close()
+
+	def test_tags(self):
+		disk = DiskFile(self.name, readahead=0)
+		stats = disk.enable_stats()
+		self.assertTrue(disk.enable_stats() is stats)
+		iotag(disk, 'boot')
+		disk.read_at(0, 512)
+		iotag(disk, 'mft')
+		disk.read_at(512<<10, 1024)
+		disk.read_at(512<<10, 1024) # dalla cache
+		s = stats.export(disk)
+		self.assertEqual(sorted(s['tags']), ['boot', 'mft'])
+		boot, mft = s['tags']['boot'], s['tags']['mft']
+		self.assertEqual((boot['requests'], boot['requested_bytes']), (1, 512))
+		self.assertEqual((mft['requests'], mft['requested_bytes']), (2, 2048))
+		self.assertEqual(boot['reads'], 1)
+		self.assertEqual(mft['reads'], 1)
+		self.assertEqual(mft['cache_hit_ratio'], 0.5)
+		self.assertEqual(s['total']['requests'], 3)
+		self.assertEqual(s['total']['reads'], 2)
+		# la lettura MFT dista 512 KiB meno un blocco dalla fine della precedente
+		self.assertEqual(mft['seek_histogram'], [(1<<19, 1)])
+		self.assertTrue('cache' in s)
+		disk.close()
+
+	def test_percentiles(self):
+		stats = IOStats()
+		for us in (1, 2, 3, 100, 1000):
+			stats.read(0, 1, us / 1000000.0, 'data')
+		p = stats.export()['tags']['data']['latency_us_percentiles']
+		self.assertEqual((p['p50'], p['p100']), (4, 1024))
+
+	def test_dump(self):
+		disk = DiskFile(self.name)
+		stats = disk.enable_stats()
+		disk.read_at(0, 100)
+		out = os.path.join(self.dir, 'stats.json')
+		stats.dump(out, disk)
+		self.assertEqual(json.load(open(out))['total']['requests'], 1)
+		disk.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
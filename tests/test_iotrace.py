@@ -0,0 +1,47 @@
+# -*- coding: mbcs -*-
+import os
+import shutil
+import tempfile
+import unittest
+from NTFStools.DiskFile import *
+from NTFStools.IOTrace import *
+
+
+class IOTraceTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.name = os.path.join(self.dir, 'disk.img')
+		self.trace = os.path.join(self.dir, 'disk.trace')
+		open(self.name, 'wb').write(os.urandom(1<<20))
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def test_record_replay(self):
+		disk = DiskFile(self.name)
+		disk.record_trace(self.trace)
+		disk.read_at(100, 10)
+		disk.seek(4096)
+		disk.read(512)
+		disk.read_extents([(0, 1), (8192, 100)])
+		disk.close() # chiude anche la traccia
+		self.assertEqual(list(read_trace(self.trace)), [(100, 10), (4096, 512), [(0, 1), (8192, 100)]])
+		disk = MappedDiskFile(self.name)
+		self.assertEqual(replay_trace(disk, self.trace)[:2], (3, 623))
+		disk.close()
+
+	def test_large(self):
+		"Lunghezze oltre i 4 GiB (ad esempio di un grosso file di paging)"
+		trace = IOTrace(self.trace)
+		trace.record(1<<40, 5<<30)
+		trace.batch([(0, 1<<33)])
+		trace.close()
+		self.assertEqual(list(read_trace(self.trace)), [(1<<40, 5<<30), [(0, 1<<33)]])
+
+	def test_bad(self):
+		open(self.trace, 'wb').write('NOTATRACE' * 4)
+		self.assertRaises(IOError, list, read_trace(self.trace))
+
+
+if __name__ == '__main__':
+	unittest.main()
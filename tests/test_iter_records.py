@@ -0,0 +1,46 @@
+# -*- coding: mbcs -*-
+import os
+import shutil
+import tempfile
+import unittest
+from NTFStools.Commons import EndOfStream
+from NTFStools.DiskFile import *
+from NTFStools.Utilities import *
+from tests.ntfsimage import *
+
+
+class IterRecordsTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.name = os.path.join(self.dir, 'ntfs.img')
+		img = Image()
+		img.mkdir(5, u'.', 5, [])
+		for n in range(16, 60, 3):
+			img.mkfile(n, u'file%d.txt' % n, 5, 'file %d ' % n * 100)
+		img.add(20, [standard_information(), file_name(u'gone.txt')], flags=0)
+		img.build(self.name, bitmap_extra=(20, 61)) # in uso per la $Bitmap, ma liberi
+		self.used = [0, 5, 10] + range(16, 60, 3)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def test_iter(self):
+		for disk in (DiskFile(self.name), opendisk(self.name)):
+			mft = ntfs_open_mft(disk)
+			self.assertEqual(disk.clustersize, 4096)
+			records = list(ntfs_iter_records(mft, chunksize=8192))
+			self.assertEqual([r.dwMFTRecNumber for r in records], self.used)
+			self.assertEqual([r._pos / 1024 for r in records], self.used)
+			self.assertEqual(ntfs_get_filename(records[-1]), u'file58.txt')
+			self.assertEqual(records[-1].find_attribute("$DATA")[0].file.read(8).tostring(), 'file 58 ')
+			self.assertEqual([r.dwMFTRecNumber for r in ntfs_iter_records(mft, first=17, last=30)], [19, 22, 25, 28])
+			select = lambda n, buf, i: n % 2
+			self.assertEqual([r.dwMFTRecNumber for r in ntfs_iter_records(mft, select=select)],
+			[n for n in self.used if n % 2])
+			self.assertEqual(mft.next(5).dwMFTRecNumber, 5)
+			self.assertRaises(EndOfStream, mft.next, 64)
+			disk.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
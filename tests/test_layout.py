@@ -0,0 +1,104 @@
+# -*- coding: mbcs -*-
+import array
+import struct
+import unittest
+from NTFStools.Commons import *
+from NTFStools.Index import Index_Entry
+from NTFStools.Record import Record
+from tests.ntfsimage import *
+
+_table = {
+0x00: ('dwMagic', '<I'),
+0x06: ('wValue', '<H'), # con 2 byte di riempimento prima
+0x08: ('u64Big', '<Q'),
+0x10: ('sName', '4s') }
+
+
+class Sample(object):
+	"Oggetto decodificato all'uso, come le classi del pacchetto"
+	_layout = compile_layout(_table)
+
+	def __init__ (self, buf, i=0):
+		self._buf = buf
+		self._i = i
+
+	__getattr__ = common_getattr
+
+
+class LayoutTest(unittest.TestCase):
+	def setUp(self):
+		self.buf = struct.pack('<I2xHQ4s', 0xCAFE, 7, 1<<40, 'NTFS') + 'coda'
+
+	def test_compiled_once(self):
+		layout = compile_layout(_table)
+		self.assertTrue(layout is Sample._layout)
+		self.assertTrue(compile_layout(_table, (_table, 0x20)) is compile_layout(_table, (_table, 0x20)))
+		self.assertEqual(layout.struct.format, '<I2xHQ4s')
+		self.assertEqual(layout.size, 0x14)
+
+	def test_decode(self):
+		f = compile_layout(_table).decode(self.buf)
+		self.assertEqual((f.dwMagic, f.wValue, f.u64Big, f.sName), (0xCAFE, 7, 1<<40, 'NTFS'))
+		self.assertFalse(hasattr(f, '__dict__'))
+		self.assertTrue('u64Big = 0x10000000000' in str(f))
+
+	def test_getattr(self):
+		s = Sample(self.buf)
+		self.assertEqual(s.sName, 'NTFS')
+		self.assertEqual(s.__dict__['wValue'], 7) # decodificati tutti al primo accesso
+		self.assertRaises(AttributeError, getattr, s, 'missing')
+		# buffer troppo corto per l'intero layout: solo il campo richiesto
+		s = Sample(self.buf[:8])
+		self.assertEqual(s.wValue, 7)
+		self.assertFalse('dwMagic' in s.__dict__)
+
+	def test_composed(self):
+		layout = compile_layout(_table, (_table, 0x20))
+		values = dict(zip(layout.names, layout.unpack(self.buf + '\x00'*12 + self.buf)))
+		self.assertEqual(values['sName'], 'NTFS')
+		self.assertEqual(layout.size, 0x34)
+
+	def test_overlapping(self):
+		layout = compile_layout({0: ('dwAll', '<I'), 2: ('wHigh', '<H')})
+		self.assertEqual(layout.struct, None)
+		self.assertEqual(layout.size, 4)
+		f = layout.decode(struct.pack('<HH', 1, 2))
+		self.assertEqual((f.dwAll, f.wHigh), (0x20001, 2))
+
+	def test_repeated_name(self):
+		layout = compile_layout({0: ('sReserved', '2s'), 2: ('wValue', '<H'), 4: ('sReserved', '2s')})
+		self.assertEqual(layout.names, ['wValue', 'sReserved'])
+		self.assertEqual(layout.decode('ab\x05\x00cd').sReserved, 'cd')
+
+
+class RecordStream(object):
+	"Stream minimo da cui Record legge un solo record"
+	def __init__(self, data):
+		self.data = data
+
+	def tell(self):
+		return 0
+
+	def read(self, size):
+		return array.array('c', self.data[:size])
+
+
+class FieldsTest(unittest.TestCase):
+	def test_record(self):
+		r = Record(RecordStream(record([standard_information(), file_name(u'pippo.txt')], 42, seq=9, base=7)))
+		self.assertFalse(hasattr(r, '__dict__') and 'dwMFTRecNumber' in r.__dict__) # negli slot
+		self.assertEqual((r.fileSignature, r.dwMFTRecNumber, r.wSequence, r.u64BaseMftRec), ('FILE', 42, 9, 7))
+		self.assertEqual(r.find_attribute("$FILE_NAME")[0].FileName, u'pippo.txt')
+
+	def test_index_entry(self):
+		key = file_name_key(u'voce', 5)
+		buf = array.array('c', struct.pack('<QHHHH', 16 | (1<<48), 16+len(key), len(key), 0, 0) + key)
+		e = Index_Entry(buf, 0)
+		self.assertEqual((e.u64mftReference & 0xFFFFFFFFFFFF, e.FileName, e.ucbFileName), (16, u'voce', 4))
+		# ultima voce a ridosso della fine del buffer: campi decodificati all'uso
+		e = Index_Entry(array.array('c', struct.pack('<QHHHH', 0, 16, 0, 2, 0)), 0)
+		self.assertEqual((e.wFlags, e.FileName), (2, ''))
+
+
+if __name__ == '__main__':
+	unittest.main()
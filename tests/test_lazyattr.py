@@ -0,0 +1,57 @@
+# -*- coding: mbcs -*-
+import array
+import struct
+import unittest
+from NTFStools.Attribute import *
+from NTFStools.Record import Record
+from tests.ntfsimage import *
+
+
+class Disk(object):
+	"Disco in memoria, con i metodi usati da DatarunStream"
+	clustersize = CLUSTER
+
+	def __init__ (self):
+		self.data = ''.join([chr(i % 251) for i in range(64*CLUSTER)])
+
+	def read_at(self, offset, size):
+		return array.array('c', self.data[offset:offset+size])
+
+	def read_extents(self, extents):
+		return [buffer(self.data, offset, size) for offset, size in extents]
+
+
+class LazyAttributeTest(unittest.TestCase):
+	def record(self, attrs):
+		return Record(None, Disk(), array.array('c', record(attrs, 30)), 30*1024)
+
+	def test_lazy(self):
+		r = self.record([standard_information(), file_name(u'x'), resident(0x100, 'utente'),
+		nonresident(0x80, [(10, 2), (None, 1), (20, 1)], 4*CLUSTER - 10), resident(0x80, 'ads', u'nome')])
+		self.assertEqual([t for t, offset in r._table], [0x10, 0x30, 0x100, 0x80, 0x80])
+		self.assertEqual(r._attributes, {}) # nessun attributo costruito
+		self.assertEqual(r.find_attribute("$FILE_NAME")[0].FileName, u'x')
+		self.assertEqual(sorted(r._attributes), [0x30])
+		self.assertEqual(r.find_attribute("$INDEX_ROOT"), None)
+		self.assertEqual(r.find_attribute(0x100)[0].__class__, Attribute)
+		data, ads = r.find_attribute("$DATA")
+		self.assertTrue(isinstance(data, Data))
+		self.assertFalse('file' in data.__dict__ or 'dataruns' in data.__dict__)
+		self.assertEqual(len(data.dataruns), 3)
+		self.assertFalse('file' in data.__dict__)
+		d = r._disk.data
+		expected = d[10*CLUSTER:12*CLUSTER] + '\x00'*CLUSTER + d[20*CLUSTER:21*CLUSTER-10]
+		self.assertEqual(data.file.read().tostring(), expected)
+		self.assertTrue(data.file is data.file) # creato una volta sola
+		self.assertEqual(ads.file.read(), 'ads')
+
+	def test_zero_length(self):
+		"Un attributo di lunghezza nulla chiude la tabella, anzich ripetersi all'infinito"
+		bad = struct.pack('<II', 0x80, 0) + '\x00'*16
+		r = self.record([standard_information(), bad, file_name(u'x')])
+		self.assertEqual([t for t, offset in r._table], [0x10, 0x80])
+		self.assertEqual(r.find_attribute("$FILE_NAME"), None)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: mbcs -*-
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from NTFStools.DatarunStream import RunList
+from NTFStools.DiskFile import opendisk
+from NTFStools.LZNT1 import *
+from NTFStools.Utilities import *
+from tests.ntfsimage import *
+
+UNIT = 16*CLUSTER # unit di compressione (wCompressionSize 4)
+
+
+def text(size, seed=3):
+	"Testo ripetitivo, e quindi comprimibile"
+	r = random.Random(seed)
+	words = ['alpha ', 'beta ', 'gamma ', 'delta\n', 'x'*50, 'log line 12345 ']
+	return ''.join([r.choice(words) for i in range(size/4)])[:size]
+
+
+class LZNT1Test(unittest.TestCase):
+	def test_decompress(self):
+		for s in (text(5000), 'a'*4096 + 'b'*100, os.urandom(6000), text(UNIT)):
+			z = lznt1_compress(s)
+			self.assertEqual(lznt1_decompress(z)[:len(s)], s)
+			self.assertEqual(lznt1_decompress(z, UNIT), s + '\x00'*(UNIT - len(s)))
+		self.assertTrue(len(lznt1_compress(text(UNIT))) < UNIT/2)
+
+	def test_corrupt(self):
+		self.assertRaises(IOError, lznt1_decompress, '\x05\xB0\x01\xFF\xFF\x00\x00')
+
+
+class CompressedStreamTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		name = os.path.join(self.dir, 'ntfs.img')
+		img = Image(clusters=1024)
+		img.mkdir(5, u'.', 5, [])
+		# unit compresse, una non compressa (dati casuali), una sparsa e un'ultima parziale
+		units = [text(UNIT, 1), os.urandom(UNIT), text(UNIT, 2), '\x00'*UNIT, text(UNIT/2 + 10, 4)]
+		self.content = ''.join(units)
+		runs = []
+		for unit in units:
+			if not unit.strip('\x00'):
+				runs += [(None, 16)]
+				continue
+			z = lznt1_compress(unit)
+			if len(z) > UNIT - CLUSTER:
+				runs += [(img.write(unit + '\x00'*(-len(unit) % UNIT)), 16)]
+			else:
+				n = (len(z) + CLUSTER - 1) / CLUSTER
+				runs += [(img.write(z), n), (None, 16 - n)]
+		img.add(20, [standard_information(), file_name(u'app.log'), nonresident(0x80, runs, len(self.content), cu=4, flags=1)])
+		img.build(name)
+		self.disk = opendisk(name)
+		self.mft = ntfs_open_mft(self.disk)
+
+	def tearDown(self):
+		self.disk.close()
+		shutil.rmtree(self.dir)
+
+	def test_read(self):
+		f = self.mft.next(20).find_attribute("$DATA")[0].file
+		self.assertTrue(isinstance(f, CompressedStream))
+		self.assertEqual(f.unitsize, UNIT)
+		self.assertEqual(f.read().tostring(), self.content)
+		for pos, size in ((3*UNIT - 10, 20), (UNIT - 1, UNIT + 2), (len(self.content) - 5, 100)):
+			f.seek(pos)
+			self.assertEqual(f.read(size).tostring(), self.content[pos:pos+size])
+		self.assertEqual(f.extent_map(), [(0, 3*UNIT, True), (3*UNIT, UNIT, False), (4*UNIT, len(self.content) - 4*UNIT, True)])
+
+	def test_copy(self):
+		out = os.path.join(self.dir, 'app.log')
+		ntfs_copy_file(self.mft.next(20), out)
+		self.assertEqual(open(out, 'rb').read(), self.content)
+
+	def test_short_unit(self):
+		"Un'unit pi corta del dovuto (run troncati)  completata con zeri"
+		runs = RunList(CLUSTER)
+		runs.append(2*CLUSTER, 0) # unit non compressa, ma di soli 2 cluster
+		f = CompressedStream(runs, UNIT + 10, self.disk, UNIT)
+		s = f.read().tostring()
+		self.assertEqual(len(s), UNIT + 10)
+		self.assertEqual(s[2*CLUSTER:], '\x00'*(UNIT + 10 - 2*CLUSTER))
+		f.seek(3*CLUSTER)
+		self.assertEqual(f.read(10).tostring(), '\x00'*10)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,58 @@
+# -*- coding: mbcs -*-
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from NTFStools.DiskFile import *
+
+
+class MappedDiskFileTest(unittest.TestCase):
+	"MappedDiskFile legge come DiskFile, ma dalla mappa dell'immagine"
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.name = os.path.join(self.dir, 'disk.img')
+		self.raw = os.urandom(1<<20) + 'coda'
+		open(self.name, 'wb').write(self.raw)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def test_opendisk(self):
+		disk = opendisk(self.name)
+		self.assertTrue(isinstance(disk, MappedDiskFile))
+		self.assertEqual(disk.size, len(self.raw))
+		disk.close()
+
+	def test_read(self):
+		r = random.Random(1)
+		mapped = MappedDiskFile(self.name)
+		plain = DiskFile(self.name)
+		for i in range(300):
+			offset = r.randrange(len(self.raw) + 100)
+			size = r.choice([1, 32, 512, 1024, 5000, 100000])
+			mapped.seek(offset)
+			a = mapped.read(size)
+			self.assertEqual(a.tostring(), self.raw[offset:offset+size])
+			if offset + size > 1<<20:
+				continue # DiskFile non legge un blocco finale incompleto
+			plain.seek(offset)
+			self.assertEqual(a.tostring(), plain.read(size).tostring())
+			self.assertEqual(mapped.tell(), plain.tell())
+		mapped.close()
+
+	def test_view(self):
+		disk = MappedDiskFile(self.name)
+		disk.seek(1000)
+		v = disk.view(24)
+		self.assertTrue(isinstance(v, buffer))
+		self.assertEqual(str(v), self.raw[1000:1024])
+		self.assertEqual(disk.tell(), 1024)
+		disk.seek(4, 2) # dalla fine
+		self.assertEqual(str(disk.view()), 'coda')
+		self.assertEqual(disk.read().tostring(), '')
+		disk.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
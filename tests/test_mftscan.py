@@ -0,0 +1,33 @@
+# -*- coding: mbcs -*-
+import os
+import shutil
+import tempfile
+import unittest
+from NTFStools.MFTScan import *
+from tests.ntfsimage import *
+
+
+class MFTScanTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.name = os.path.join(self.dir, 'ntfs.img')
+		img = Image()
+		img.mkdir(5, u'.', 5, [])
+		for n in range(16, 60, 3):
+			img.mkfile(n, u'file%d.txt' % n, 5, 'x' * n, n % 2)
+		img.build(self.name)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def test_scan(self):
+		serial = list(mft_scan(self.name, 1))
+		self.assertEqual([s.recno for s in serial], [0, 5, 10] + range(16, 60, 3))
+		s = serial[-1]
+		self.assertEqual((s.name, s.parent, s.size, s.resident, s.mtime), (u'file58.txt', 5, 58, False, NT_TIME+2))
+		self.assertEqual(serial[-2].resident, True)
+		self.assertEqual(list(mft_scan(self.name, 3, shards=7, chunksize=4096)), serial)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,63 @@
+# -*- coding: mbcs -*-
+import os
+import shutil
+import tempfile
+import unittest
+from NTFStools import BulkMFT
+from NTFStools.DiskFile import opendisk
+from NTFStools.PathTable import *
+from NTFStools.Utilities import ntfs_open_mft
+from tests.ntfsimage import *
+
+
+class PathTableTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		name = os.path.join(self.dir, 'ntfs.img')
+		img = Image()
+		si = standard_information()
+		img.add(5, [si, file_name(u'.', 5, 3)], flags=3)
+		img.add(6, [si, file_name(u'WINDOW~1', 5, 2), file_name(u'Windows', 5, 1)], flags=3)
+		img.add(7, [si, file_name(u'System32', 6, 3)], flags=3)
+		img.add(8, [si, file_name(u'x.dll', 7, 3)])
+		img.add(9, [si, file_name(u'orphan.txt', 30, 3)]) # genitore libero
+		img.add(11, [si, file_name(u'a', 12, 3)], flags=3) # ciclo 11 <-> 12
+		img.add(12, [si, file_name(u'b', 11, 3)], flags=3)
+		img.add(13, [si, file_name(u'reused.txt', 14, 3)]) # genitore riutilizzato (sequenza 2)
+		img.add(14, [si, file_name(u'newdir', 5, 3)], flags=3, seq=2)
+		img.add(15, [si, file_name(u'posix', 7, 0)])
+		# directory con il nome nel record di estensione, e sequenza diversa da questo
+		img.add(20, [si, attribute_list([(0x10, 20), (0x30, 21)])], flags=3, seq=3)
+		img.add(21, [file_name(u'ext', 5, 3)], flags=3, base=20)
+		img.add(22, [si, file_name(u'child.txt', 20 | (3<<48), 3)])
+		img.build(name)
+		self.disk = opendisk(name)
+		self.mft = ntfs_open_mft(self.disk)
+		self.expected = [(0, u'\\$MFT'), (5, u'\\'), (6, u'\\Windows'), (7, u'\\Windows\\System32'),
+		(8, u'\\Windows\\System32\\x.dll'), (9, ORPHANS + u'\\orphan.txt'), (10, u'\\$UpCase'),
+		(11, ORPHANS + u'\\b\\a'), (12, ORPHANS + u'\\b'), (13, ORPHANS + u'\\reused.txt'), (14, u'\\newdir'),
+		(15, u'\\Windows\\System32\\posix'), (20, u'\\ext'), (22, u'\\ext\\child.txt')]
+
+	def tearDown(self):
+		self.disk.close()
+		shutil.rmtree(self.dir)
+
+	def test_python(self):
+		numpy = BulkMFT.numpy
+		BulkMFT.numpy = None
+		try:
+			table = ntfs_path_table(self.mft)
+		finally:
+			BulkMFT.numpy = numpy
+		self.assertEqual(list(table), self.expected)
+		self.assertEqual(table.parent(8), 7)
+		self.assertEqual(table.path(99), None)
+		self.assertFalse(21 in table)
+
+	@unittest.skipIf(BulkMFT.numpy is None, "numpy non disponibile")
+	def test_numpy(self):
+		self.assertEqual(list(ntfs_path_table(self.mft, chunksize=8192)), self.expected)
+
+
+if __name__ == '__main__':
+	unittest.main()
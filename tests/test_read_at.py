@@ -0,0 +1,80 @@
+# -*- coding: mbcs -*-
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from NTFStools.DiskFile import *
+
+diskfile = sys.modules[DiskFile.__module__]
+
+
+class ReadAtTest(unittest.TestCase):
+	"read_at da pi thread su un solo DiskFile"
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.name = os.path.join(self.dir, 'disk.img')
+		self.raw = os.urandom(2<<20)
+		open(self.name, 'wb').write(self.raw)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def threads(self, disk):
+		errors = []
+		def worker(seed):
+			r = random.Random(seed)
+			for i in range(500):
+				offset = r.randrange(len(self.raw))
+				size = r.choice([1, 32, 1024, 9000, 70000])
+				if disk.read_at(offset, size).tostring() != self.raw[offset:offset+size]:
+					errors.append((offset, size))
+		threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+		for t in threads: t.start()
+		for t in threads: t.join()
+		return errors
+
+	def test_threads(self):
+		for cls in (DiskFile, MappedDiskFile):
+			disk = cls(self.name)
+			self.assertEqual(self.threads(disk), [], cls.__name__)
+
+	def test_without_pread(self):
+		"Senza pread, seek e read sono serializzate dal lock"
+		saved = diskfile.pread
+		diskfile.pread = None
+		try:
+			disk = DiskFile(self.name)
+			self.assertEqual(self.threads(disk), [])
+		finally:
+			diskfile.pread = saved
+
+	def test_short_pread(self):
+		"Le letture posizionali parziali sono ripetute fino alla quantit richiesta"
+		saved = diskfile.pread
+		if not saved:
+			self.skipTest("pread non disponibile")
+		diskfile.pread = lambda fd, size, offset: saved(fd, min(size, 1000), offset)
+		try:
+			disk = DiskFile(self.name, readahead=0)
+			self.assertEqual(disk.read_at(5, 300000).tostring(), self.raw[5:300005])
+		finally:
+			diskfile.pread = saved
+
+	def test_cursor(self):
+		disk = DiskFile(self.name)
+		disk.seek(100)
+		self.assertEqual(disk.read_at(5000, 10).tostring(), self.raw[5000:5010])
+		self.assertEqual(disk.tell(), 100)
+		other = disk.dup()
+		other.seek(7)
+		self.assertEqual(other.read(3).tostring(), self.raw[7:10])
+		self.assertEqual(disk.read(3).tostring(), self.raw[100:103])
+		self.assertTrue(other.cache is disk.cache)
+		self.assertTrue(disk.dup(cache='arc').cache is not disk.cache)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,48 @@
+# -*- coding: mbcs -*-
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from NTFStools.DiskFile import *
+
+
+class CountingDiskFile(DiskFile):
+	"Conta le letture posizionali"
+	def _pread(self, offset, size):
+		self.reads = getattr(self, 'reads', 0) + 1
+		return DiskFile._pread(self, offset, size)
+
+
+class ReadExtentsTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.name = os.path.join(self.dir, 'disk.img')
+		self.raw = os.urandom(2<<20)
+		open(self.name, 'wb').write(self.raw)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def test_order(self):
+		r = random.Random(3)
+		extents = [(r.randrange(len(self.raw) - 5000), r.randrange(1, 5000)) for i in range(50)]
+		for cls in (DiskFile, MappedDiskFile):
+			disk = cls(self.name)
+			views = disk.read_extents(extents)
+			self.assertEqual([str(v) for v in views], [self.raw[o:o+n] for o, n in extents], cls.__name__)
+
+	def test_coalescing(self):
+		disk = CountingDiskFile(self.name)
+		# tre estensioni vicine (in disordine) e una lontana: due letture
+		extents = [(10000, 100), (0, 4096), (1<<20, 10), (4096+30000, 500)]
+		views = disk.read_extents(extents)
+		self.assertEqual([str(v) for v in views], [self.raw[o:o+n] for o, n in extents])
+		self.assertEqual(disk.reads, 2)
+		disk.reads = 0
+		disk.read_extents(extents, gap=0)
+		self.assertEqual(disk.reads, 4)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,56 @@
+# -*- coding: mbcs -*-
+import os
+import shutil
+import tempfile
+import unittest
+from NTFStools.DiskFile import DiskFile
+
+
+class CountingDiskFile(DiskFile):
+	"Conta le letture fisiche di blocchi"
+	def _readblocks(self, si, count):
+		self.reads = getattr(self, 'reads', 0) + 1
+		return DiskFile._readblocks(self, si, count)
+
+
+class ReadaheadTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.name = os.path.join(self.dir, 'disk.img')
+		self.raw = os.urandom(4<<20)
+		open(self.name, 'wb').write(self.raw)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def scan(self, step, size, **kw):
+		disk = CountingDiskFile(self.name, **kw)
+		for pos in range(0, len(self.raw), step):
+			disk.seek(pos)
+			self.assertEqual(disk.read(size).tostring(), self.raw[pos:pos+size])
+		return disk
+
+	def test_sequential(self):
+		disk = self.scan(32, 32)
+		self.assertEqual(disk.window, disk.readahead)
+		self.assertTrue(disk.reads < 16, disk.reads)
+		self.assertTrue(self.scan(32, 32, readahead=0).reads >= 1024)
+
+	def test_strided(self):
+		disk = self.scan(8192, 1024)
+		self.assertTrue(disk.reads < 16, disk.reads)
+
+	def test_random(self):
+		disk = CountingDiskFile(self.name)
+		for pos in (0, 32, 64, 96): # la finestra cresce...
+			disk.seek(pos)
+			disk.read(32)
+		self.assertTrue(disk.window > 0)
+		for pos in (3<<20, 1<<20, 2<<20, 100000, 3000000, 12345): # ...e si riduce
+			disk.seek(pos)
+			self.assertEqual(disk.read(16).tostring(), self.raw[pos:pos+16])
+		self.assertEqual(disk.window, 0)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,72 @@
+# -*- coding: mbcs -*-
+import array
+import datetime
+import unittest
+from NTFStools.Commons import nt2uxtime
+from NTFStools.DatarunStream import *
+from NTFStools.Record import Record
+from tests.ntfsimage import *
+
+
+class Disk(object):
+	"Disco in memoria, con cluster di 1 KiB"
+	clustersize = 1024
+
+	def __init__ (self):
+		self.data = ''.join([chr(i % 251) for i in range(1<<20)])
+
+	def read_at(self, offset, size):
+		return array.array('c', self.data[offset:offset+size])
+
+	def read_extents(self, extents):
+		return [buffer(self.data, offset, size) for offset, size in extents]
+
+
+class RunListTest(unittest.TestCase):
+	def setUp(self):
+		self.runs = RunList(1024)
+		for length, offset in ((2048, 100<<10), (3072, None), (1024, 50<<10), (1024, 51<<10), (2048, 300<<10)):
+			self.runs.append(length, offset)
+
+	def test_locate(self):
+		self.assertEqual((len(self.runs), self.runs.size), (5, 9216))
+		self.assertEqual([self.runs.locate(p) for p in (0, 2047, 2048, 5120, 9215, 9216)], [0, 0, 1, 2, 4, -1])
+
+	def test_extents(self):
+		self.assertEqual(self.runs.extents(1500, 6000), [((100<<10) + 1500, 548), (None, 3072), (50<<10, 2048), (300<<10, 332)])
+		self.assertEqual(self.runs.extents(9000, 1000), [((300<<10) + 1832, 216)])
+		self.assertEqual(self.runs.extents(9216, 10), [])
+
+	def test_stream(self):
+		disk = Disk()
+		d = disk.data
+		expected = d[100<<10:(100<<10) + 2048] + '\x00'*3072 + d[50<<10:52<<10] + d[300<<10:(300<<10) + 2048]
+		f = DatarunStream(self.runs, 9216 - 10, disk)
+		self.assertEqual(f.read().tostring(), expected[:-10])
+		self.assertEqual(f.read().tostring(), '')
+		f.seek(2000)
+		self.assertEqual(f.read(100).tostring(), expected[2000:2100])
+		f.seek(-10, 1)
+		self.assertEqual(f.tell(), 2090)
+		f.seek(20, 2)
+		self.assertEqual(f.read().tostring(), expected[-30:-10])
+		g = f.dup()
+		self.assertEqual((g.tell(), g.read(5).tostring()), (0, expected[:5]))
+
+	def test_decode(self):
+		"Datarun con offset negativo e run sparso, secondo il cluster del disco"
+		disk = Disk()
+		r = Record(None, disk, array.array('c', record([standard_information(), file_name(u'x'),
+		nonresident(0x80, [(100, 2), (None, 3), (50, 1), (300, 2)], 8*1024 - 10)], 30)), 30*1024)
+		runs = r.find_attribute("$DATA")[0].dataruns
+		self.assertEqual(list(runs), [(0, 2048, 100<<10), (2048, 3072, None), (5120, 1024, 50<<10), (6144, 2048, 300<<10)])
+
+
+class TimeTest(unittest.TestCase):
+	def test_nt2uxtime(self):
+		self.assertEqual(nt2uxtime(116444736000000000), datetime.datetime(1970, 1, 1))
+		self.assertEqual(nt2uxtime(NT_TIME), datetime.datetime(2016, 2, 15, 8, 53, 20))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,63 @@
+# -*- coding: mbcs -*-
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+from NTFStools.DiskFile import opendisk
+from NTFStools.SegmentedImage import *
+
+segmented = sys.modules[SegmentedDiskFile.__module__]
+
+
+class SegmentedDiskFileTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.raw = os.urandom(3000000)
+		self.first = os.path.join(self.dir, 'disk.001')
+		pos = 0
+		for i, size in enumerate((1000000, 4096, 1, 995903, 1000000)): # anche segmenti minuscoli
+			open(os.path.join(self.dir, 'disk.%03d' % (i+1)), 'wb').write(self.raw[pos:pos+size])
+			pos += size
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def check(self, disk):
+		self.assertEqual(disk.size, len(self.raw))
+		r = random.Random(4)
+		for i in range(200):
+			offset = r.randrange(len(self.raw))
+			size = r.choice([1, 100, 5000, 1<<20, 2500000])
+			self.assertEqual(disk.read_at(offset, size).tostring(), self.raw[offset:offset+size])
+
+	def test_segments(self):
+		self.assertEqual(len(find_segments(self.first)), 5)
+		self.assertEqual(find_segments(os.path.join(self.dir, 'other.img')), [os.path.join(self.dir, 'other.img')])
+		disk = opendisk(self.first)
+		self.assertTrue(isinstance(disk, SegmentedDiskFile))
+		self.check(disk)
+		disk.close()
+
+	def test_parallel(self):
+		disk = SegmentedDiskFile(self.first, parallel=1)
+		self.check(disk)
+		disk.close()
+
+	def test_short_pread(self):
+		"Una pread parziale (es. su una condivisione di rete)  ripetuta fino in fondo"
+		saved = segmented.pread
+		if not saved:
+			self.skipTest("pread non disponibile")
+		segmented.pread = lambda fd, size, offset: saved(fd, min(size, 777), offset)
+		try:
+			disk = SegmentedDiskFile(self.first)
+			self.check(disk)
+			disk.close()
+		finally:
+			segmented.pread = saved
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,64 @@
+# -*- coding: mbcs -*-
+import os
+import shutil
+import tempfile
+import unittest
+from NTFStools.DiskFile import opendisk
+from NTFStools.Utilities import *
+from tests.ntfsimage import *
+
+HUGE = 1 << 36 # 64 GiB, quasi tutti sparsi
+
+
+class SparseTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		name = os.path.join(self.dir, 'ntfs.img')
+		img = Image()
+		img.mkdir(5, u'.', 5, [])
+		a = img.write('HEAD'*1024)
+		b = img.write('TAIL'*1024)
+		img.add(20, [standard_information(), file_name(u'vm.vhd'),
+		nonresident(0x80, [(a, 1), (None, HUGE/CLUSTER - 2), (b, 1)], HUGE)])
+		img.add(21, [standard_information(), file_name(u'tailhole'), nonresident(0x80, [(a, 1), (None, 100)], 101*CLUSTER - 7)])
+		img.build(name)
+		self.disk = opendisk(name)
+		self.disk.enable_stats()
+		self.mft = ntfs_open_mft(self.disk)
+
+	def tearDown(self):
+		self.disk.close()
+		shutil.rmtree(self.dir)
+
+	def test_extent_map(self):
+		f = self.mft.next(20).find_attribute("$DATA")[0].file
+		self.assertEqual(f.extent_map(), [(0, CLUSTER, True), (CLUSTER, HUGE - 2*CLUSTER, False), (HUGE - CLUSTER, CLUSTER, True)])
+		f.seek(CLUSTER - 6)
+		self.assertEqual(f.read(12).tostring(), 'ADHEAD' + '\x00'*6)
+
+	def test_copy(self):
+		out = os.path.join(self.dir, 'vm.out')
+		ntfs_copy_file(self.mft.next(20), out)
+		st = os.stat(out)
+		self.assertEqual(st.st_size, HUGE)
+		self.assertTrue(st.st_blocks*512 < 1<<20) # la copia  a sua volta sparsa
+		f = open(out, 'rb')
+		self.assertEqual(f.read(4), 'HEAD')
+		f.seek(5000)
+		self.assertEqual(f.read(4), '\x00'*4)
+		f.seek(-4, 2)
+		self.assertEqual(f.read(4), 'TAIL')
+		f.close()
+		# i tratti sparsi non sono letti dal disco
+		self.assertTrue(self.disk.stats.export()['tags']['data']['bytes_read'] <= 2*CLUSTER)
+
+	def test_tail_hole(self):
+		"Un file che termina con un tratto sparso ha comunque la sua dimensione"
+		out = os.path.join(self.dir, 'tailhole')
+		ntfs_copy_file(self.mft.next(21), out)
+		s = open(out, 'rb').read()
+		self.assertEqual((len(s), s[:4], s[CLUSTER:].strip('\x00')), (101*CLUSTER - 7, 'HEAD', ''))
+
+
+if __name__ == '__main__':
+	unittest.main()